@@ -0,0 +1,405 @@
+"""Benchmarks of the simulation pipeline
+
+The suites follow the asv conventions (classes with params, setup and
+time_/track_ methods) so they can be run with ``asv run``. They can also be
+run offline without asv::
+
+    python benchmarks/benchmarks.py --sizes 10 1000 100000
+
+which prints the time of each benchmark and the throughput per point.
+"""
+import argparse
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simtools.Calculation import Calculation  # noqa: E402
+from simtools.ParameterGroup import ParameterGroup, Parameter  # noqa: E402
+from simtools.Simulation import Simulation  # noqa: E402
+from simtools.ResultStore import ResultStore  # noqa: E402
+from simtools.StoragePolicy import StoragePolicy  # noqa: E402
+from simtools.Executor import JoblibExecutor  # noqa: E402
+from simtools.Progress import Progress  # noqa: E402
+
+SIZES = [10, 1000, 100000, 1000000]
+LAYOUTS = ['group', 'columnar']
+
+
+def _params(n):
+    """parameter group with an outer expansion of n points"""
+    return ParameterGroup([
+        Parameter('a', 0., 'linspace', (0, 1, n)),
+        Parameter('b', 1, 'list', ([1],))
+    ])
+
+
+def _scalar(a, b):
+    return {'x': a * b}
+
+
+def _array(a, b):
+    return {'x': a * b, 'y': np.full(16, a)}
+
+
+def _large(a, b):
+    return {'x': a * b, 'y': np.full(2 ** 17, a)}
+
+
+def _lookup(a, b, grid):
+    return {'x': a * b + grid[0]}
+
+
+def _skewed(a, b):
+    time.sleep(1e-3 * b)
+    return {'x': a * b}
+
+
+def _downstream(x, y):
+    return {'z': x + y[0]}
+
+
+class _FileSuite(object):
+    """suite writing to a temporary results file"""
+
+    def setup(self, *args):
+        self._dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self._dir, 'bench.h5')
+
+    def teardown(self, *args):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class ExpansionSuite(object):
+    """cost of expanding ParameterGroup"""
+    params = [SIZES]
+    param_names = ['n']
+
+    def setup(self, n):
+        self.group = _params(n)
+
+    def time_expand(self, n):
+        len(self.group.expand('outer'))
+
+    def time_iterate(self, n):
+        for _ in self.group.expand('outer'):
+            pass
+
+    def time_columns(self, n):
+        self.group.expand('outer').columns()
+
+
+class CalculationSuite(_FileSuite):
+    """throughput of Calculation.run serial and parallel"""
+    params = [SIZES, [False, True]]
+    param_names = ['n', 'parallel']
+    timeout = 600
+
+    def time_run(self, n, parallel):
+        calc = Calculation(_scalar, self.filepath, 0, overwrite_file=True,
+                           layout='columnar')
+        calc.add_params(_params(n))
+        calc.run('outer', parallel=parallel, n_jobs=2)
+
+
+class ProgressSuite(_FileSuite):
+    """overhead of live progress on Calculation.run of a cheap function"""
+    params = [SIZES, [False, True]]
+    param_names = ['n', 'progress']
+    timeout = 600
+
+    def time_run(self, n, progress):
+        calc = Calculation(_scalar, self.filepath, 0, overwrite_file=True,
+                           layout='columnar')
+        calc.add_params(_params(n))
+        hooks = []
+        if progress:
+            hooks.append(Progress(status_file=self.filepath + '.status.json',
+                                  interval=.1))
+        calc.run('outer', hooks=hooks)
+
+
+class ChunkSuite(object):
+    """JoblibExecutor.map of a cheap function with one task per point
+    against tasks chunked by measured cost"""
+    params = [SIZES, [1, 'auto']]
+    param_names = ['n', 'chunk_size']
+    timeout = 600
+
+    def setup(self, n, chunk_size):
+        self.kwargs = list(_params(n).expand('outer'))
+        self.executor = JoblibExecutor(2, chunk_size=chunk_size, serial_cost=None)
+
+    def time_map(self, n, chunk_size):
+        for _ in self.executor.map(_scalar, self.kwargs):
+            pass
+
+
+class ScheduleSuite(object):
+    """JoblibExecutor.map of a sweep whose last 1% of points are 100 times
+    slower, in order or most expensive first by a learned cost"""
+    params = [[100, 1000], ['none', 'learn']]
+    param_names = ['n', 'cost']
+    timeout = 600
+
+    def setup(self, n, cost):
+        self.kwargs = [{'a': float(i), 'b': 100 if i >= .99 * n else 1}
+                       for i in range(n)]
+        self.executor = JoblibExecutor(2, cost=None if cost == 'none' else cost)
+        list(self.executor.map(_skewed, self.kwargs[:4]))
+
+    def time_map(self, n, cost):
+        for _ in self.executor.map(_skewed, self.kwargs):
+            pass
+
+
+class BackendSuite(_FileSuite):
+    """parallel Calculation.run funnelled through this process into hdf5
+    against workers writing their own results to a npy directory"""
+    params = [SIZES, ['hdf5', 'npyd', 'npyd-direct']]
+    param_names = ['n', 'backend']
+    timeout = 600
+
+    def time_run(self, n, backend):
+        filepath = self.filepath if backend == 'hdf5' else os.path.join(
+            self._dir, 'bench.npyd')
+        calc = Calculation(_array, filepath, 0, overwrite_file=True,
+                           layout='columnar')
+        calc.add_params(_params(n))
+        calc.run('outer', parallel=True, n_jobs=2,
+                 direct_write=backend == 'npyd-direct')
+
+
+class TransferSuite(_FileSuite):
+    """parallel Calculation.run with 1 MiB outputs pickled back to this
+    process or returned through shared memory"""
+    params = [SIZES, ['pickle', 'shared']]
+    param_names = ['n', 'transfer']
+    timeout = 600
+
+    def time_run(self, n, transfer):
+        executor = JoblibExecutor(
+            2, shared_memory=None if transfer == 'pickle' else 2 ** 16)
+        calc = Calculation(_large, self.filepath, 0, overwrite_file=True,
+                           layout='columnar', compression=None)
+        calc.add_params(_params(n))
+        calc.run('outer', executor=executor)
+
+
+class BroadcastSuite(_FileSuite):
+    """parallel Calculation.run of a function using an 8 MiB constant array,
+    bound with functools.partial and pickled with the tasks or broadcast
+    through shared memory, with joblib workers or a started pool"""
+    params = [SIZES, ['partial', 'broadcast'], [False, True]]
+    param_names = ['n', 'constant', 'pool']
+    timeout = 600
+
+    def setup(self, n, constant, pool):
+        super(BroadcastSuite, self).setup()
+        self.grid = np.arange(2 ** 20, dtype=float)
+        self.executor = JoblibExecutor(2, chunk_size=16)
+        if pool:
+            self.executor.start()
+
+    def teardown(self, *args):
+        self.executor.shutdown()
+        super(BroadcastSuite, self).teardown()
+
+    def time_run(self, n, constant, pool):
+        if constant == 'partial':
+            calc = Calculation(functools.partial(_lookup, grid=self.grid),
+                               self.filepath, 0, overwrite_file=True,
+                               layout='columnar')
+        else:
+            calc = Calculation(_lookup, self.filepath, 0, overwrite_file=True,
+                               layout='columnar', broadcast={'grid': self.grid})
+        calc.add_params(_params(n))
+        calc.run('outer', executor=self.executor)
+
+
+class WriteSuite(_FileSuite):
+    """throughput of Calculation._process_results per point and per byte"""
+    params = [SIZES, LAYOUTS]
+    param_names = ['n', 'layout']
+    timeout = 600
+
+    def setup(self, n, layout):
+        super(WriteSuite, self).setup()
+        self.points = _params(n).expand('outer')
+        self.results = [_array(**p) for p in self.points]
+
+    def time_process_results(self, n, layout):
+        calc = Calculation(_array, self.filepath, 0, overwrite_file=True,
+                           layout=layout)
+        calc._process_results(self.points, self.results)
+
+    def track_bytes_per_point(self, n, layout):
+        self.time_process_results(n, layout)
+        return os.path.getsize(self.filepath) / n
+    track_bytes_per_point.unit = 'bytes'
+
+
+class PipelineSuite(_FileSuite):
+    """cost of resolving upstream results in a two stage Simulation
+    from the file or from results kept in memory"""
+    params = [SIZES, LAYOUTS, [False, True]]
+    param_names = ['n', 'layout', 'in_memory']
+    timeout = 600
+
+    def setup(self, n, layout, in_memory):
+        super(PipelineSuite, self).setup()
+        self.sim = Simulation(self.filepath, [_array, _downstream], _params(n),
+                              layout=layout,
+                              memory_budget=2 ** 32 if in_memory else None)
+        self.sim._calculations[0].add_params(_params(n))
+        self.sim._calculations[0].run('outer')
+        self.points = list(_params(n).expand('outer'))
+
+    def time_upstream_lookup(self, n, layout, in_memory):
+        with self.sim._upstream[0] as reader:
+            for p in self.points:
+                reader.fetch(p)
+
+
+class ReadSuite(_FileSuite):
+    """speed of Simulation._retrieve_result_dataframe"""
+    params = [SIZES, LAYOUTS]
+    param_names = ['n', 'layout']
+    timeout = 600
+
+    def setup(self, n, layout):
+        super(ReadSuite, self).setup()
+        self.sim = Simulation(self.filepath, [_scalar], _params(n),
+                              layout=layout)
+        self.sim.run('outer')
+
+    def time_retrieve_dataframe(self, n, layout):
+        self.sim._retrieve_result_dataframe(0)
+
+
+_POLICIES = {
+    'none': None,
+    'auto': 'auto',
+    'gzip4': StoragePolicy(compression='gzip', level=4),
+    'lzf': StoragePolicy(compression='lzf'),
+    'float32': StoragePolicy(dtype='float32')
+}
+
+
+def _output(kind, a):
+    """typical array outputs, smooth curves, noisy signals and counts"""
+    x = np.linspace(0, 10, 16384)
+    if kind == 'smooth':
+        return {'y': np.sin(a * x)}
+    if kind == 'noise':
+        return {'y': np.random.RandomState(int(a * 1000)).normal(size=x.size)}
+    return {'y': np.random.RandomState(int(a * 1000)).poisson(3, size=x.size)}
+
+
+class StorageSuite(_FileSuite):
+    """write time and file size of array outputs for storage policies"""
+    params = [[100], ['smooth', 'noise', 'counts'], list(_POLICIES.keys()),
+              LAYOUTS]
+    param_names = ['n', 'output', 'policy', 'layout']
+    timeout = 600
+
+    def setup(self, n, output, policy, layout):
+        super(StorageSuite, self).setup()
+        self.points = _params(n).expand('outer')
+        self.results = [_output(output, p['a']) for p in self.points]
+
+    def time_write(self, n, output, policy, layout):
+        calc = Calculation(_array, self.filepath, 0, overwrite_file=True,
+                           layout=layout, compression=_POLICIES[policy])
+        calc._process_results(self.points, self.results)
+
+    def track_bytes_per_point(self, n, output, policy, layout):
+        self.time_write(n, output, policy, layout)
+        return os.path.getsize(self.filepath) / n
+    track_bytes_per_point.unit = 'bytes'
+
+
+class QuerySuite(_FileSuite):
+    """speed of selecting a slice of the results with ResultStore"""
+    params = [SIZES, LAYOUTS]
+    param_names = ['n', 'layout']
+    timeout = 600
+
+    def setup(self, n, layout):
+        super(QuerySuite, self).setup()
+        points = _params(n).expand('outer')
+        calc = Calculation(_array, self.filepath, 0, layout=layout)
+        calc._process_results(points, [_array(**p) for p in points])
+        self.store = ResultStore(self.filepath).open()
+        self.store.parameters(0)
+
+    def teardown(self, n, layout):
+        self.store.close()
+        super(QuerySuite, self).teardown()
+
+    def time_select(self, n, layout):
+        self.store.select(0, a=(.25, .5))
+
+    def time_dataframe(self, n, layout):
+        self.store.dataframe(0, columns=['x'], a=(.25, .26))
+
+
+SUITES = [ExpansionSuite, CalculationSuite, ProgressSuite, ChunkSuite,
+          ScheduleSuite, BackendSuite, TransferSuite, BroadcastSuite,
+          WriteSuite, PipelineSuite, ReadSuite, StorageSuite, QuerySuite]
+
+
+def _grid(suite, sizes):
+    """parameter combinations of suite with its sizes replaced"""
+    grid = [[]]
+    for values in suite.params:
+        values = sizes if values is SIZES else values
+        grid = [g + [v] for g in grid for v in values]
+    return grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000],
+                        help='sweep sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repetitions, the best time is reported')
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    args = parser.parse_args(argv)
+    fmt = '{:<45} {:<20} {:>12} {:>14}'
+    print(fmt.format('benchmark', 'params', 'value', 'per point'))
+    for suite in SUITES:
+        names = [m for m in dir(suite) if m.startswith(('time_', 'track_'))]
+        for method in names:
+            full_name = '{}.{}'.format(suite.__name__, method)
+            if args.filter not in full_name:
+                continue
+            for combo in _grid(suite, args.sizes):
+                bench = suite()
+                bench.setup(*combo)
+                try:
+                    func = getattr(bench, method)
+                    if method.startswith('time_'):
+                        value = min(timeit.repeat(lambda: func(*combo),
+                                                  number=1, repeat=args.repeat))
+                        shown = '{:.4g} s'.format(value)
+                    else:
+                        value = func(*combo)
+                        shown = '{:.4g} {}'.format(value, func.unit)
+                finally:
+                    if hasattr(bench, 'teardown'):
+                        bench.teardown(*combo)
+                per_point = value / combo[0] if method.startswith('time_') else value
+                print(fmt.format(full_name, str(combo), shown,
+                                 '{:.4g}'.format(per_point)))
+
+
+if __name__ == '__main__':
+    main()
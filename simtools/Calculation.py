@@ -1,22 +1,150 @@
 import inspect
-import h5py
 import os
+import time
+import uuid
 import numpy as np
 import pandas as pd
-from .ParameterGroup import ParameterGroup
-try:
-    from joblib import Parallel, delayed
-    _PARALLEL = True
-except:
-    _PARALLEL = False
+from .ParameterGroup import ParameterGroup, Expansion
+from .Sampling import AdaptiveSampler
+from .Layout import LAYOUTS, open_layout, CHUNK_CACHE_BYTES
+from .Storage import open_file, supports_concurrent_writes, NPY_SUFFIX
+from .Stats import StageStats, Timed, STATS_ATTR
+from .Executor import SerialExecutor, JoblibExecutor, _PARALLEL
+from .SharedMemory import SharedOutputs, receive
+from .WorkerContext import WorkerContext
+from .Scheduler import TimedOut, in_order
 
 # TODO Move hdf5 file preparation into simulation not calculation
 
 
+def _batches(iterable, size):
+    """split iterable into lists of at most size elements, None for one list"""
+    batch = []
+    for i in iterable:
+        batch.append(i)
+        if size is not None and len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _call_batch(func, batch):
+    """call a vectorized function on a batch of keyword arguments
+
+    Parameters
+    ----------
+    func : function
+        function taking arrays of every argument and returning a dictionary
+        of arrays whose first axis runs over the batch
+    batch : list
+        list of dictionaries of keyword arguments
+
+    Returns
+    -------
+    results : list
+        dictionary result of each element of the batch
+    """
+    stacked = {k: np.array([kwargs[k] for kwargs in batch]) for k in batch[0]}
+    result = {k: np.asarray(v) for k, v in func(**stacked).items()}
+    for k, v in result.items():
+        if v.ndim == 0 or len(v) != len(batch):
+            raise ValueError('Vectorized output {} has shape {} but batch has '
+                             'length {}'.format(k, v.shape, len(batch)))
+    return [{k: v[i] for k, v in result.items()} for i in range(len(batch))]
+
+
+class _Kwargs(object):
+    """keyword arguments of the evaluations of selected parameter sets,
+    built when indexed so a Scheduler only holds those it has submitted
+
+    Parameters
+    ----------
+    calc : Calculation
+        calculation building the keyword arguments of parameters
+    params : list
+        parameter sets of the run
+    numbers : list
+        group numbers of the parameter sets which are evaluated
+    stats : StageStats
+        statistics recording the time to build the arguments
+    """
+
+    def __init__(self, calc, params, numbers, stats):
+        self._calc = calc
+        self._params = params
+        self._numbers = numbers
+        self._stats = stats
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __getitem__(self, i):
+        return next(self._calc._function_kwargs(
+            [self._params[self._numbers[i]]], self._stats))
+
+    def __iter__(self):
+        return self._calc._function_kwargs(
+            (self._params[i] for i in self._numbers), self._stats)
+
+
+class _DirectWrite(object):
+    """evaluate the function and write its result from the worker
+    for backends which allow several processes to write at the same time
+
+    Parameters
+    ----------
+    func : function
+        function of the calculation
+    filepath : str
+        filepath of the results
+    id_ : str
+        id of the calculation
+    layout : str
+        name of the layout of the calculation
+    compression : str
+        compression of the outputs, see Calculation
+    n : int
+        number of parameter sets of the run
+    """
+
+    def __init__(self, func, filepath, id_, layout, compression, n):
+        self._func = func
+        self._filepath = filepath
+        self._id = id_
+        self._layout = layout
+        self._compression = compression
+        self._n = n
+        self._open = None
+
+    def __getstate__(self):
+        # the open layout stays in the process which opened it
+        state = dict(self.__dict__)
+        state['_open'] = None
+        return state
+
+    def __call__(self, number, params, kwargs):
+        start = time.perf_counter()
+        result = self._func(**kwargs)
+        compute_time = time.perf_counter() - start
+        if self._open is None:
+            # concurrent backends need no closing so the layout is kept
+            # for the following evaluations in this process
+            file_ = open_file(self._filepath, 'a')
+            layout = LAYOUTS[self._layout](file_[str(self._id)],
+                                           self._compression)
+            layout.attach(range(self._n))
+            self._open = layout
+        nbytes = self._open.write(number, params, result)
+        return compute_time, time.perf_counter() - start - compute_time, nbytes
+
+
 class Calculation(object):
     """function should return dictionary"""
 
-    def __init__(self, func, filepath, id_, overwrite_file=False):
+    def __init__(self, func, filepath, id_, overwrite_file=False, cache=None,
+                 layout='group', compression='auto', vectorized=False,
+                 batch_size=None, setup=None, broadcast=None):
         """Calculation object representing calculation
 
         Parameters
@@ -29,9 +157,51 @@ class Calculation(object):
             id for calculation
         overwrite_file : bool
             create new file on instantiation (should be false mostly)
+        cache : MemoCache
+            cache consulted before evaluating the function, None to always evaluate
+        layout : str
+            storage layout of results, 'group' for a group per parameter set
+            or 'columnar' for a stacked dataset per output
+        compression : str
+            hdf5 compression filter of the outputs (e.g. 'gzip'), 'auto' to
+            compress large arrays only, None for none, or a StoragePolicy
+            with options per output
+        vectorized : bool
+            function takes arrays of parameters and returns arrays of results
+            with one row per parameter set
+        batch_size : int
+            number of parameter sets per call of a vectorized function,
+            None to pass the entire sweep at once
+        setup : dict
+            argument name to function called without arguments once per
+            worker process, its return value (e.g. a lookup table) is passed
+            as that argument to every evaluation, see WorkerContext
+        broadcast : dict
+            argument name to constant value passed to every evaluation,
+            arrays are shared read-only with the workers instead of being
+            pickled with every task
         """
+        assert layout in LAYOUTS, 'layout must be one of {}'.format(
+            list(LAYOUTS.keys()))
         self._func = func
-        self._args = inspect.getargspec(func)[0]
+        spec = inspect.getfullargspec(func)
+        self._args = spec[0]
+        # upstream results are passed whole only if func takes **kwargs
+        self._takes_all = spec.varkw is not None
+        self._upstream = None
+        self._available = None
+        self._downstream = None
+        # parameters whose results are missing after the last run
+        self.timed_out = []
+        self._cache = cache
+        self._layout = layout
+        self._compression = compression
+        self._vectorized = vectorized
+        self._batch_size = batch_size
+        self._setup = dict(setup or {})
+        self._broadcast = dict(broadcast or {})
+        # workers keep setup results of this calculation between runs
+        self._context_key = uuid.uuid4().hex
         self.set_args(filepath, id_)
         self._prepare_hdf_file(overwrite_file)
 
@@ -44,8 +214,8 @@ class Calculation(object):
             overwrite the hdf5 file upon prepration of calculation
             usually 
         """
-        if overwrite_file or not os.path.isfile(self._filepath):
-            with h5py.File(self._filepath, 'w') as file_:
+        if overwrite_file or not os.path.exists(self._filepath):
+            with open_file(self._filepath, 'w') as file_:
                 pass
 
     def get_function_args(self):
@@ -72,6 +242,64 @@ class Calculation(object):
         self._filepath = filepath
         self._id = id_
 
+    def set_upstream(self, upstream, available=None):
+        """set the source of function arguments for a pipelined calculation
+
+        upstream is always called in the process which owns the results file,
+        so only the function itself is sent to parallel workers and all file
+        access stays in a single process.
+
+        Parameters
+        ----------
+        upstream : function
+            maps a dictionary of parameters to the keyword arguments of
+            the function, None to call the function with the parameters
+        available : function
+            False for parameters whose upstream results are missing (e.g.
+            timed out), which are then skipped, None if all are available
+        """
+        self._upstream = upstream
+        self._available = available
+
+    def set_downstream(self, downstream):
+        """set a consumer of results for a pipelined calculation
+
+        Parameters
+        ----------
+        downstream : function
+            called with the parameters and result of each evaluation in the
+            process which owns the results file, None to disable
+        """
+        self._downstream = downstream
+
+    def set_cache(self, cache):
+        """set the MemoCache of results of the function
+
+        Parameters
+        ----------
+        cache : MemoCache
+            cache consulted before evaluating the function, None to disable
+        """
+        self._cache = cache
+
+    def _select_args(self, kwargs):
+        """drop upstream results which are not arguments of the function"""
+        if self._takes_all:
+            return kwargs
+        return {k: v for k, v in kwargs.items() if k in self._args}
+
+    def _function_kwargs(self, param_list, stats=None):
+        """generate the keyword arguments of each evaluation in order"""
+        for params in param_list:
+            if self._upstream is None:
+                yield params
+            else:
+                start = time.perf_counter()
+                kwargs = self._select_args(self._upstream(params))
+                if stats is not None:
+                    stats.lookup_time += time.perf_counter() - start
+                yield kwargs
+
     def add_params(self, params):
         """add ParameterGroup to simulation and validate its inputs
 
@@ -83,40 +311,51 @@ class Calculation(object):
         assert isinstance(
             params, ParameterGroup), "Parameters must be of type Parameter group"
         # check if arguments are in parameters (can be extra)
-        if self._args != []:
+        # pipelined calculations get their arguments from upstream results
+        args = [i for i in self._args
+                if i not in self._setup and i not in self._broadcast]
+        if args != [] and self._upstream is None:
             assert min([i in params.param_names()
-                        for i in self._args]) == True, 'Need all of parameters'
+                        for i in args]) == True, 'Need all of parameters'
         self._params = params
 
+    def _context(self):
+        """WorkerContext of the setup and broadcast arguments, None without them"""
+        if not self._setup and not self._broadcast:
+            return None
+        return WorkerContext(self._func, self._setup, self._broadcast,
+                             self._context_key)
+
     def _generate_params(self, expansion_type):
         """generate parameter expansions
 
         Parameters
         ----------
         expansion_type : str 
-            Type of expansion, options are single, zip, outer
+            Type of expansion, options are single, zip, outer, an
+            AdaptiveSampler or an explicit list of parameter dictionaries
 
         Returns
         -------
-        param_list : list 
-            list of dictionaries of parameters
+        param_list : Expansion
+            lazy sequence of dictionaries of parameters
         """
-        if expansion_type == 'zip':
-            param_list = self._params.zip()
-        elif expansion_type == 'outer':
-            param_list = self._params.outer_product()
-        else:
-            param_list = self._params.single()
+        if isinstance(expansion_type, AdaptiveSampler):
+            return expansion_type.points
+        if isinstance(expansion_type, (list, Expansion)):
+            return expansion_type
+        return self._params.expand(expansion_type)
 
-        return param_list
-
-    def run(self, expansion_type=None, parallel=False, n_jobs=4):
+    def run(self, expansion_type=None, parallel=False, n_jobs=4, stream=False,
+            flush_every=100, resume=False, hooks=None, executor=None,
+            writer=None, direct_write=False):
         """run the calculation and put into result object
 
         Parameters
         ----------
         expansion_type : str 
-            Type of expansion, options are single, zip, outer
+            Type of expansion, options are single, zip, outer, an
+            AdaptiveSampler or an explicit list of parameter dictionaries
 
         parallel : bool
             parallelize calculation over cores
@@ -124,20 +363,254 @@ class Calculation(object):
         n_jobs : int 
             number of cores to use for parallization
 
+        stream : bool
+            write each result to the file as soon as it is computed instead
+            of collecting all results in memory first
+
+        flush_every : int
+            number of results written between flushes of the file when streaming
+
+        resume : bool
+            keep results already in the file for this calculation and only
+            compute the parameter sets which are missing
+
+        hooks : list
+            functions called as hook(event, stats) with event 'stage_start',
+            'stage_end' and 'run_end' and the StageStats of the run, an
+            AdaptiveSampler has a stage per round
+
+        executor : SerialExecutor
+            executor evaluating the function (e.g. FileQueueExecutor for
+            remote workers), None to choose from parallel and n_jobs
+
+        writer : AsyncWriter
+            writer of results on a background thread, results are then
+            streamed to it as they are computed, None to write in this thread
+
+        direct_write : bool
+            workers write their own results instead of sending them to this
+            process, needs a storage backend with concurrent writes such
+            as a .npyd directory, see Storage
+
         Returns
         -------
         df : pd.DataFrame
             result of _process_results function
         """
-        param_list = self._generate_params(expansion_type)
-        if parallel and _PARALLEL:
-            answer = Parallel(n_jobs=n_jobs)(delayed(self._func)(**i)
-                                             for i in param_list)
+        if executor is None:
+            if parallel and _PARALLEL:
+                executor = JoblibExecutor(n_jobs)
+            else:
+                executor = SerialExecutor()
+        run_kwargs = dict(executor=executor, stream=stream or writer is not None,
+                          flush_every=flush_every, hooks=hooks, writer=writer,
+                          direct_write=direct_write)
+        if isinstance(expansion_type, AdaptiveSampler):
+            df = self._run_sampler(expansion_type, resume, run_kwargs)
+        else:
+            df = self._run_params(self._generate_params(expansion_type),
+                                  resume=resume, **run_kwargs)
+        for hook in hooks or []:
+            hook('run_end', self.stats)
+        return df
+
+    def _run_sampler(self, sampler, resume, run_kwargs):
+        """run the rounds of an AdaptiveSampler
+        every round extends the points of the previous one, which are kept
+        by resuming, and refines based on the results written so far
+        """
+        sampler.start(self._params)
+        df = self._run_params(sampler.points, resume=resume, **run_kwargs)
+        for _ in range(sampler.rounds - 1):
+            values = self._read_output(sampler.target, len(sampler.points))
+            if not sampler.refine(values):
+                break
+            df = self._run_params(sampler.points, resume=True, **run_kwargs)
+        return df
+
+    def _read_output(self, name, n):
+        """read a scalar output of the first n group numbers
+
+        Parameters
+        ----------
+        name : str
+            name of the output, None for the first in alphabetical order
+        n : int
+            number of groups to read
+        """
+        with open_file(self._filepath, 'a') as file_:
+            layout = open_layout(file_[str(self._id)])
+            if name is None:
+                name = sorted(layout.read_result(0).keys())[0]
+            return np.array([float(np.asarray(layout.read_result(i)[name]))
+                             for i in range(n)])
+
+    def _run_params(self, param_list, executor, stream, flush_every, resume,
+                    hooks, writer=None, direct_write=False):
+        """run the calculation for a list of parameters, see run"""
+        self.stats = stats = StageStats(self._id, executor.n_workers)
+        self._hooks = hooks or []
+        for hook in self._hooks:
+            hook('stage_start', stats)
+        done = self._completed_groups(param_list) if resume else set()
+        stats.n_skipped = len(done)
+        # parameter sets without upstream results are left missing
+        missing = set()
+        if self._available is not None:
+            missing = set(i for i, p in enumerate(param_list)
+                          if i not in done and not self._available(p))
+        stats.n_total = len(param_list) - len(missing)
+        if direct_write:
+            assert not missing, 'direct_write needs every upstream result'
+
+            df = self._run_direct(param_list, executor, done if resume else None)
+            for hook in self._hooks:
+                hook('stage_end', stats)
+            return df
+        # workers only compute, results come back to this process which
+        # is the single writer of the hdf5 file
+        numbers = ([i for i in range(len(param_list))
+                    if i not in done and i not in missing]
+                   if done or missing else range(len(param_list)))
+        kwargs_list = _Kwargs(self, param_list, numbers, stats)
+        context = self._context()
+        assert context is None or self._cache is None, \
+            'a cache does not support setup or broadcast arguments'
+        func = self._func if context is None else context
+        call = _call_batch if self._vectorized else func
+        if executor.shared_memory is not None:
+            # large outputs come back as memory-mapped files, not pickles
+            call = SharedOutputs(call, executor.shared_memory)
+
+        def compute(kwargs_list):
+            """position in kwargs_list and result of each evaluation as
+            they complete"""
+            if self._vectorized:
+                batches = _batches(kwargs_list, self._batch_size)
+                results = stats.unwrap_batches(executor.map_unordered(
+                    Timed(call),
+                    ({'func': func, 'batch': b} for b in batches)),
+                    self._batch_size)
+            else:
+                results = stats.unwrap(executor.map_unordered(Timed(call),
+                                                              kwargs_list))
+            if executor.shared_memory is not None:
+                results = ((k, receive(r)) for k, r in results)
+            return results
+
+        try:
+            if self._cache is not None:
+                # the cache pairs results with its entries in order
+                answer = zip(numbers, self._cache.map(
+                    self._func, iter(kwargs_list),
+                    lambda kwargs: in_order(compute(kwargs)),
+                    stats.record_cached))
+            else:
+                answer = ((numbers[k], r) for k, r in compute(kwargs_list))
+            if not stream:
+                answer = list(answer)
+            df = self._process_results(param_list, answer,
+                                       flush_every if stream else None,
+                                       done if resume else None, writer,
+                                       missing, numbered=True)
+        finally:
+            if executor.shared_memory is not None:
+                call.cleanup()
+            if context is not None:
+                context.close()
+        for hook in self._hooks:
+            hook('stage_end', stats)
+        return df
+
+    def _run_direct(self, param_list, executor, done):
+        """run with every worker writing its own results, see run"""
+        assert not self._vectorized and self._cache is None, \
+            'direct_write does not support vectorized functions or a cache'
+        # an interrupted worker could leave a partial write, the timeout of
+        # a FileQueueExecutor only requeues chunks of stopped workers
+        assert not (isinstance(executor, JoblibExecutor)
+                    and executor.timeout is not None), \
+            'direct_write does not support timeouts'
+        self.timed_out = []
+        stats = self.stats
+        start = time.perf_counter()
+        with open_file(self._filepath, 'a') as file_:
+            assert supports_concurrent_writes(file_), \
+                'direct_write needs a backend with concurrent writes, e.g. {}'.format(
+                    NPY_SUFFIX)
+            self._new_layout(file_, param_list, done)
+        stats.write_time += time.perf_counter() - start
+        todo = [i for i in range(len(param_list)) if i not in (done or ())]
+        kwargs_list = self._function_kwargs((param_list[i] for i in todo), stats)
+        context = self._context()
+        task = _DirectWrite(self._func if context is None else context,
+                            self._filepath, self._id, self._layout,
+                            self._compression, len(param_list))
+        tasks = ({'number': i, 'params': param_list[i], 'kwargs': kwargs}
+                 for i, kwargs in zip(todo, kwargs_list))
+        try:
+            for compute_time, write_time, nbytes in executor.map(task, tasks):
+                stats.record(compute_time)
+                stats.write_time += write_time
+                stats.bytes_written += nbytes
+        finally:
+            if context is not None:
+                context.close()
+        with open_file(self._filepath, 'a') as file_:
+            calc_group = file_[str(self._id)]
+            start = time.perf_counter()
+            open_layout(calc_group, self._compression).finish(param_list)
+            stats.write_time += time.perf_counter() - start
+            stats.finish()
+            calc_group.attrs[STATS_ATTR] = stats.to_json()
+        return pd.DataFrame([dict(_group_number_=i, **p)
+                             for i, p in enumerate(param_list)])
+
+    def _completed_groups(self, param_list):
+        """find which parameter sets already have results in the file
+
+        Parameters
+        ----------
+        param_list : list
+            list of dictionaries of parameters, position is the group number
+
+        Returns
+        -------
+        done : set
+            group numbers whose stored parameters match param_list
+        """
+        with open_file(self._filepath, 'a') as file_:
+            if str(self._id) not in file_:
+                return set()
+            return open_layout(file_[str(self._id)]).completed(param_list)
+
+    def _new_layout(self, file_, params, done):
+        """create the calculation group and prepare its layout for writing
+
+        Parameters
+        ----------
+        file_ : h5py.File
+            open results file
+        params : list
+            list of dictionaries of parameters, position is the group number
+        done : set
+            group numbers already stored, None if the group should be new
+
+        Returns
+        -------
+        layout : GroupLayout
+            layout to write results with
+        """
+        if done is None:
+            calc_group = file_.create_group(str(self._id))
         else:
-            answer = [self._func(**i) for i in param_list]
-        return self._process_results(param_list, answer)
+            calc_group = file_.require_group(str(self._id))
+        layout = LAYOUTS[self._layout](calc_group, self._compression)
+        layout.start(params, done or set())
+        return layout
 
-    def _process_results(self, params, ans):
+    def _process_results(self, params, ans, flush_every=None, done=None,
+                         writer=None, missing=None, numbered=False):
         """process results, save to hdf5 file
         build dataframe with parameters and file_paths
 
@@ -145,8 +618,22 @@ class Calculation(object):
         ----------
         params : list 
            list of dictionaries which hold parameters
-        ans : list 
-           list of dictionary results from computation
+        ans : iterable
+           dictionary results from computation, may be a generator in
+           which case each result is written as it is produced
+        flush_every : int
+           flush the file after this many results, None to flush at the end
+        done : set
+           group numbers already stored which have no entry in ans,
+           None if the calculation group should be new
+        writer : AsyncWriter
+           writer of results on a background thread, None to write in
+           this thread
+        missing : set
+           group numbers which were not evaluated and have no entry in ans
+        numbered : bool
+           ans holds (group number, result) pairs in any order instead of
+           the results in order of group number
 
         Returns
         -------
@@ -155,16 +642,53 @@ class Calculation(object):
            into the hdf5 file where where the simulation is stored
         """
         d_to_dataframe = []
-        with h5py.File(self._filepath) as file_:
-            calc_group = file_.create_group(str(self._id))
-            for i, (p, r) in enumerate(zip(params, ans)):
+        with open_file(self._filepath, 'a',
+                       rdcc_nbytes=CHUNK_CACHE_BYTES) as file_:
+            stats = getattr(self, 'stats', None) or StageStats(self._id)
+            start = time.perf_counter()
+            layout = self._new_layout(file_, params, done)
+            calc_group = layout._group
+            done = done or set()
+            missing = missing or set()
+            self.timed_out = []
+            stats.write_time += time.perf_counter() - start
+            for i, p in enumerate(params):
                 temp = {'_group_number_': i}
-                group = calc_group.create_group('{}'.format(i))
-                for k, v in p.items():
-                    group.attrs[k] = v
-                    temp[k] = v
-                for k, v in r.items():
-                    dataset = group.create_dataset(k, data=np.array(v))
+                temp.update(p)
                 d_to_dataframe.append(temp)
+            if not numbered:
+                ans = zip((i for i in range(len(params))
+                           if i not in done and i not in missing), ans)
+            timed_out = set(missing)
+            n_written = 0
+            if writer is not None:
+                writer.start(file_)
+            try:
+                for i, r in ans:
+                    p = params[i]
+                    if isinstance(r, TimedOut):
+                        # left missing so a resumed run evaluates it again
+                        timed_out.add(i)
+                        continue
+                    if writer is not None:
+                        writer.put(layout, i, p, r, stats)
+                    else:
+                        start = time.perf_counter()
+                        stats.bytes_written += layout.write(i, p, r)
+                        n_written += 1
+                        if flush_every and n_written % flush_every == 0:
+                            file_.flush()
+                        stats.write_time += time.perf_counter() - start
+                    if self._downstream is not None:
+                        self._downstream(p, r)
+            finally:
+                if writer is not None:
+                    writer.close()
+            self.timed_out = [params[i] for i in sorted(timed_out)]
+            start = time.perf_counter()
+            layout.finish(params)
+            stats.write_time += time.perf_counter() - start
+            stats.finish()
+            calc_group.attrs[STATS_ATTR] = stats.to_json()
         df = pd.DataFrame(d_to_dataframe)
         return df
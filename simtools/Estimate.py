@@ -0,0 +1,242 @@
+"""This module exposes estimates of the cost of a simulation before it runs.
+
+Simulation.estimate evaluates a random sample of the parameter sets of every
+calculation and measures the duration, peak memory and output size of each
+evaluation. StageEstimate extrapolates these to every parameter set with
+bootstrap confidence intervals, which do not assume a distribution so they
+also hold for the skewed durations typical of sweeps. Estimate combines the
+stages to a runtime, stored size and peak memory of a run for a given
+number of workers, to choose n_jobs, streaming and compression up front.
+"""
+import collections
+import os
+import numpy as np
+from .ParameterIndex import is_internal
+
+Interval = collections.namedtuple('Interval', ['low', 'estimate', 'high'])
+
+N_BOOTSTRAP = 1000
+
+
+def _format_bytes(x):
+    """format a number of bytes with a binary prefix"""
+    if abs(x) < 1024:
+        return '{:.0f} B'.format(x)
+    for unit in ('KiB', 'MiB', 'GiB', 'TiB'):
+        x /= 1024.
+        if abs(x) < 1024 or unit == 'TiB':
+            return '{:.1f} {}'.format(x, unit)
+
+
+def _path_size(path):
+    """bytes used by a file or by every file below a directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _data_storage(group):
+    """bytes of the file used by the result datasets below group and bytes
+    of the rows allocated for them, (0, 0) for backends without storage sizes
+    """
+    stored = 0
+    allocated = 0
+    for name, item in group.items():
+        if is_internal(name):
+            continue
+        if hasattr(item, 'keys'):
+            s, a = _data_storage(item)
+            stored += s
+            allocated += a
+        elif hasattr(getattr(item, 'id', None), 'get_storage_size'):
+            stored += item.id.get_storage_size()
+            if item.chunks is None:
+                allocated += item.nbytes
+            else:
+                allocated += (item.id.get_num_chunks() *
+                              int(np.prod(item.chunks)) * item.dtype.itemsize)
+    return stored, allocated
+
+
+def _total(values, n, confidence, rng):
+    """interval of the sum over n parameter sets of values measured on a sample
+
+    Parameters
+    ----------
+    values : list
+        value of each sampled parameter set
+    n : int
+        number of parameter sets of the run
+    confidence : float
+        probability that the sum lies in the interval
+    rng : np.random.RandomState
+        random number generator of the bootstrap
+    """
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return Interval(0., 0., 0.)
+    estimate = n * values.mean()
+    if len(values) >= n:
+        # every parameter set was measured
+        return Interval(estimate, estimate, estimate)
+    resampled = rng.choice(values, (N_BOOTSTRAP, len(values))).mean(axis=1) * n
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(resampled, [tail, 100 - tail])
+    return Interval(float(low), float(estimate), float(high))
+
+
+def _add(intervals):
+    """interval of a sum of intervals, the bounds are added"""
+    return Interval(*(float(sum(i[k] for i in intervals)) for k in range(3)))
+
+
+class StageEstimate(object):
+    """extrapolated cost of a single calculation
+
+    Parameters
+    ----------
+    stage : any
+        identifier of the calculation
+    n_points : int
+        number of parameter sets of the run
+    durations : list
+        seconds of each sampled evaluation
+    output_bytes : list
+        bytes of the outputs of each sampled evaluation in memory
+    stored_bytes : list
+        bytes of the file used by the outputs of each sampled evaluation
+    write_times : list
+        seconds writing each sampled result
+    peak_bytes : int
+        peak memory allocated by a single evaluation
+    confidence : float
+        probability that the totals lie in their intervals
+    seed : int
+        seed of the bootstrap
+    fixed_bytes : int
+        bytes of the file used independent of the number of parameter sets
+    """
+
+    def __init__(self, stage, n_points, durations, output_bytes, stored_bytes,
+                 write_times, peak_bytes, confidence=.95, seed=0,
+                 fixed_bytes=0):
+        rng = np.random.RandomState(seed)
+        self.stage = stage
+        self.n_points = n_points
+        self.n_sampled = len(durations)
+        self.peak_bytes = peak_bytes
+        self.compute_time = _total(durations, n_points, confidence, rng)
+        self.write_time = _total(write_times, n_points, confidence, rng)
+        self.output_bytes = _total(output_bytes, n_points, confidence, rng)
+        self.stored_bytes = Interval(*(b + fixed_bytes for b in _total(
+            stored_bytes, n_points, confidence, rng)))
+
+    def runtime(self, n_jobs=1):
+        """interval of the wall time with n_jobs workers and a single writer"""
+        return Interval(*(c / n_jobs + w for c, w in zip(self.compute_time,
+                                                         self.write_time)))
+
+    def to_dict(self):
+        return {'stage': self.stage,
+                'n_points': self.n_points,
+                'n_sampled': self.n_sampled,
+                'compute_time': list(self.compute_time),
+                'write_time': list(self.write_time),
+                'output_bytes': list(self.output_bytes),
+                'stored_bytes': list(self.stored_bytes),
+                'peak_bytes': self.peak_bytes}
+
+    def __str__(self):
+        from .Simulation import parse_time_diff
+        fmt = ("Stage {}: {} evaluations ({} sampled), compute {} ({} - {}), "
+               "stored {} ({} - {}), peak {} per evaluation")
+        c = self.compute_time
+        s = self.stored_bytes
+        return fmt.format(self.stage, self.n_points, self.n_sampled,
+                          parse_time_diff(c.estimate), parse_time_diff(c.low),
+                          parse_time_diff(c.high), _format_bytes(s.estimate),
+                          _format_bytes(s.low), _format_bytes(s.high),
+                          _format_bytes(self.peak_bytes))
+
+
+class Estimate(object):
+    """extrapolated cost of a simulation, a StageEstimate per calculation
+
+    Parameters
+    ----------
+    stages : list
+        StageEstimate of each calculation in order
+    last_use : dict
+        calculation index to the index of the last calculation using its
+        results, see Simulation
+    memory_budget : int
+        bytes of results handed to later calculations in memory, None for none
+    """
+
+    def __init__(self, stages, last_use=None, memory_budget=None):
+        self.stages = list(stages)
+        self._last_use = dict(last_use or {})
+        self._memory_budget = memory_budget
+
+    def runtime(self, n_jobs=1):
+        """interval of the wall time of a run with n_jobs workers"""
+        return _add([s.runtime(n_jobs) for s in self.stages])
+
+    @property
+    def stored_bytes(self):
+        """interval of the size of the results file"""
+        return _add([s.stored_bytes for s in self.stages])
+
+    def peak_memory(self, n_jobs=1, stream=False):
+        """interval of the peak memory of a run summed over processes
+
+        Every worker holds one evaluation at its peak, the writing process
+        holds the results of a calculation unless they are streamed and the
+        results handed to later calculations up to the memory budget.
+
+        Parameters
+        ----------
+        n_jobs : int
+            number of workers
+        stream : bool
+            results are written as they are computed, see Simulation.run
+        """
+        peaks = []
+        for i, stage in enumerate(self.stages):
+            held = [Interval(0., 0., 0.)]
+            if not stream:
+                held.append(stage.output_bytes)
+            if self._memory_budget is not None:
+                handed = _add([self.stages[j].output_bytes
+                               for j, last in self._last_use.items()
+                               if j <= i <= last] or [Interval(0., 0., 0.)])
+                held.append(Interval(*(min(h, self._memory_budget)
+                                       for h in handed)))
+            workers = n_jobs * stage.peak_bytes
+            peaks.append(Interval(*(h + workers for h in _add(held))))
+        if not peaks:
+            return Interval(0., 0., 0.)
+        return Interval(*(max(p[k] for p in peaks) for k in range(3)))
+
+    def to_dict(self, n_jobs=1):
+        return {'n_jobs': n_jobs,
+                'runtime': list(self.runtime(n_jobs)),
+                'stored_bytes': list(self.stored_bytes),
+                'peak_memory': list(self.peak_memory(n_jobs)),
+                'stages': [s.to_dict() for s in self.stages]}
+
+    def __str__(self):
+        from .Simulation import parse_time_diff
+        r = self.runtime()
+        s = self.stored_bytes
+        m = self.peak_memory()
+        lines = [str(stage) for stage in self.stages]
+        lines.append('Total: runtime {} ({} - {}) on one worker, stored {} '
+                     '({} - {}), peak memory {} ({} - {})'.format(
+                         parse_time_diff(r.estimate), parse_time_diff(r.low),
+                         parse_time_diff(r.high), _format_bytes(s.estimate),
+                         _format_bytes(s.low), _format_bytes(s.high),
+                         _format_bytes(m.estimate), _format_bytes(m.low),
+                         _format_bytes(m.high)))
+        return '\n'.join(lines)
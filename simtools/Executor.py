@@ -0,0 +1,491 @@
+"""This module exposes executors which evaluate calculation functions.
+
+An executor maps a function over keyword arguments and returns the results in
+order to the process that writes the results file. SerialExecutor evaluates in
+the calling process, JoblibExecutor on local cores and FileQueueExecutor
+distributes chunks of evaluations to workers on any machine sharing a
+directory with the writer. Workers are started on each node with::
+
+    python -m simtools.Executor /shared/queue/directory
+"""
+import collections
+import glob
+import itertools
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+import traceback
+import uuid
+try:
+    from joblib import Parallel, delayed
+    from joblib.externals.loky import ProcessPoolExecutor
+    from joblib.executor import get_memmapping_executor
+    _PARALLEL = True
+except ImportError:
+    _PARALLEL = False
+from .Scheduler import Scheduler
+try:
+    import cloudpickle as _pickle
+except ImportError:
+    _pickle = pickle
+
+STOP_FILE = 'STOP'
+# seconds between heartbeats of a worker evaluating a chunk
+HEARTBEAT = 1.
+
+
+class SerialExecutor(object):
+    """evaluate in the calling process"""
+    n_workers = 1
+    # minimum bytes of array outputs returned through shared memory, None
+    # when workers do not share memory with the calling process
+    shared_memory = None
+
+    def map(self, func, kwargs_list):
+        """results of func(**kwargs) for each element of kwargs_list
+
+        Parameters
+        ----------
+        func : function
+            function to evaluate, must be picklable for parallel executors
+        kwargs_list : iterable
+            keyword arguments of each evaluation
+
+        Returns
+        -------
+        results : iterator
+            results in the order of kwargs_list
+        """
+        return (func(**kwargs) for kwargs in kwargs_list)
+
+    def map_unordered(self, func, kwargs_list):
+        """position in kwargs_list and result of func(**kwargs) of each
+        element of kwargs_list, in the order they complete"""
+        return enumerate(self.map(func, kwargs_list))
+
+
+def _call_chunk(func, chunk):
+    """results of func(**kwargs) for each element of chunk and the time spent"""
+    start = time.perf_counter()
+    results = [func(**kwargs) for kwargs in chunk]
+    return time.perf_counter() - start, results
+
+
+class JoblibExecutor(SerialExecutor):
+    """evaluate on local cores with joblib
+
+    Evaluations are submitted in chunks so that dispatch and pickling do not
+    dominate cheap functions. With chunk_size 'auto' a warm-up of one
+    evaluation per worker measures the cost of an evaluation and the
+    remaining evaluations are chunked to take about chunk_time each.
+    Evaluations cheaper than serial_cost are not worth the transfer of their
+    results between processes, they are evaluated in the calling process.
+
+    With a cost model, a timeout or speculation evaluations are scheduled
+    by a Scheduler: expensive points first in chunks of about chunk_time
+    predicted seconds, interrupted after timeout
+    seconds with a TimedOut result, and stragglers run twice, see Scheduler.
+
+    Each map uses the worker processes joblib keeps between calls, which are
+    started again whenever another number of workers is requested and stop
+    after being idle. start keeps a dedicated pool of warm workers for every
+    map until shutdown, also as a context manager::
+
+        with JoblibExecutor(4) as executor:
+            simulation.run('outer', executor=executor)
+
+    Parameters
+    ----------
+    n_jobs : int
+        number of processes, negative counts back from the number of cores
+    shared_memory : int
+        array outputs of at least this many bytes are returned from workers
+        through shared memory instead of being pickled, e.g. 2 ** 20, None
+        to pickle every output
+    chunk_size : int
+        number of evaluations per task, 'auto' to tune it from the warm-up
+    chunk_time : float
+        seconds of computation per task targeted by chunk_size 'auto'
+    max_chunk_size : int
+        largest tuned chunk_size
+    serial_cost : float
+        seconds per evaluation below which chunk_size 'auto' evaluates in
+        the calling process, None to always use the workers
+    cost : function
+        estimator of the relative cost of an evaluation from its keyword
+        arguments, 'learn' to learn it from timings of a sample of the
+        evaluations, None to evaluate in order
+    timeout : float
+        seconds after which an evaluation is interrupted, None for no limit
+    speculate : float
+        evaluate again chunks running this many times longer than predicted
+        when workers are idle at the end of a map, None to never
+    """
+
+    def __init__(self, n_jobs=4, shared_memory=None, chunk_size='auto',
+                 chunk_time=.05, max_chunk_size=4096, serial_cost=1e-5,
+                 cost=None, timeout=None, speculate=None):
+        assert _PARALLEL, 'JoblibExecutor needs joblib'
+        assert chunk_size == 'auto' or chunk_size >= 1, 'Invalid chunk_size'
+        self.n_jobs = n_jobs
+        self.shared_memory = shared_memory
+        self.chunk_size = chunk_size
+        self.chunk_time = chunk_time
+        self.max_chunk_size = max_chunk_size
+        self.serial_cost = serial_cost
+        self.cost = cost
+        self.timeout = timeout
+        self.speculate = speculate
+        # chunk size of the last map, None if it was evaluated serially
+        self.tuned_chunk_size = None
+        self._pool = None
+        if n_jobs < 0:
+            self.n_workers = max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+        else:
+            self.n_workers = n_jobs
+
+    def _tune(self, durations):
+        """chunk size taking about chunk_time for evaluations of durations,
+        None if they are cheaper than serial_cost"""
+        cost = sum(durations) / max(1, len(durations))
+        if self.serial_cost is not None and cost < self.serial_cost:
+            return None
+        return int(min(self.max_chunk_size, max(1, self.chunk_time // cost)))
+
+    def _chunks(self, kwargs_list, size):
+        while True:
+            chunk = list(itertools.islice(kwargs_list, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def start(self):
+        """start the worker processes, they are reused until shutdown
+        returns once every worker has run a task, so the first map does not
+        wait for processes to be spawned
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_workers)
+            # loky spawns the workers on the first submit
+            for future in [self._pool.submit(os.getpid)
+                           for _ in range(self.n_workers)]:
+                future.result()
+        return self
+
+    def shutdown(self):
+        """stop the worker processes started by start"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    @property
+    def started(self):
+        return self._pool is not None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _run(self, func, chunks):
+        if self._pool is None:
+            return Parallel(n_jobs=self.n_jobs, return_as='generator')(
+                delayed(_call_chunk)(func, chunk) for chunk in chunks)
+        return self._submit(func, chunks)
+
+    def _submit(self, func, chunks):
+        """results of chunks in order, with a bounded number in flight"""
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                pending.append(self._pool.submit(_call_chunk, func, chunk))
+                if len(pending) >= 2 * self.n_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @property
+    def scheduled(self):
+        """True if maps are scheduled by cost, timeout or speculation"""
+        return (self.cost is not None or self.timeout is not None
+                or self.speculate is not None)
+
+    def _scheduler(self):
+        pool = self._pool
+        if pool is None:
+            # the workers joblib keeps between calls
+            pool = get_memmapping_executor(self.n_workers)
+        return Scheduler(
+            pool, self.n_workers, cost=self.cost, timeout=self.timeout,
+            speculate=self.speculate, chunk_time=self.chunk_time,
+            max_chunk_size=self.max_chunk_size, serial_cost=self.serial_cost)
+
+    def map_unordered(self, func, kwargs_list):
+        if self.scheduled:
+            # yielded as they complete, see Scheduler
+            return self._scheduler().map_unordered(func, kwargs_list)
+        return super(JoblibExecutor, self).map_unordered(func, kwargs_list)
+
+    def map(self, func, kwargs_list):
+        if self.scheduled:
+            for result in self._scheduler().map(func, kwargs_list):
+                yield result
+            return
+        kwargs_list = iter(kwargs_list)
+        chunk_size = self.chunk_size
+        if chunk_size == 'auto':
+            warmup = list(itertools.islice(kwargs_list, self.n_workers))
+            durations = []
+            for duration, results in self._run(func, ([k] for k in warmup)):
+                durations.append(duration)
+                for result in results:
+                    yield result
+            chunk_size = self._tune(durations)
+        self.tuned_chunk_size = chunk_size
+        if chunk_size is None:
+            for result in super(JoblibExecutor, self).map(func, kwargs_list):
+                yield result
+            return
+        for _, results in self._run(func, self._chunks(kwargs_list, chunk_size)):
+            for result in results:
+                yield result
+
+
+def _write_atomic(path, obj):
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'wb') as file_:
+        _pickle.dump(obj, file_, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _read(path):
+    with open(path, 'rb') as file_:
+        return pickle.load(file_)
+
+
+class FileQueueExecutor(SerialExecutor):
+    """distribute chunks of evaluations through a shared directory
+
+    The writer puts pickled chunks in ``tasks``. A worker claims a chunk by
+    atomically renaming it into ``claimed``, touches the claimed file from a
+    thread while it evaluates the chunk as a heartbeat and writes the results
+    to ``results``. Claimed chunks whose heartbeat is older than timeout are
+    put back in ``tasks`` so chunks of failed workers are computed again.
+
+    Parameters
+    ----------
+    directory : str
+        queue directory, must be shared between the writer and the workers
+    chunk_size : int
+        number of evaluations per chunk
+    n_local_workers : int
+        worker processes started on this machine for the duration of map
+    timeout : float
+        seconds without heartbeat after which a claimed chunk is requeued,
+        must be longer than the heartbeat interval of the workers
+    max_pending : int
+        maximum number of chunks submitted and not yet collected
+    poll : float
+        seconds between checks of the queue
+    """
+
+    def __init__(self, directory, chunk_size=16, n_local_workers=0, timeout=60.,
+                 max_pending=64, poll=.01):
+        self._directory = directory
+        self.chunk_size = chunk_size
+        self.n_local_workers = n_local_workers
+        self.n_workers = max(1, n_local_workers)
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.poll = poll
+        for sub in ('tasks', 'claimed', 'results'):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+
+    def _path(self, sub, name):
+        return os.path.join(self._directory, sub, name)
+
+    def _requeue_stale(self):
+        """put chunks of workers without heartbeat back in the queue"""
+        now = time.time()
+        for path in glob.glob(self._path('claimed', '*')):
+            try:
+                if now - os.path.getmtime(path) > self.timeout:
+                    name = os.path.basename(path).rsplit('.', 1)[0]
+                    os.rename(path, self._path('tasks', name))
+            except OSError:
+                # finished or requeued meanwhile
+                pass
+
+    def _chunks(self, kwargs_list):
+        chunk = []
+        for kwargs in kwargs_list:
+            chunk.append(kwargs)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def map(self, func, kwargs_list):
+        run = uuid.uuid4().hex
+        # spawn so workers do not inherit the open hdf5 file of the writer
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=worker, args=(self._directory,),
+                                   kwargs={'idle_timeout': None, 'run': run,
+                                           'heartbeat': min(HEARTBEAT,
+                                                            self.timeout / 4)})
+                   for _ in range(self.n_local_workers)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        try:
+            for result in self._map(run, func, kwargs_list, workers):
+                yield result
+        finally:
+            open(self._path('tasks', '{}.{}'.format(run, STOP_FILE)), 'w').close()
+            for w in workers:
+                w.join()
+            os.remove(self._path('tasks', '{}.{}'.format(run, STOP_FILE)))
+
+    def _map(self, run, func, kwargs_list, workers=()):
+        chunks = self._chunks(kwargs_list)
+        submitted = 0
+        collected = 0
+        exhausted = False
+        last_check = time.time()
+        while True:
+            while not exhausted and submitted - collected < self.max_pending:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                name = '{}_{:012d}.pkl'.format(run, submitted)
+                _write_atomic(self._path('tasks', name), (func, chunk))
+                submitted += 1
+            if exhausted and collected == submitted:
+                return
+            path = self._path('results', '{}_{:012d}.pkl'.format(run, collected))
+            if os.path.exists(path):
+                status, value = _read(path)
+                os.remove(path)
+                if status == 'error':
+                    raise RuntimeError('Worker failed on chunk {}:\n{}'.format(
+                        collected, value))
+                collected += 1
+                for result in value:
+                    yield result
+                continue
+            if time.time() - last_check > min(self.timeout, 1.):
+                if workers and not any(w.is_alive() for w in workers):
+                    raise RuntimeError('Every local worker exited with chunk '
+                                       '{} not collected'.format(collected))
+                self._requeue_stale()
+                last_check = time.time()
+            time.sleep(self.poll)
+
+
+def _claim(directory, run=None):
+    """claim the oldest chunk of the queue, None if the queue is empty"""
+    pattern = '{}_*.pkl'.format(run) if run else '*_*.pkl'
+    for path in sorted(glob.glob(os.path.join(directory, 'tasks', pattern))):
+        name = os.path.basename(path)
+        claimed = os.path.join(directory, 'claimed', '{}.{}'.format(
+            name, uuid.uuid4().hex))
+        try:
+            os.rename(path, claimed)
+            # rename keeps the time the task was written, staleness is
+            # measured from the claim
+            os.utime(claimed)
+        except OSError:
+            # claimed by another worker or requeued meanwhile
+            continue
+        return name, claimed
+    return None
+
+
+def _heartbeat(claimed, interval, done, lost):
+    """touch claimed every interval seconds until done is set, set lost if
+    the chunk was requeued"""
+    while not done.wait(interval):
+        try:
+            os.utime(claimed)
+        except FileNotFoundError:
+            # requeued as stale, another worker computes the chunk
+            lost.set()
+            return
+
+
+def worker(directory, idle_timeout=60., poll=.01, run=None,
+           heartbeat=HEARTBEAT):
+    """process chunks of a FileQueueExecutor queue until stopped
+
+    Parameters
+    ----------
+    directory : str
+        queue directory
+    idle_timeout : float
+        exit after this many seconds without work, None to wait for a STOP
+        file in the tasks directory
+    poll : float
+        seconds between checks of the queue
+    run : str
+        only process chunks of this run, None for every run
+    heartbeat : float
+        seconds between heartbeats while a chunk is evaluated, shorter than
+        the timeout of the FileQueueExecutor
+    """
+    stop = os.path.join(directory, 'tasks',
+                        '{}.{}'.format(run, STOP_FILE) if run else STOP_FILE)
+    idle_since = time.time()
+    while True:
+        claim = _claim(directory, run)
+        if claim is None:
+            if os.path.exists(stop):
+                return
+            if idle_timeout is not None and time.time() - idle_since > idle_timeout:
+                return
+            time.sleep(poll)
+            continue
+        name, claimed = claim
+        try:
+            func, chunk = _read(claimed)
+        except FileNotFoundError:
+            # requeued before it was read
+            continue
+        done = threading.Event()
+        lost = threading.Event()
+        thread = threading.Thread(target=_heartbeat,
+                                  args=(claimed, heartbeat, done, lost))
+        thread.daemon = True
+        thread.start()
+        try:
+            results = []
+            for kwargs in chunk:
+                if lost.is_set():
+                    break
+                results.append(func(**kwargs))
+            value = ('ok', results)
+        except Exception:
+            value = ('error', traceback.format_exc())
+        finally:
+            done.set()
+            thread.join()
+        if not lost.is_set() and os.path.exists(claimed):
+            _write_atomic(os.path.join(directory, 'results', name), value)
+            try:
+                os.remove(claimed)
+            except OSError:
+                pass
+        idle_since = time.time()
+
+
+if __name__ == '__main__':
+    worker(sys.argv[1], idle_timeout=None)
@@ -139,7 +139,7 @@ class Function(object):
         will be able to change in plotting widget
         """
         import inspect
-        args = inspect.getargspec(function)[0]
+        args = inspect.getfullargspec(function)[0]
         assert len(args) > 0, 'Function must have arguments'
 
         def get_ind_var():
@@ -0,0 +1,351 @@
+"""This module exposes the storage layouts of calculation results in the hdf5 file.
+
+GroupLayout stores one group per parameter set holding one dataset per output,
+with the parameters as attributes of the group.
+ColumnarLayout stores one stacked, chunked dataset per output indexed by group
+number, so a calculation is a handful of hdf5 objects regardless of its size.
+Both keep the parameter table of ParameterIndex in the calculation group.
+"""
+import numpy as np
+import pandas as pd
+from .StoragePolicy import StoragePolicy
+from .ParameterIndex import (ParameterIndex, INDEX_NAME, is_internal,
+                             read_columns, read_row)
+
+LAYOUT_ATTR = '_layout_'
+COMPLETE_NAME = '_complete_'
+# target size in bytes of a chunk of a stacked dataset
+CHUNK_BYTES = 2 ** 20
+# chunk cache of files opened for writing, holds the chunk being filled of
+# several outputs so compressed chunks are not rewritten for every row
+CHUNK_CACHE_BYTES = 16 * CHUNK_BYTES
+
+
+class GroupLayout(object):
+    """one hdf5 group per parameter set
+
+    Parameters
+    ----------
+    group : h5py.Group
+        group of the calculation
+    compression : str
+        compression filter of the datasets, None for no compression or a
+        StoragePolicy
+    """
+    name = 'group'
+
+    def __init__(self, group, compression=None):
+        self._group = group
+        self._storage = StoragePolicy.create(compression)
+
+    def completed(self, params):
+        """group numbers of params which already have complete results
+
+        Parameters
+        ----------
+        params : list
+            list of dictionaries of parameters, position is the group number
+        """
+        index = ParameterIndex.read(self._group)
+        # groups of parameter sets which timed out were never written
+        numbers = set(self.numbers())
+        return set(i for i, p in enumerate(params)
+                   if i in numbers and p in index and index.lookup(p) == i)
+
+    def start(self, params, done):
+        """prepare the calculation group for writing results of params
+
+        Parameters
+        ----------
+        params : list
+            list of dictionaries of parameters, position is the group number
+        done : set
+            group numbers which are already complete
+        """
+        # the parameter table is only valid once every group is complete
+        if INDEX_NAME in self._group:
+            del self._group[INDEX_NAME]
+
+    def attach(self, params):
+        """prepare writing to a calculation group started by another process
+
+        Parameters
+        ----------
+        params : list
+            list of dictionaries of parameters, position is the group number
+        """
+        pass
+
+    def write(self, number, params, result):
+        """write the result of a single parameter set
+
+        Parameters
+        ----------
+        number : int
+            group number of the parameter set
+        params : dict
+            parameters of the evaluation
+        result : dict
+            result of the evaluation
+
+        Returns
+        -------
+        nbytes : int
+            number of bytes of data written
+        """
+        nbytes = 0
+        name = '{}'.format(number)
+        if name in self._group:
+            # left over from an interrupted calculation
+            del self._group[name]
+        group = self._group.create_group(name)
+        for k, v in result.items():
+            data = self._storage.convert(k, v)
+            group.create_dataset(k, data=data,
+                                 **self._storage.dataset_kwargs(k, data))
+            nbytes += data.nbytes
+        # parameters are written last and mark the group as complete
+        group.attrs.update(params)
+        return nbytes
+
+    def write_batch(self, items):
+        """write the results of several parameter sets
+
+        Parameters
+        ----------
+        items : list
+            tuples of group number, parameters and result, see write
+
+        Returns
+        -------
+        nbytes : int
+            number of bytes of data written
+        """
+        return sum(self.write(*item) for item in items)
+
+    def finish(self, params):
+        """write the parameter table once every result is written"""
+        ParameterIndex.from_params(params).write(self._group, params)
+
+    def numbers(self):
+        """group numbers of stored results"""
+        return sorted(int(k) for k in self._group if not is_internal(k))
+
+    def output_names(self):
+        """sorted names of the outputs"""
+        for name in self._group:
+            if not is_internal(name):
+                return sorted(self._group[name].keys())
+        return []
+
+    def complete_mask(self, size):
+        """boolean array of size, True for group numbers with stored results"""
+        mask = np.zeros(size, dtype=bool)
+        numbers = np.asarray(self.numbers(), dtype=int)
+        mask[numbers[numbers < size]] = True
+        return mask
+
+    def read_params(self, number):
+        """parameters of group number"""
+        return {k: v for k, v in self._group[str(number)].attrs.items()}
+
+    def read_result(self, number):
+        """dictionary of output name to dataset of group number"""
+        return dict(self._group[str(number)].items())
+
+    def to_dataframe(self):
+        """dataframe of parameters and scalar outputs of every group"""
+        ans = []
+        params = {}
+        for number in self.numbers():
+            result = {}
+            params = self.read_params(number)
+            for name, dataset in self.read_result(number).items():
+                d_set = np.array(dataset)
+                if d_set.shape == ():
+                    result[name] = d_set.item()
+                else:
+                    raise Exception(
+                        'Function requires single valued results')
+            ans.append({**params, **result})
+        return pd.DataFrame(ans).set_index(list(params.keys()))
+
+
+class ColumnarLayout(GroupLayout):
+    """one stacked dataset per output indexed by group number
+
+    Outputs must have the same shape for every parameter set.
+
+    Parameters
+    ----------
+    group : h5py.Group
+        group of the calculation
+    compression : str
+        compression filter of the datasets, None for no compression or a
+        StoragePolicy
+    """
+    name = 'columnar'
+
+    def completed(self, params):
+        if COMPLETE_NAME not in self._group:
+            return set()
+        complete = self._group[COMPLETE_NAME][()]
+        index = ParameterIndex.read(self._group)
+        return set(i for i, p in enumerate(params)
+                   if i < len(complete) and complete[i]
+                   and p in index and index.lookup(p) == i)
+
+    def start(self, params, done):
+        n = len(params)
+        self._group.attrs[LAYOUT_ATTR] = self.name
+        complete = np.zeros(n, dtype=bool)
+        complete[sorted(i for i in done if i < n)] = True
+        if COMPLETE_NAME in self._group:
+            del self._group[COMPLETE_NAME]
+        self._group.create_dataset(COMPLETE_NAME, data=complete,
+                                   maxshape=(None,))
+        for name, dataset in self._group.items():
+            if not is_internal(name) and dataset.shape[0] != n:
+                dataset.resize(n, axis=0)
+        # parameters are known up front so the table is written first
+        ParameterIndex.from_params(params).write(self._group, params)
+        self.attach(params)
+
+    def attach(self, params):
+        self._n = len(params)
+        self._complete = self._group[COMPLETE_NAME]
+        # open datasets are kept so their chunk cache lives across writes
+        self._datasets = {}
+
+    def _create(self, name, data):
+        kwargs = self._storage.dataset_kwargs(name, data.reshape((1,) + data.shape),
+                                              data.nbytes * self._n)
+        # chunks of the policy are the shape of a row
+        row_chunks = kwargs.pop('chunks', data.shape)
+        row_chunks = tuple(row_chunks)[-data.ndim:] if data.ndim else ()
+        row_bytes = max(int(np.prod(row_chunks)) * data.dtype.itemsize, 1)
+        rows = int(min(self._n, max(1, CHUNK_BYTES // row_bytes)))
+        # required rather than created as another process may create it first
+        return self._group.require_dataset(
+            name, shape=(self._n,) + data.shape, dtype=data.dtype,
+            maxshape=(None,) + data.shape, chunks=(rows,) + row_chunks,
+            **kwargs)
+
+    def _dataset(self, name, data):
+        """stacked dataset of output name for rows like data, converted rows
+        must be given"""
+        dataset = self._datasets.get(name)
+        if dataset is None:
+            if name in self._group:
+                dataset = self._group[name]
+            else:
+                dataset = self._create(name, data)
+            self._datasets[name] = dataset
+        if dataset.shape[1:] != data.shape:
+            raise ValueError(
+                'Output {} changed shape from {} to {}, columnar layout '
+                'needs fixed shapes, use the group layout'.format(
+                    name, dataset.shape[1:], data.shape))
+        return dataset
+
+    def write(self, number, params, result):
+        nbytes = 0
+        for k, v in result.items():
+            data = self._storage.convert(k, v)
+            self._dataset(k, data)[number] = data
+            nbytes += data.nbytes
+        self._complete[number] = True
+        return nbytes
+
+    def write_batch(self, items):
+        # consecutive group numbers are written with a single slice per output
+        nbytes = 0
+        run = []
+        for item in items:
+            if run and item[0] != run[-1][0] + 1:
+                nbytes += self._write_run(run)
+                run = []
+            run.append(item)
+        if run:
+            nbytes += self._write_run(run)
+        return nbytes
+
+    def _write_run(self, run):
+        results = [result for _, _, result in run]
+        names = list(results[0].keys())
+        if len(run) == 1 or any(list(r.keys()) != names for r in results[1:]):
+            return GroupLayout.write_batch(self, run)
+        stacked = {}
+        for k in names:
+            rows = [self._storage.convert(k, r[k]) for r in results]
+            if len(set(row.shape for row in rows)) > 1:
+                # let write report the output which changed shape
+                return GroupLayout.write_batch(self, run)
+            stacked[k] = np.stack(rows)
+        start = run[0][0]
+        stop = start + len(run)
+        nbytes = 0
+        for k, data in stacked.items():
+            self._dataset(k, data[0])[start:stop] = data
+            nbytes += data.nbytes
+        self._complete[start:stop] = True
+        return nbytes
+
+    def finish(self, params):
+        pass
+
+    def numbers(self):
+        return np.flatnonzero(self._group[COMPLETE_NAME][()]).tolist()
+
+    def output_names(self):
+        return sorted(k for k in self._group if not is_internal(k))
+
+    def complete_mask(self, size):
+        mask = np.zeros(size, dtype=bool)
+        complete = self._group[COMPLETE_NAME][:size]
+        mask[:len(complete)] = complete
+        return mask
+
+    def read_params(self, number):
+        return read_row(self._group, number)
+
+    def read_result(self, number):
+        return {k: v[number] for k, v in self._group.items()
+                if not is_internal(k)}
+
+    def to_dataframe(self):
+        params = read_columns(self._group)
+        numbers = self.numbers()
+        data = {k: v[numbers] for k, v in params.items()}
+        for name, dataset in self._group.items():
+            if is_internal(name):
+                continue
+            if dataset.ndim != 1:
+                raise Exception('Function requires single valued results')
+            data[name] = dataset[()][numbers]
+        return pd.DataFrame(data).set_index(list(params.keys()))
+
+
+LAYOUTS = {
+    GroupLayout.name: GroupLayout,
+    ColumnarLayout.name: ColumnarLayout
+}
+
+
+def open_layout(group, compression=None):
+    """layout which group was written with
+
+    Parameters
+    ----------
+    group : h5py.Group
+        group of a calculation
+
+    Returns
+    -------
+    layout : GroupLayout
+        layout object to read group
+    """
+    name = group.attrs.get(LAYOUT_ATTR, GroupLayout.name)
+    if isinstance(name, bytes):
+        name = name.decode('utf-8')
+    return LAYOUTS[name](group, compression)
@@ -0,0 +1,325 @@
+"""This module exposes an object MemoCache which stores results of calculation
+functions on disk keyed by the function and its keyword arguments.
+A function is identified by its code, default arguments, closure variables
+and the arguments bound by functools.partial, so entries are not found once
+any of them changes. Entries no longer found are removed with the least
+recently used entries when the cache grows beyond its size limit.
+"""
+import collections
+import functools
+import hashlib
+import os
+import pickle
+import shutil
+import types
+import numpy as np
+from .Scheduler import TimedOut
+
+_END = object()
+
+
+def _update_hash(hash_, value):
+    """feed a value into hash_ so equal parameters give equal digests"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, np.ndarray):
+        hash_.update(b'ndarray')
+        hash_.update(str(value.dtype).encode())
+        hash_.update(str(value.shape).encode())
+        hash_.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        hash_.update(b'dict')
+        for k in sorted(value):
+            _update_hash(hash_, k)
+            _update_hash(hash_, value[k])
+    elif isinstance(value, (list, tuple)):
+        hash_.update(type(value).__name__.encode())
+        for v in value:
+            _update_hash(hash_, v)
+    else:
+        hash_.update(repr(value).encode())
+
+
+def _unwrap(func):
+    """function wrapped by functools.partial and the arguments bound to it"""
+    bound = []
+    while isinstance(func, functools.partial):
+        bound.append((func.args, func.keywords))
+        func = func.func
+    return func, bound
+
+
+def _update_code(hash_, code):
+    """feed the bytecode, names and constants of code into hash_"""
+    hash_.update(code.co_code)
+    _update_hash(hash_, code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            # nested functions and comprehensions
+            _update_code(hash_, const)
+        else:
+            _update_hash(hash_, const)
+
+
+def _update_value(hash_, value, seen):
+    """feed a value bound to a function into hash_, functions by their code"""
+    if callable(value) and (hasattr(value, '__code__') or
+                            isinstance(value, functools.partial)):
+        if id(value) in seen:
+            # a recursive function refers to itself through its closure
+            hash_.update(b'recursive')
+        else:
+            hash_.update(function_hash(value, seen).encode())
+    else:
+        _update_hash(hash_, value)
+
+
+def function_hash(func, _seen=None):
+    """hash of the code of a function and the values bound to it
+
+    Parameters
+    ----------
+    func : function
+        function to hash, the bytecode, default arguments and closure
+        variables are used, functools.partial is unwrapped and its
+        arguments are included. Other callables are hashed by their pickle
+
+    Returns
+    -------
+    digest : str
+        hex digest identifying the function
+    """
+    hash_ = hashlib.sha256()
+    seen = set(_seen or ())
+    seen.add(id(func))
+    func, bound = _unwrap(func)
+    seen.add(id(func))
+    for args, keywords in bound:
+        hash_.update(b'partial')
+        for value in args:
+            _update_value(hash_, value, seen)
+        for k in sorted(keywords):
+            _update_hash(hash_, k)
+            _update_value(hash_, keywords[k], seen)
+    code = getattr(func, '__code__', None)
+    if code is None:
+        try:
+            hash_.update(pickle.dumps(func, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            hash_.update(repr(func).encode())
+        return hash_.hexdigest()
+    _update_code(hash_, code)
+    hash_.update(b'defaults')
+    for value in func.__defaults__ or ():
+        _update_value(hash_, value, seen)
+    kwdefaults = func.__kwdefaults__ or {}
+    for k in sorted(kwdefaults):
+        _update_hash(hash_, k)
+        _update_value(hash_, kwdefaults[k], seen)
+    hash_.update(b'closure')
+    for cell in func.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            # empty cell
+            value = None
+        _update_value(hash_, value, seen)
+    return hash_.hexdigest()
+
+
+def _function_name(func):
+    func, _ = _unwrap(func)
+    if not hasattr(func, '__code__'):
+        func = type(func)
+    module = getattr(func, '__module__', None) or ''
+    name = getattr(func, '__qualname__', None) or func.__name__
+    return '{}.{}'.format(module, name).replace('<', '').replace('>', '')
+
+
+class MemoCache(object):
+    """on disk cache of function results
+
+    Parameters
+    ----------
+    directory : str
+        directory where the cache is stored, created if it does not exist
+    max_bytes : int
+        size limit of the cache, least recently used entries are evicted
+        when it is exceeded. None for no limit
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._checked = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _function_directory(self, func):
+        """directory of entries for the current code and bound values of func
+        functions of the same name (e.g. closures or lambdas) have their own
+        directories, so entries of other versions are left to eviction
+        """
+        try:
+            return self._checked[func]
+        except (KeyError, TypeError):
+            pass
+        path = os.path.join(self._directory, _function_name(func),
+                            function_hash(func))
+        os.makedirs(path, exist_ok=True)
+        try:
+            self._checked[func] = path
+        except TypeError:
+            pass
+        return path
+
+    def _entry_path(self, func, kwargs):
+        hash_ = hashlib.sha256()
+        _update_hash(hash_, kwargs)
+        return os.path.join(self._function_directory(func),
+                            hash_.hexdigest() + '.pkl')
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'rb') as file_:
+            result = pickle.load(file_)
+        # access time for the eviction order
+        os.utime(path)
+        return result
+
+    @staticmethod
+    def _store(path, result):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as file_:
+            pickle.dump(result, file_, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def get(self, func, kwargs):
+        """look up the result of func(**kwargs)
+
+        Returns
+        -------
+        found : bool
+            whether the result was cached
+        result : any
+            cached result, None if not found
+        """
+        try:
+            result = self._load(self._entry_path(func, kwargs))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, result
+
+    def put(self, func, kwargs, result):
+        """store the result of func(**kwargs)"""
+        self._store(self._entry_path(func, kwargs), result)
+
+    def _entries(self):
+        for root, _, files in os.walk(self._directory):
+            for name in files:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    yield stat.st_mtime, stat.st_size, path
+
+    def size(self):
+        """total size in bytes of cached results"""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """remove least recently used entries until the cache fits in max_bytes"""
+        if self._max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """remove every entry of the cache"""
+        shutil.rmtree(self._directory, ignore_errors=True)
+        os.makedirs(self._directory, exist_ok=True)
+        self._checked = {}
+
+    def map(self, func, kwargs_list, compute, on_hit=None):
+        """results of func for every set of keyword arguments in order
+        only the arguments missing from the cache are passed to compute
+
+        Parameters
+        ----------
+        func : function
+            function which is cached
+        kwargs_list : iterable
+            keyword arguments of each evaluation
+        compute : function
+            called with a generator of the missing keyword arguments and
+            returns an iterable of their results in the same order
+        on_hit : function
+            called without arguments for every result found in the cache
+
+        Returns
+        -------
+        results : generator
+            results of each evaluation in the order of kwargs_list
+        """
+        # entry path and whether it was found of each argument read so far,
+        # the arguments themselves are only kept by compute
+        pending = collections.deque()
+
+        def misses():
+            for kwargs in kwargs_list:
+                path = self._entry_path(func, kwargs)
+                found = os.path.isfile(path)
+                pending.append((path, found))
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    yield kwargs
+
+        computed = iter(compute(misses()))
+        ready = collections.deque()
+        while True:
+            if not pending:
+                # reads the arguments up to the next miss or their end
+                result = next(computed, _END)
+                if result is _END:
+                    if not pending:
+                        break
+                else:
+                    ready.append(result)
+                continue
+            path, found = pending.popleft()
+            if found:
+                result = self._load(path)
+                if on_hit is not None:
+                    on_hit()
+                yield result
+                continue
+            result = ready.popleft() if ready else next(computed)
+            if not isinstance(result, TimedOut):
+                self._store(path, result)
+            yield result
+        self.evict()
+
+    def stats(self):
+        """hit and miss counts of the cache
+
+        Returns
+        -------
+        stats : dict
+            hits, misses and fraction of lookups which were hits
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.}
+
+    def __str__(self):
+        fmt = "Cache {}: {} hits, {} misses"
+        return fmt.format(self._directory, self.hits, self.misses)
@@ -1,7 +1,6 @@
 """This module exposes an object ParameterGroup which contains a set of Parameter objects
 Each parameter group carries information about expansion which is carried out during the simulation.
 """
-from itertools import product
 import numpy as np
 
 
@@ -60,6 +59,127 @@ class Parameter(object):
         return self.expansion(*self.args)
 
 
+class Expansion(object):
+    """lazy expansion of a set of parameters into points
+
+    Only the values of each parameter are stored, points are built when they
+    are accessed so memory is the sum and not the product of the lengths.
+    Supports len, indexing, slicing (giving another Expansion) and iteration.
+
+    Parameters
+    ----------
+    names : list
+        names of the parameters
+    axes : list
+        sequence of values of each parameter
+    kind : str
+        'outer' for every combination of values, 'zip' for values taken
+        together, parameters with a single value are treated as constant
+    start : int
+        first point of the expansion
+    stop : int
+        end of the expansion, None for every point
+    """
+
+    def __init__(self, names, axes, kind='outer', start=0, stop=None):
+        assert kind in ('outer', 'zip'), 'kind must be outer or zip'
+        self.names = list(names)
+        self._axes = list(axes)
+        self.kind = kind
+        lengths = [len(i) for i in self._axes]
+        if kind == 'outer':
+            self.shape = tuple(lengths)
+            total = int(np.prod(lengths, dtype=np.int64))
+        else:
+            total = min([j for j in lengths if j > 1] or [1])
+            self.shape = (total,)
+        self._start = start
+        self._stop = total if stop is None else stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def _point(self, i):
+        """dictionary of parameters of absolute point number i"""
+        if self.kind == 'outer':
+            idx = np.unravel_index(i, self.shape)
+            return {n: a[j] for n, a, j in zip(self.names, self._axes, idx)}
+        return {n: a[i] if len(a) > 1 else a[0]
+                for n, a in zip(self.names, self._axes)}
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return Expansion(self.names, self._axes, self.kind,
+                             self._start + start,
+                             self._start + max(start, stop))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('Expansion index out of range')
+        return self._point(self._start + key)
+
+    def __iter__(self):
+        if self.kind == 'zip':
+            for i in range(self._start, self._stop):
+                yield self._point(i)
+            return
+        if self._start >= self._stop:
+            return
+        # odometer from the multi index of the first point, a slice does not
+        # step over the points before it
+        idx = [int(j) for j in np.unravel_index(self._start, self.shape)]
+        values = [a[j] for a, j in zip(self._axes, idx)]
+        for _ in range(self._start, self._stop):
+            yield dict(zip(self.names, values))
+            k = len(idx) - 1
+            while k >= 0:
+                idx[k] += 1
+                if idx[k] < self.shape[k]:
+                    values[k] = self._axes[k][idx[k]]
+                    break
+                idx[k] = 0
+                values[k] = self._axes[k][0]
+                k -= 1
+
+    def chunks(self, size):
+        """split the expansion into consecutive expansions of at most size points"""
+        for i in range(0, len(self), size):
+            yield self[i:i + size]
+
+    def column(self, name):
+        """array of the values of parameter name for every point"""
+        k = self.names.index(name)
+        axis = np.asarray(self._axes[k])
+        points = np.arange(self._start, self._stop)
+        if self.kind == 'outer':
+            return axis[np.unravel_index(points, self.shape)[k]]
+        if len(axis) < 2:
+            return np.repeat(axis[:1], len(points))
+        return axis[points]
+
+    def columns(self):
+        """dictionary of parameter name to array of values for every point"""
+        return {n: self.column(n) for n in self.names}
+
+    def arrays(self):
+        """meshgrid style arrays of every parameter over the full expansion
+        for an outer expansion each array has shape (len(a), len(b), ...) and
+        is a broadcast view of the values, so no memory is used per point
+        """
+        if self.kind == 'zip':
+            return {n: self.column(n) for n in self.names}
+        ans = {}
+        for k, (name, axis) in enumerate(zip(self.names, self._axes)):
+            view_shape = [1] * len(self.shape)
+            view_shape[k] = len(axis)
+            ans[name] = np.broadcast_to(
+                np.asarray(axis).reshape(view_shape), self.shape)
+        return ans
+
+
 class ParameterGroup(object):
     """represents a set of parameters and possible expansions of those parameters
     
@@ -91,30 +211,39 @@ class ParameterGroup(object):
             param, Parameter), "cannot make ParameterGroup of type not Parameter"
         self._params.append(param)
 
+    def expand(self, expansion_type=None):
+        """lazy expansion of the parameters
+
+        Parameters
+        ----------
+        expansion_type : str
+            Type of expansion, options are single, zip, outer
+
+        Returns
+        -------
+        expansion : Expansion
+            expansion whose points are dictionaries of parameters
+        """
+        names = [i.name for i in self._params]
+        if expansion_type == 'zip':
+            return Expansion(names, [i.eval_expr() for i in self._params], 'zip')
+        elif expansion_type == 'outer':
+            return Expansion(names, [i.eval_expr() for i in self._params], 'outer')
+        return Expansion(names, [[i.value] for i in self._params], 'outer')
+
     def outer_product(self):
         """return a list of dictionaries of arguments with outer product expansion
         every value will be expanded by every other value
         len(list) = PI(len(expansion)) where PI is multiplicative"""
-        expanded_params = [i.eval_expr() for i in self._params]
-        names = [i.name for i in self._params]
-        n_pars = len(self._params)
-        return [{names[i]:tup[i] for i in range(n_pars)} for tup in product(*tuple(expanded_params))]
+        return list(self.expand('outer'))
 
     def zip(self):
         """return list of dictionaries of arguments zipped
         we will truncate the zip to the minimum length of parameter expansions greater than 1
         singular parameter expansions will be treated as constant
         """
-        expanded_params = {i.name: i.eval_expr() for i in self._params}
-        min_len = min([j for j in [len(i)
-                                   for i in expanded_params.values()] if j > 1])
-        for k, v in expanded_params.items():
-            if len(v) < 2:
-                expanded_params[k] = np.array([v[0] for _ in range(min_len)])
-            else:
-                expanded_params[k] = np.array(v[:min_len])
-        return [{k: v[i] for k, v in expanded_params.items()} for i in range(min_len)]
+        return list(self.expand('zip'))
 
     def single(self):
         """return list with single element with only the value of each parameter"""
-        return [{i.name: i.value for i in self._params}]
+        return list(self.expand())
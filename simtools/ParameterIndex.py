@@ -0,0 +1,192 @@
+"""This module exposes an object ParameterIndex which maps expanded parameter sets
+to the group number their results are stored under in the hdf5 file.
+The index is written next to the results of each calculation so that later
+calculations in a pipeline can find their inputs without scanning every group.
+"""
+import h5py
+import numpy as np
+
+INDEX_NAME = '_params_'
+
+
+def _normalize(value):
+    """convert value read from numpy or hdf5 into a hashable python value"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return value
+
+
+def _column_array(values):
+    """build an array from a column of parameter values which hdf5 can store"""
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return values
+    arr = np.asarray([_normalize(v) for v in values])
+    if arr.dtype.kind in ('U', 'O'):
+        arr = np.array([str(v) for v in values], dtype=h5py.string_dtype())
+    return arr
+
+
+def read_columns(group):
+    """read the parameter table of a calculation group
+
+    Parameters
+    ----------
+    group : h5py.Group
+        group of the calculation, must contain a parameter table
+
+    Returns
+    -------
+    columns : dict
+        parameter name to array of values in group number order
+    """
+    table = group[INDEX_NAME]
+    columns = {}
+    for name in table.attrs['names']:
+        name = _normalize(name)
+        dataset = table[name]
+        if h5py.check_string_dtype(dataset.dtype) is not None:
+            columns[name] = np.array(dataset.asstr()[()], dtype=object)
+        else:
+            columns[name] = dataset[()]
+    return columns
+
+
+def read_row(group, number):
+    """read the parameters of a single group number from the parameter table"""
+    table = group[INDEX_NAME]
+    return {_normalize(n): _normalize(table[_normalize(n)][number])
+            for n in table.attrs['names']}
+
+
+def is_internal(name):
+    """True if name is reserved for bookkeeping rather than a result"""
+    return name.startswith('_') and name.endswith('_')
+
+
+class ParameterIndex(object):
+    """index from parameter values to group numbers of a calculation
+
+    Parameters
+    ----------
+    names : list
+        names of parameters in the order of the key
+    keys : list
+        list of tuples of parameter values, position is the group number
+    """
+
+    def __init__(self, names, keys):
+        self.names = list(names)
+        self._lookup = {}
+        for i, key in enumerate(keys):
+            self._lookup.setdefault(self._key(key), i)
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def __contains__(self, params):
+        try:
+            return self.key(params) in self._lookup
+        except KeyError:
+            return False
+
+    @staticmethod
+    def _key(values):
+        return tuple(_normalize(v) for v in values)
+
+    def key(self, params):
+        """key of a parameter dictionary in this index
+
+        Parameters
+        ----------
+        params : dict
+            dictionary of parameters, must contain every indexed name
+        """
+        return self._key(params[name] for name in self.names)
+
+    def lookup(self, params):
+        """find the group number for a parameter dictionary
+
+        Parameters
+        ----------
+        params : dict
+            dictionary of parameters
+
+        Returns
+        -------
+        group_number : int
+            group number of the results for params
+
+        Raises
+        ------
+        KeyError
+            if the parameters are not in the index
+        """
+        try:
+            return self._lookup[self.key(params)]
+        except KeyError:
+            raise KeyError('No results for parameters {}'.format(params))
+
+    @classmethod
+    def from_params(cls, params):
+        """build index from a list of parameter dictionaries
+
+        Parameters
+        ----------
+        params : list
+            list of dictionaries which hold parameters or Expansion
+        """
+        names = list(params[0].keys()) if len(params) else []
+        if hasattr(params, 'column'):
+            return cls(names, zip(*[params.column(n) for n in names]))
+        return cls(names, [[p[n] for n in names] for p in params])
+
+    def write(self, group, params):
+        """store the parameter table in group
+
+        Parameters
+        ----------
+        group : h5py.Group
+            group of the calculation
+        params : list
+            list of dictionaries which hold parameters, in group number order,
+            or Expansion
+        """
+        if INDEX_NAME in group:
+            del group[INDEX_NAME]
+        table = group.create_group(INDEX_NAME)
+        table.attrs['names'] = [str(n) for n in self.names]
+        for name in self.names:
+            if hasattr(params, 'column'):
+                column = params.column(name)
+            else:
+                column = [p[name] for p in params]
+            table.create_dataset(name, data=_column_array(column))
+
+    @classmethod
+    def read(cls, group):
+        """load index from a calculation group
+        files written without an index (such as an interrupted calculation)
+        are indexed by scanning the groups once, groups without parameters
+        are left out of the index
+
+        Parameters
+        ----------
+        group : h5py.Group
+            group of the calculation
+        """
+        if INDEX_NAME in group:
+            columns = read_columns(group)
+            names = list(columns.keys())
+            return cls(names, zip(*columns.values()) if names else [])
+        numbers = sorted(int(k) for k in group if not is_internal(k))
+        attrs = [dict(group[str(i)].attrs.items()) for i in numbers]
+        names = next((list(a.keys()) for a in attrs if a), [])
+        keys = [[None] * len(names)
+                for _ in range(numbers[-1] + 1 if numbers else 0)]
+        for number, attr in zip(numbers, attrs):
+            # groups missing parameters were not completely written
+            if attr and all(n in attr for n in names):
+                keys[number] = [attr[n] for n in names]
+        return cls(names, keys)
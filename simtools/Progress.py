@@ -0,0 +1,175 @@
+"""This module exposes Progress which reports live progress of simulation runs.
+
+Progress is a hook of Simulation.run and Calculation.run. It observes the
+StageStats of every calculation, so each evaluation only costs a clock read
+in the process which owns the results file. At most once per interval it
+computes the points completed, rolling throughput, ETA and busy workers of
+each calculation and reports them to callbacks, a terminal progress bar and
+a json status file. The status file is replaced atomically so external
+monitoring may poll it at any time::
+
+    progress = Progress(bar=True, status_file='run.status.json')
+    sim.run('outer', parallel=True, hooks=[progress])
+"""
+import collections
+import json
+import os
+import sys
+import time
+import uuid
+
+BAR_WIDTH = 24
+
+
+def _write_json(path, obj):
+    """replace path with obj as json, readers see the old or the new file"""
+    tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp, 'w') as file_:
+        json.dump(obj, file_)
+    os.replace(tmp, path)
+
+
+class Progress(object):
+    """hook reporting points completed, throughput and ETA of each calculation
+
+    Parameters
+    ----------
+    callbacks : list
+        functions called with the status dictionary at every report
+    bar : bool
+        draw a progress bar of the running calculation on stream
+    status_file : str
+        path of a json file replaced with the status at every report,
+        None for no file
+    interval : float
+        minimum seconds between reports while a calculation runs, reports
+        at the start and end of calculations are always made
+    window : float
+        seconds of recent evaluations the throughput is computed from
+    stream : file
+        stream of the progress bar, None for sys.stderr
+    """
+
+    def __init__(self, callbacks=None, bar=False, status_file=None,
+                 interval=1., window=10., stream=None):
+        self.callbacks = list(callbacks or [])
+        self.bar = bar
+        self.status_file = status_file
+        self.interval = interval
+        self.window = window
+        self._stream = stream
+        self.state = 'idle'
+        self._stages = []
+        self._history = {}
+        self._next = 0.
+        self._start = time.perf_counter()
+
+    def __call__(self, event, stats):
+        if event == 'stage_start':
+            if self.state != 'running':
+                # a new run
+                self.state = 'running'
+                self._stages = []
+                self._history = {}
+                self._start = time.perf_counter()
+            stats.observer = self._observe
+            self._stages.append(stats)
+            self.report()
+        elif event == 'stage_end':
+            stats.observer = None
+            self.report()
+            if self.bar:
+                self._output().write('\n')
+        elif event == 'run_end':
+            self.state = 'done'
+            self.report()
+
+    def _observe(self, stats):
+        if time.perf_counter() >= self._next:
+            self.report()
+
+    def _output(self):
+        return sys.stderr if self._stream is None else self._stream
+
+    def _stage_status(self, stats, now):
+        """status of a single calculation"""
+        # points stored before the run are done but not part of the throughput
+        n_processed = stats.n_evaluations + stats.n_timeouts + stats.n_cached
+        n_done = n_processed + stats.n_skipped
+        history = self._history.setdefault(id(stats), collections.deque(
+            [(stats._start, 0, 0, 0.)]))
+        history.append((now, n_processed, stats.bytes_written,
+                        stats.compute_time))
+        while len(history) > 2 and history[1][0] < now - self.window:
+            history.popleft()
+        t0, n0, b0, c0 = history[0]
+        elapsed = now - t0
+        done = stats.wall_time is not None
+        rate = (n_processed - n0) / elapsed if elapsed > 0 else 0.
+        eta = None
+        if done:
+            eta = 0.
+        elif stats.n_total is not None and rate > 0:
+            eta = max(0, stats.n_total - n_done) / rate
+        return {'stage': stats.stage,
+                'state': 'done' if done else 'running',
+                'n_total': stats.n_total,
+                'n_done': n_done,
+                'n_skipped': stats.n_skipped,
+                'n_cached': stats.n_cached,
+                'n_timeouts': stats.n_timeouts,
+                'elapsed': now - stats._start,
+                'points_per_s': rate,
+                'mb_per_s': (stats.bytes_written - b0) / elapsed / 1e6
+                if elapsed > 0 else 0.,
+                'eta': eta,
+                'n_workers': stats.n_workers,
+                # mean number of workers evaluating over the window
+                'busy_workers': (stats.compute_time - c0) / elapsed
+                if elapsed > 0 else 0.}
+
+    def status(self):
+        """status of the run
+
+        Returns
+        -------
+        status : dict
+            state of the run ('done' once a Simulation or Calculation run
+            ends), unix time, seconds elapsed, ETA of the running calculations and the
+            status of every calculation started so far
+        """
+        now = time.perf_counter()
+        stages = [self._stage_status(stats, now) for stats in self._stages]
+        etas = [s['eta'] for s in stages]
+        return {'state': self.state,
+                'time': time.time(),
+                'elapsed': now - self._start,
+                'eta': None if None in etas else max(etas or [0.]),
+                'stages': stages}
+
+    def report(self):
+        """report the status to the callbacks, progress bar and status file"""
+        self._next = time.perf_counter() + self.interval
+        status = self.status()
+        for callback in self.callbacks:
+            callback(status)
+        if self.bar and status['stages']:
+            self._draw(status['stages'][-1])
+        if self.status_file is not None:
+            _write_json(self.status_file, status)
+        return status
+
+    def _draw(self, stage):
+        from .Simulation import parse_time_diff
+        total = stage['n_total'] or 0
+        fraction = min(1., stage['n_done'] / total) if total else 0.
+        filled = int(round(fraction * BAR_WIDTH))
+        eta = '?' if stage['eta'] is None else parse_time_diff(stage['eta'])
+        line = ('Stage {} |{}{}| {}/{} {:.0%} {:.1f} points/s {:.2f} MB/s '
+                'ETA {}').format(
+            stage['stage'], '#' * filled, '-' * (BAR_WIDTH - filled),
+            stage['n_done'], total, fraction, stage['points_per_s'],
+            stage['mb_per_s'], eta)
+        stream = self._output()
+        stream.write('\r' + line.ljust(79))
+        stream.flush()
@@ -0,0 +1,239 @@
+"""This module exposes ResultStore, a query interface over a simulation results file.
+
+The file is opened once and the parameter table of each calculation is read
+once, so selecting parameter sets is a vectorized comparison of parameter
+columns. Outputs are only read for the selected group numbers, either as
+lazy LazyOutput objects or as columns of a dataframe.
+"""
+import os
+import numpy as np
+import pandas as pd
+from .Layout import open_layout, ColumnarLayout
+from .Storage import open_file
+from .ParameterIndex import INDEX_NAME, is_internal, read_columns
+
+
+def _read_rows(dataset, numbers):
+    """read rows numbers (sorted) of a stacked dataset with few hdf5 reads"""
+    if not len(numbers):
+        return np.zeros((0,) + dataset.shape[1:], dtype=dataset.dtype)
+    low, high = int(numbers[0]), int(numbers[-1]) + 1
+    if high - low == len(numbers):
+        return dataset[low:high]
+    if high - low <= 4 * len(numbers):
+        # dense selection, reading the span is faster than point selection
+        return dataset[low:high][numbers - low]
+    return dataset[numbers]
+
+
+def _mask(column, condition):
+    """boolean mask of the values of column which satisfy condition"""
+    if callable(condition):
+        return np.asarray(condition(column), dtype=bool)
+    if isinstance(condition, tuple):
+        low, high = condition
+        mask = np.ones(len(column), dtype=bool)
+        if low is not None:
+            mask &= column >= low
+        if high is not None:
+            mask &= column <= high
+        return mask
+    if isinstance(condition, (list, set, np.ndarray)):
+        return np.isin(column, list(condition))
+    return column == condition
+
+
+class LazyOutput(object):
+    """an output of selected parameter sets which is read when indexed
+
+    Parameters
+    ----------
+    layout : GroupLayout
+        layout of the calculation
+    name : str
+        name of the output
+    numbers : array
+        sorted group numbers of the selected parameter sets
+    """
+
+    def __init__(self, layout, name, numbers):
+        self._layout = layout
+        self.name = name
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self._read(self.numbers[item])
+        return np.asarray(self._layout.read_result(int(self.numbers[item]))[self.name])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self._read(self.numbers)
+        return data if dtype is None else data.astype(dtype)
+
+    def _read(self, numbers):
+        if isinstance(self._layout, ColumnarLayout):
+            return _read_rows(self._layout._group[self.name], numbers)
+        return np.array([np.asarray(self._layout.read_result(int(n))[self.name])
+                         for n in numbers])
+
+
+class ResultStore(object):
+    """query the results file of a Calculation or Simulation
+
+    Parameters
+    ----------
+    filepath : str
+        filepath of the results
+    """
+
+    def __init__(self, filepath):
+        self._filepath = filepath
+        self._file = None
+
+    def open(self):
+        if self._file is None:
+            if not os.path.exists(self._filepath):
+                raise FileNotFoundError('No results file {}'.format(
+                    self._filepath))
+            self._file = open_file(self._filepath, 'r')
+            self._layouts = {}
+            self._columns = {}
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+    def levels(self):
+        """ids of the calculations in the file"""
+        self.open()
+        return sorted((k for k in self._file if not is_internal(k)),
+                      key=lambda k: (not k.isdigit(), int(k) if k.isdigit() else k))
+
+    def layout(self, level):
+        """layout of the results of calculation level"""
+        self.open()
+        level = str(level)
+        if level not in self._layouts:
+            self._layouts[level] = open_layout(self._file[level])
+        return self._layouts[level]
+
+    def parameters(self, level):
+        """parameter columns of calculation level
+
+        Returns
+        -------
+        columns : dict
+            parameter name to array of values in group number order
+        """
+        self.open()
+        level = str(level)
+        if level not in self._columns:
+            layout = self.layout(level)
+            if INDEX_NAME in layout._group:
+                self._columns[level] = read_columns(layout._group)
+            else:
+                # interrupted group layout, rebuild from group attributes
+                rows = {n: layout.read_params(n) for n in layout.numbers()}
+                names = list(next(iter(rows.values())).keys()) if rows else []
+                size = max(rows) + 1 if rows else 0
+                columns = {}
+                for name in names:
+                    column = np.empty(size, dtype=object)
+                    for n, p in rows.items():
+                        column[n] = p[name]
+                    columns[name] = column
+                self._columns[level] = columns
+        return self._columns[level]
+
+    def outputs(self, level):
+        """names of the outputs of calculation level"""
+        return self.layout(level).output_names()
+
+    def select(self, level, where=None, **conditions):
+        """group numbers of complete parameter sets matching every condition
+
+        Parameters
+        ----------
+        level : int
+            id of the calculation
+        where : dict
+            parameter name to condition, which is a value for equality, a
+            (low, high) tuple for an inclusive range with None for no
+            bound, a list of allowed values or a function of the column
+            returning a boolean mask
+        conditions : dict
+            further conditions given as keyword arguments
+
+        Returns
+        -------
+        numbers : array
+            sorted group numbers
+        """
+        columns = self.parameters(level)
+        size = len(next(iter(columns.values()))) if columns else 0
+        mask = self.layout(level).complete_mask(size)
+        conditions.update(where or {})
+        for name, condition in conditions.items():
+            if name not in columns:
+                raise KeyError('No parameter {}'.format(name))
+            mask &= _mask(columns[name], condition)
+        return np.flatnonzero(mask)
+
+    def output(self, level, name, where=None, **conditions):
+        """lazily read output name of the parameter sets matching where,
+        see select
+
+        Returns
+        -------
+        output : LazyOutput
+            output indexed in the order of the selected group numbers
+        """
+        return LazyOutput(self.layout(level), name,
+                          self.select(level, where, **conditions))
+
+    def dataframe(self, level, columns=None, where=None, **conditions):
+        """dataframe of parameters and outputs of the matching parameter sets
+
+        Parameters
+        ----------
+        level : int
+            id of the calculation
+        columns : list
+            outputs to include, None for every output. Array outputs are
+            included as a column of arrays
+        where : dict
+            conditions on parameters, see select
+        conditions : dict
+            further conditions given as keyword arguments
+
+        Returns
+        -------
+        df : pd.DataFrame
+            indexed by the parameters
+        """
+        numbers = self.select(level, where, **conditions)
+        params = self.parameters(level)
+        data = {k: v[numbers] for k, v in params.items()}
+        if columns is None:
+            columns = self.outputs(level)
+        for name in columns:
+            values = np.asarray(LazyOutput(self.layout(level), name, numbers))
+            data[name] = values if values.ndim == 1 else list(values)
+        df = pd.DataFrame(data)
+        df['_group_number_'] = numbers
+        return df.set_index(list(params.keys()))
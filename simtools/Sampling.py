@@ -0,0 +1,193 @@
+"""This module exposes samplers which choose parameter sets instead of a full grid.
+
+A sampler is passed to Calculation.run or Simulation.run in place of an
+expansion type. It starts from a space filling design (latin hypercube,
+Halton or Sobol) over the range of each expanded parameter and in every
+following round reads the results already written and adds points where
+the output changes fastest.
+"""
+import numpy as np
+try:
+    from scipy.stats import qmc
+    _SCIPY = True
+except ImportError:
+    _SCIPY = False
+
+_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53, 59, 61,
+           67, 71, 73, 79, 83, 89, 97]
+
+
+def latin_hypercube(n, d, rng):
+    """n points of a latin hypercube design in the unit cube of dimension d"""
+    cut = (np.arange(n)[:, None] + rng.random_sample((n, d))) / n
+    for j in range(d):
+        cut[:, j] = cut[rng.permutation(n), j]
+    return cut
+
+
+def halton(n, d, rng, skip=1):
+    """n points of the Halton sequence in the unit cube of dimension d"""
+    assert d <= len(_PRIMES), 'Halton design supports up to {} dimensions'.format(
+        len(_PRIMES))
+    index = np.arange(skip, n + skip)
+    ans = np.zeros((n, d))
+    for j, base in enumerate(_PRIMES[:d]):
+        i = index.copy()
+        f = 1.
+        while i.any():
+            f /= base
+            ans[:, j] += f * (i % base)
+            i //= base
+    return ans
+
+
+def sobol(n, d, rng):
+    """n points of a scrambled Sobol sequence in the unit cube of dimension d"""
+    if not _SCIPY:
+        raise ImportError('Sobol design needs scipy, use lhs or halton')
+    seed = rng.randint(2 ** 31)
+    return qmc.Sobol(d, scramble=True, seed=seed).random(n)
+
+
+_DESIGNS = {
+    'lhs': latin_hypercube,
+    'halton': halton,
+    'sobol': sobol
+}
+
+
+class AdaptiveSampler(object):
+    """sampler of a ParameterGroup with iterative refinement
+
+    Parameters which expand to more than one value are sampled between the
+    minimum and maximum of their expansion (integers stay integers), all
+    other parameters keep their value.
+
+    Parameters
+    ----------
+    n_initial : int
+        number of points of the initial design
+    rounds : int
+        number of rounds, 1 evaluates only the initial design
+    n_refine : int
+        number of points added per refinement round, defaults to n_initial
+    target : str
+        name of the scalar output used for refinement, defaults to the
+        first output in alphabetical order
+    design : str
+        initial design, options are lhs, halton, sobol (needs scipy)
+    neighbours : int
+        number of nearest points compared to find where the output changes
+    seed : int
+        seed of the random number generator
+    """
+
+    def __init__(self, n_initial=16, rounds=1, n_refine=None, target=None,
+                 design='lhs', neighbours=4, seed=None):
+        assert design in _DESIGNS, 'design must be one of {}'.format(
+            list(_DESIGNS.keys()))
+        self.n_initial = n_initial
+        self.rounds = rounds
+        self.n_refine = n_initial if n_refine is None else n_refine
+        self.target = target
+        self.design = design
+        self.neighbours = neighbours
+        self._seed = seed
+        self.points = []
+
+    def start(self, params):
+        """set up the space of params and generate the initial design
+
+        Parameters
+        ----------
+        params : ParameterGroup
+            parameters to sample
+
+        Returns
+        -------
+        points : list
+            dictionaries of parameters of the initial design
+        """
+        self._rng = np.random.RandomState(self._seed)
+        self._names = []
+        self._low = []
+        self._high = []
+        self._integer = []
+        self._constants = {}
+        self._order = params.param_names()
+        for param in params._params:
+            values = np.asarray(param.eval_expr())
+            if len(values) > 1 and values.dtype.kind in 'iuf':
+                self._names.append(param.name)
+                self._low.append(values.min())
+                self._high.append(values.max())
+                self._integer.append(values.dtype.kind in 'iu')
+            else:
+                self._constants[param.name] = param.value
+        self._low = np.array(self._low, dtype=float)
+        self._high = np.array(self._high, dtype=float)
+        self._integer = np.array(self._integer, dtype=bool)
+        self._unit = np.zeros((0, len(self._names)))
+        self.points = []
+        design = _DESIGNS[self.design](self.n_initial, len(self._names), self._rng)
+        return self._add(design)
+
+    def _add(self, unit):
+        """add points given in unit cube coordinates, skipping duplicates"""
+        scaled = self._low + unit * (self._high - self._low)
+        scaled[:, self._integer] = np.round(scaled[:, self._integer])
+        unit = (scaled - self._low) / np.where(self._high > self._low,
+                                               self._high - self._low, 1.)
+        seen = set(map(tuple, np.round(self._unit, 12)))
+        new = []
+        for u, x in zip(unit, scaled):
+            key = tuple(np.round(u, 12))
+            if key in seen:
+                continue
+            seen.add(key)
+            values = dict(self._constants)
+            for name, value, integer in zip(self._names, x, self._integer):
+                values[name] = int(value) if integer else float(value)
+            new.append({name: values[name] for name in self._order})
+            self._unit = np.vstack([self._unit, u])
+        self.points = self.points + new
+        return new
+
+    def refine(self, values):
+        """add points where the output changes fastest
+
+        The loss of the segment between a point and each of its nearest
+        neighbours is its length in the space of scaled parameters and
+        scaled output, so both steep and unexplored regions are refined.
+        The midpoints of the segments with the largest loss are added.
+
+        Parameters
+        ----------
+        values : array
+            target output at each of the current points
+
+        Returns
+        -------
+        points : list
+            dictionaries of parameters of the new points
+        """
+        values = np.asarray(values, dtype=float)
+        n = len(self._unit)
+        if n < 2 or not self._names:
+            return []
+        span = np.ptp(values)
+        scaled = (values - values.min()) / span if span > 0 else np.zeros(n)
+        diff = self._unit[:, None, :] - self._unit[None, :, :]
+        dist = np.sqrt((diff ** 2).sum(-1))
+        np.fill_diagonal(dist, np.inf)
+        k = min(self.neighbours, n - 1)
+        nearest = np.argsort(dist, axis=1)[:, :k]
+        i = np.repeat(np.arange(n), k)
+        j = nearest.ravel()
+        # every segment once
+        pairs = np.unique(np.sort(np.stack([i, j], axis=1), axis=1), axis=0)
+        i, j = pairs[:, 0], pairs[:, 1]
+        loss = np.sqrt(dist[i, j] ** 2 + (scaled[i] - scaled[j]) ** 2)
+        order = np.argsort(loss)[::-1][:self.n_refine]
+        midpoints = (self._unit[i[order]] + self._unit[j[order]]) / 2
+        return self._add(midpoints)
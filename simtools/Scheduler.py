@@ -0,0 +1,338 @@
+"""This module exposes cost-aware scheduling of evaluations on a process pool.
+
+Scheduler first evaluates a sample of points spread evenly over the sweep and
+fits a CostModel to their durations, either learned from the numeric arguments
+or a user estimator calibrated by the timings. The remaining points are submitted most
+expensive first in chunks of about chunk_time, so slow evaluations do not
+start last and leave every other worker idle at the end of a sweep. Only as
+many chunks as workers are in flight, so a chunk starts when it is submitted
+and its running time is known. Once every chunk is submitted, chunks running
+longer than speculate times their predicted time are submitted again to idle
+workers and the first copy to finish is used. Evaluations longer than timeout
+are interrupted in the worker and return TimedOut. Results are yielded with
+their position as they complete, so the writer stores them by group number
+and no result waits in memory for the ones before it.
+"""
+import collections
+import signal
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+
+
+class TimedOut(object):
+    """result of an evaluation interrupted after timeout seconds
+
+    Parameters
+    ----------
+    timeout : float
+        seconds after which the evaluation was interrupted
+    kwargs : dict
+        keyword arguments of the evaluation, None in the worker
+    """
+
+    def __init__(self, timeout, kwargs=None):
+        self.timeout = timeout
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return 'TimedOut({})'.format(self.timeout)
+
+
+class _Interrupt(Exception):
+    pass
+
+
+def _interrupt(signum, frame):
+    raise _Interrupt()
+
+
+def _call(func, kwargs, timeout):
+    """func(**kwargs), TimedOut if it takes longer than timeout seconds
+    timeouts need SIGALRM and the main thread, elsewhere they are ignored"""
+    if (timeout is None or not hasattr(signal, 'SIGALRM')
+            or threading.current_thread() is not threading.main_thread()):
+        return func(**kwargs)
+    previous = signal.signal(signal.SIGALRM, _interrupt)
+    try:
+        try:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            return func(**kwargs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _Interrupt:
+        return TimedOut(timeout)
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _call_chunk(func, chunk, timeout):
+    """durations and results of func(**kwargs) for each element of chunk"""
+    durations = []
+    results = []
+    for kwargs in chunk:
+        start = time.perf_counter()
+        results.append(_call(func, kwargs, timeout))
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+def in_order(pairs):
+    """results of (position, result) pairs in order of position, each result
+    is kept until the results before it are complete"""
+    buffer = {}
+    next_position = 0
+    for position, result in pairs:
+        buffer[position] = result
+        while next_position in buffer:
+            yield buffer.pop(next_position)
+            next_position += 1
+
+
+def _features(kwargs, names):
+    row = []
+    for name in names:
+        x = float(kwargs[name])
+        row.extend([x, np.log1p(abs(x))])
+    return row
+
+
+class CostModel(object):
+    """predict the duration of evaluations from their keyword arguments
+
+    Parameters
+    ----------
+    estimator : function
+        called with the keyword arguments of an evaluation, returns its
+        relative cost which is scaled to seconds by the measured durations,
+        None to learn a log-linear model of the numeric arguments
+    """
+
+    def __init__(self, estimator=None):
+        self._estimator = estimator
+        self._scale = 0.
+        self._names = []
+        self._coef = None
+        self._mean = None
+        self._std = None
+        self._keep = None
+
+    @staticmethod
+    def _numeric(kwargs):
+        return sorted(k for k, v in kwargs.items()
+                      if isinstance(v, (int, float, np.number))
+                      and not isinstance(v, (bool, np.bool_)))
+
+    def fit(self, kwargs_list, durations):
+        """fit the model to the durations of evaluations of kwargs_list"""
+        durations = np.maximum(np.asarray(durations, dtype=float), 1e-9)
+        if self._estimator is not None:
+            estimates = np.array([float(self._estimator(**k)) for k in kwargs_list])
+            self._scale = durations.sum() / max(estimates.sum(), 1e-300)
+            return self
+        self._names = self._numeric(kwargs_list[0]) if kwargs_list else []
+        X = np.array([_features(k, self._names) for k in kwargs_list],
+                     dtype=float).reshape(len(kwargs_list), -1)
+        # arguments which do not vary in the sample say nothing about cost
+        self._mean = X.mean(axis=0)
+        self._std = X.std(axis=0)
+        self._keep = self._std > 0
+        self._coef = np.linalg.lstsq(self._standardize(X), np.log(durations),
+                                     rcond=None)[0]
+        return self
+
+    def _standardize(self, X):
+        Z = (X[:, self._keep] - self._mean[self._keep]) / self._std[self._keep]
+        return np.hstack([np.ones((len(X), 1)), Z])
+
+    def predict(self, kwargs):
+        """predicted duration in seconds of the evaluation of kwargs"""
+        if self._estimator is not None:
+            return float(self._estimator(**kwargs)) * self._scale
+        if self._coef is None:
+            return 0.
+        X = np.array([_features(kwargs, self._names)], dtype=float)
+        log_cost = np.dot(self._standardize(X)[0], self._coef)
+        return float(np.exp(np.clip(log_cost, -50, 50)))
+
+
+class Scheduler(object):
+    """evaluate on a process pool in order of predicted cost
+
+    Parameters
+    ----------
+    pool : concurrent.futures.Executor
+        process pool evaluating the chunks
+    n_workers : int
+        number of processes of the pool
+    cost : function
+        estimator of the relative cost of an evaluation, see CostModel,
+        'learn' to learn it from the sample, None for no reordering
+    timeout : float
+        seconds after which an evaluation is interrupted, None for no limit
+    speculate : float
+        run again chunks which take this many times their predicted time
+        once every chunk is submitted, None to never run chunks twice
+    chunk_time : float
+        predicted seconds of computation per chunk
+    max_chunk_size : int
+        largest number of evaluations per chunk
+    sample_size : int
+        number of evaluations timed before the others are scheduled, at
+        least one per worker
+    serial_cost : float
+        seconds per evaluation below which the evaluations after the sample
+        are done in the calling process, None to always use the pool
+    poll : float
+        seconds between checks for stragglers
+    """
+
+    def __init__(self, pool, n_workers, cost=None, timeout=None, speculate=None,
+                 chunk_time=.05, max_chunk_size=4096, sample_size=8,
+                 serial_cost=None, poll=.01):
+        self._pool = pool
+        self.n_workers = n_workers
+        self.cost = cost
+        self.timeout = timeout
+        self.speculate = speculate
+        self.chunk_time = chunk_time
+        self.max_chunk_size = max_chunk_size
+        self.sample_size = max(sample_size, n_workers)
+        self.serial_cost = serial_cost
+        self.poll = poll
+        self.n_speculated = 0
+
+    def _chunks(self, indices, predicted):
+        """consecutive chunks of indices of about chunk_time predicted seconds"""
+        chunk = []
+        total = 0.
+        for i in indices:
+            chunk.append(i)
+            total += predicted[i]
+            if total >= self.chunk_time or len(chunk) == self.max_chunk_size:
+                yield chunk, total
+                chunk = []
+                total = 0.
+        if chunk:
+            yield chunk, total
+
+    def _execute(self, func, kwargs_list, chunks):
+        """yield indices, durations and results of chunks as they complete"""
+        queue = collections.deque(chunks)
+        # future to position of its chunk, None for copies which lost
+        pending = {}
+        running = {}
+        try:
+            while queue or running:
+                while queue and len(pending) < self.n_workers:
+                    indices, predicted = queue.popleft()
+                    future = self._pool.submit(
+                        _call_chunk, func, [kwargs_list[i] for i in indices],
+                        self.timeout)
+                    pending[future] = indices[0]
+                    running[indices[0]] = (indices, predicted,
+                                           time.perf_counter(), [future])
+                if not queue and self.speculate is not None:
+                    self._speculate(func, kwargs_list, pending, running)
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED,
+                               timeout=self.poll if self.speculate else None)
+                for future in done:
+                    key = pending.pop(future)
+                    if key is None or key not in running:
+                        continue
+                    indices, _, _, copies = running.pop(key)
+                    for other in copies:
+                        if other is not future and other in pending:
+                            # a running copy can not be stopped
+                            other.cancel()
+                            pending[other] = None
+                    durations, results = future.result()
+                    yield indices, durations, results
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _speculate(self, func, kwargs_list, pending, running):
+        """submit copies of stragglers to idle workers"""
+        idle = self.n_workers - len(pending)
+        now = time.perf_counter()
+        for key, (indices, predicted, start, copies) in sorted(
+                running.items(), key=lambda item: item[1][2]):
+            if idle <= 0:
+                return
+            if len(copies) > 1:
+                continue
+            if now - start > self.speculate * max(predicted, self.poll):
+                future = self._pool.submit(
+                    _call_chunk, func, [kwargs_list[i] for i in indices],
+                    self.timeout)
+                pending[future] = key
+                copies.append(future)
+                self.n_speculated += 1
+                idle -= 1
+
+    def map(self, func, kwargs_list):
+        """results of func(**kwargs) for each element of kwargs_list in order
+
+        Every result is kept until the results before it are complete, so
+        results may be held in memory until the end of the map, see
+        map_unordered.
+        """
+        return in_order(self.map_unordered(func, kwargs_list))
+
+    def map_unordered(self, func, kwargs_list):
+        """position in kwargs_list and result of func(**kwargs) of each
+        element of kwargs_list as they complete
+
+        Parameters
+        ----------
+        func : function
+            function to evaluate, must be picklable
+        kwargs_list : iterable
+            keyword arguments of each evaluation, a sequence (len and
+            indexing) is only indexed when its elements are submitted or
+            their cost is predicted, other iterables are read up front
+        """
+        if not (hasattr(kwargs_list, '__len__')
+                and hasattr(kwargs_list, '__getitem__')):
+            kwargs_list = list(kwargs_list)
+        n = len(kwargs_list)
+        if n == 0:
+            return
+        # evenly spaced, so the ends of the sweep are both sampled
+        sample = sorted(set(np.linspace(0, n - 1, min(n, self.sample_size))
+                            .round().astype(int).tolist()))
+        measured = {}
+        for indices, durations, results in self._execute(
+                func, kwargs_list, [([i], 0.) for i in sample]):
+            measured[indices[0]] = durations[0]
+            yield indices[0], self._result(results[0], kwargs_list, indices[0])
+        sampled = set(sample)
+        rest = [i for i in range(n) if i not in sampled]
+        mean = sum(measured.values()) / max(1, len(measured))
+        if self.cost is None:
+            predicted = dict.fromkeys(rest, mean)
+        else:
+            model = CostModel(None if self.cost == 'learn' else self.cost)
+            model.fit([kwargs_list[i] for i in sample],
+                      [measured[i] for i in sample])
+            predicted = {i: model.predict(kwargs_list[i]) for i in rest}
+            # most expensive first, stable for equal costs
+            rest.sort(key=lambda i: -predicted[i])
+        if self.serial_cost is not None and mean < self.serial_cost:
+            # cheaper than sending them to the pool, order does not matter
+            for i in sorted(rest):
+                yield i, self._result(_call(func, kwargs_list[i], self.timeout),
+                                      kwargs_list, i)
+            return
+        for indices, _, results in self._execute(
+                func, kwargs_list, self._chunks(rest, predicted)):
+            for i, result in zip(indices, results):
+                yield i, self._result(result, kwargs_list, i)
+
+    @staticmethod
+    def _result(result, kwargs_list, i):
+        if isinstance(result, TimedOut):
+            return TimedOut(result.timeout, kwargs_list[i])
+        return result
@@ -0,0 +1,122 @@
+"""This module exposes the transfer of large outputs from worker processes through shared memory.
+
+A worker process copies every array output of at least min_bytes into a
+memory-mapped file in shared memory (``/dev/shm`` where available) and
+returns a SharedArray handle in its place, so only the path is pickled.
+The writing process maps the file and writes the mapped array to storage,
+which avoids pickling, sending and unpickling every output. Evaluations in
+the writing process itself, e.g. when cheap evaluations are not sent to
+workers, return their outputs as they are.
+"""
+import glob
+import os
+import tempfile
+import uuid
+import numpy as np
+
+
+def shared_directory():
+    """directory of the memory-mapped files, in memory where possible"""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def shared_prefix():
+    """new path prefix for memory-mapped files in shared_directory"""
+    return os.path.join(shared_directory(),
+                        'simtools-{}-'.format(uuid.uuid4().hex))
+
+
+def share_array(array, prefix):
+    """copy array to a new memory-mapped npy file and return its path"""
+    path = '{}{}.npy'.format(prefix, uuid.uuid4().hex)
+    mapped = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype,
+                                       shape=array.shape)
+    mapped[...] = array
+    del mapped
+    return path
+
+
+def cleanup(prefix):
+    """remove the memory-mapped files of prefix"""
+    for path in glob.glob('{}*.npy'.format(prefix)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class SharedArray(object):
+    """handle of an array in a memory-mapped file
+
+    Parameters
+    ----------
+    path : str
+        path of the npy file holding the array
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """map the array and remove its file, the mapping stays valid"""
+        array = np.load(self.path, mmap_mode='r')
+        try:
+            os.remove(self.path)
+        except OSError:
+            # files which are still mapped are removed by cleanup
+            pass
+        return array
+
+
+class SharedOutputs(object):
+    """wrap a function so its large array outputs are returned as SharedArray
+    from processes other than the one which created it
+
+    Parameters
+    ----------
+    func : function
+        function returning a dictionary of outputs or a list of them
+    min_bytes : int
+        size from which array outputs are transferred through shared memory
+    prefix : str
+        path prefix of the memory-mapped files, None for a new prefix in
+        shared_directory
+    """
+
+    def __init__(self, func, min_bytes, prefix=None):
+        self._func = func
+        self.min_bytes = min_bytes
+        self.prefix = shared_prefix() if prefix is None else prefix
+        # process receiving the outputs, which needs no copy of them
+        self._pid = os.getpid()
+
+    def __call__(self, *args, **kwargs):
+        result = self._func(*args, **kwargs)
+        if os.getpid() == self._pid:
+            return result
+        if isinstance(result, list):
+            return [self._share(r) for r in result]
+        return self._share(result)
+
+    def _share(self, result):
+        return {k: self._share_value(v) for k, v in result.items()}
+
+    def _share_value(self, value):
+        if (not isinstance(value, np.ndarray) or value.dtype.hasobject
+                or value.nbytes < self.min_bytes):
+            return value
+        return SharedArray(share_array(value, self.prefix))
+
+    def cleanup(self):
+        """remove files of outputs which were never received"""
+        cleanup(self.prefix)
+
+
+def receive(result):
+    """replace SharedArray handles of a result by the mapped arrays"""
+    if not isinstance(result, dict):
+        return result
+    return {k: v.load() if isinstance(v, SharedArray) else v
+            for k, v in result.items()}
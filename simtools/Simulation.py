@@ -1,9 +1,24 @@
 from .ParameterGroup import ParameterGroup
-from .Calculation import Calculation
+from .Calculation import Calculation, _call_batch
+from .ParameterIndex import ParameterIndex, _normalize
+from .Layout import open_layout, CHUNK_CACHE_BYTES
+from .Storage import open_file
+from .Stats import RunStats, StageStats, STATS_ATTR
+from .Executor import SerialExecutor, JoblibExecutor, _PARALLEL
+from .Scheduler import TimedOut
+from .Sampling import AdaptiveSampler
+from .ResultStore import ResultStore
+from .Estimate import Estimate, StageEstimate, _path_size, _data_storage
+from .Storage import NPY_SUFFIX
 import pandas as pd
-import h5py
 import numpy as np
+import copy
+import os
+import random
+import shutil
+import tempfile
 import time
+import tracemalloc
 
 
 def parse_time_diff(x):
@@ -22,6 +37,213 @@ def parse_time_diff(x):
         return "{:.2f} s".format(x)
 
 
+def _dataset_value(dataset):
+    """read a result dataset, scalars are returned as python numbers"""
+    d_set = np.asarray(dataset)
+    if d_set.shape == ():
+        return d_set.item()
+    return d_set
+
+
+def _stage_hook(hook):
+    """hook of a calculation run by a Simulation, which reports the end of
+    the run itself, so only the stage events are passed on"""
+    def stage_hook(event, stats):
+        if event != 'run_end':
+            hook(event, stats)
+    return stage_hook
+
+
+def _params_key(params):
+    """hashable key of a dictionary of parameters"""
+    return tuple(sorted((k, _normalize(v)) for k, v in params.items()))
+
+
+class _Handoff(object):
+    """results of pipeline levels kept in memory for the following levels
+
+    Results are kept until the memory budget is used up, later results are
+    only read back from the file, which always holds every result.
+
+    Parameters
+    ----------
+    max_bytes : int
+        memory budget for results of every level
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.n_spilled = 0
+        self._results = {}
+
+    def sink(self, level):
+        """function storing the results of level, see Calculation.set_downstream"""
+        results = self._results.setdefault(level, {})
+
+        def put(params, result):
+            values = {k: _dataset_value(v) for k, v in result.items()}
+            nbytes = sum(np.asarray(v).nbytes for v in values.values())
+            key = _params_key(params)
+            if key in results:
+                self.nbytes -= results.pop(key)[0]
+            if self.nbytes + nbytes > self.max_bytes:
+                self.n_spilled += 1
+                return
+            self.nbytes += nbytes
+            results[key] = (nbytes, values)
+        return put
+
+    def get(self, level, params):
+        """results of level for params, None if they are not in memory"""
+        entry = self._results.get(level, {}).get(_params_key(params))
+        return None if entry is None else entry[1]
+
+    def release(self, level):
+        """free the results of level once no later level needs them"""
+        results = self._results.get(level, {})
+        self.nbytes -= sum(nbytes for nbytes, _ in results.values())
+        results.clear()
+
+    def clear(self):
+        """free the results of every level"""
+        for level in self._results:
+            self.release(level)
+
+
+class _UpstreamReader(object):
+    """access to the results of previous pipeline levels
+
+    The file and parameter indexes are opened once on first use and held
+    until close, so each downstream evaluation is a dictionary lookup
+    followed by reading only its own results.
+
+    Parameters
+    ----------
+    filepath : str
+        filepath of the simulation results
+    levels : list
+        pipeline levels to read results from, results of later levels
+        replace results of the same name from earlier ones
+    handoff : _Handoff
+        results kept in memory, which are used instead of the file if present
+    missing : dict
+        pipeline level to set of keys of parameters without results
+    """
+
+    def __init__(self, filepath, levels, handoff=None, missing=None):
+        self._filepath = filepath
+        self._levels = list(levels)
+        self._handoff = handoff
+        self._missing = {} if missing is None else missing
+        self._file = None
+
+    def open(self):
+        if self._file is None:
+            # append mode, hdf5 refuses to open the file for writing in a
+            # process which holds it read only, as the writer of the current
+            # level may do while this reader is open
+            self._file = open_file(self._filepath, 'a')
+            self._sources = []
+            for level in self._levels:
+                group = self._file['/{}'.format(level)]
+                self._sources.append((open_layout(group),
+                                      ParameterIndex.read(group)))
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        # the file is opened on the first result which is not in memory
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def available(self, params):
+        """False if a previous level has no results for params"""
+        sets = [self._missing[level] for level in self._levels
+                if self._missing.get(level)]
+        if not sets:
+            return True
+        key = _params_key(params)
+        return not any(key in s for s in sets)
+
+    def fetch(self, params):
+        """get the results computed for params
+
+        Parameters
+        ----------
+        params : dict
+            parameters of the downstream evaluation
+
+        Returns
+        -------
+        result : dict
+            results of the previous levels for the same parameters
+        """
+        result = {}
+        for i, level in enumerate(self._levels):
+            values = None
+            if self._handoff is not None:
+                values = self._handoff.get(level, params)
+            if values is None:
+                self.open()
+                layout, index = self._sources[i]
+                number = index.lookup(params)
+                values = {name: _dataset_value(dataset)
+                          for name, dataset in layout.read_result(number).items()}
+            result.update(values)
+        return result
+
+
+class _PointPipeline(object):
+    """evaluate every calculation of a simulation for a single parameter set
+
+    Calculations are evaluated in order, each with the results of its
+    dependencies (or the parameters if it has none), so a downstream
+    calculation starts as soon as its inputs exist for that point.
+
+    Parameters
+    ----------
+    calculations : list
+        Calculation of each stage, only its function and arguments are used
+    dependencies : list
+        list of upstream calculation indices of each calculation
+    funcs : list
+        function evaluated for each calculation, None for their functions
+    """
+
+    def __init__(self, calculations, dependencies, funcs=None):
+        self._funcs = funcs or [calc._func for calc in calculations]
+        # None for functions which take every upstream result
+        self._args = [None if calc._takes_all else set(calc._args)
+                      for calc in calculations]
+        self._dependencies = dependencies
+
+    def __call__(self, **params):
+        results = []
+        durations = []
+        for func, args, deps in zip(self._funcs, self._args,
+                                    self._dependencies):
+            if deps:
+                kwargs = {}
+                for j in deps:
+                    kwargs.update({k: _dataset_value(v)
+                                   for k, v in results[j].items()})
+                if args is not None:
+                    kwargs = {k: v for k, v in kwargs.items() if k in args}
+            else:
+                kwargs = params
+            start = time.perf_counter()
+            results.append(func(**kwargs))
+            durations.append(time.perf_counter() - start)
+        return durations, results
+
+
 class Simulation(object):
     """Simulation object which acts a pipline for different Calculations
 
@@ -33,10 +255,48 @@ class Simulation(object):
         list of calculations to perform 
     parameter_groups : list[ParameterGroup]
         list of parameter groups for the calculations (may be only the first one)
+    cache : MemoCache
+        cache of function results shared by the calculations, None for no cache
+    layout : str
+        storage layout of calculations created from functions, see Calculation
+    dependencies : dict
+        calculation index to list of indices of the calculations whose
+        results are its arguments, which must come earlier in the list.
+        Calculations without dependencies are called with the parameters.
+        None for a linear pipeline where each uses the previous results
+    memory_budget : int
+        bytes of results kept in memory and passed directly to the following
+        calculations instead of being read back from the file, None to
+        always read from the file
+    compression : str
+        compression of calculations created from functions, a filter name,
+        'auto', None or a StoragePolicy, see Calculation
+
+    Inside a with block parallel runs share a pool of worker processes
+    which is started by the first parallel run and kept warm for every stage
+    and later run until the block ends or close is called::
+
+        with Simulation(filepath, [f, g], group) as sim:
+            sim.run('outer', parallel=True)
+            sim.run('outer', parallel=True, resume=True)
+
+    Outside a with block parallel runs use the workers joblib keeps between
+    calls, see JoblibExecutor.
     """
 
-    def __init__(self, filepath, calculations, parameter_groups):
+    def __init__(self, filepath, calculations, parameter_groups, cache=None,
+                 layout='group', dependencies=None, memory_budget=2 ** 28,
+                 compression='auto'):
         self._filepath = filepath
+        self._cache = cache
+        self._layout = layout
+        self._compression = compression
+        self._handoff = None if memory_budget is None else _Handoff(memory_budget)
+        self._pool = None
+        self._keep_pool = False
+        # pipeline level to keys of parameters left without results
+        self._missing = {}
+        self._dependency_map = self._validate_dependencies(dependencies)
         self._params = self._validate_parameter_groups(parameter_groups)
         self._calculations = self._generate_calculation_pipline(calculations)
 
@@ -44,46 +304,63 @@ class Simulation(object):
         """check if are already calculations, if not then create calculation
         for calculation after initial caluclation, function arguments may be results from
         previous calculation.  However, all functions MUST have the same argument as first function
-        so we will wrap the pipeline function in a utility function which will fetch previuosly calculated
-        data and then call the funciton itself
+        so the calculation is given an upstream reader which fetches previously calculated
+        data in the writing process before the function itself is called
         """
         try:
             ans = []
+            self._upstream = []
+            self._dependencies = []
             for (i, calc) in enumerate(calculations):
+                deps = self._calculation_dependencies(i)
+                self._dependencies.append(deps)
                 if i == 0:
                     calculation = self._validate_calculation(calc, i)
                     func_args = calculation.get_function_args()
                     ans.append(calculation)
+                elif not deps:
+                    self._upstream.append(None)
+                    ans.append(self._validate_calculation(calc, i))
                 else:
                     assert func_args
-
-                    def modified_calc(**kwargs):
-                        """modified function which can access previous data
-                        very slow for now, but will be made faster at some point
-                        by indexing the parameters on the index
-                        """
-                        result_args = {}
-                        with h5py.File(self._filepath) as file_:
-                            group = file_['/{}'.format(i - 1)]
-                            for key in group:
-                                param_inputs = {k: v for k,
-                                                v in group[key].attrs.items()}
-                                if param_inputs == kwargs:
-                                    for name, dataset in group[key].items():
-                                        d_set = np.array(dataset)
-                                        if d_set.shape == ():
-                                            result_args[name] = int(d_set)
-                                        else:
-                                            result_args[name] = d_set
-                                    break
-                        return calc(**result_args)
-
-                    calculation = self._validate_calculation(modified_calc, i)
+                    reader = _UpstreamReader(self._filepath, deps, self._handoff,
+                                             self._missing)
+                    self._upstream.append(reader)
+                    calculation = self._validate_calculation(calc, i)
+                    calculation.set_upstream(reader.fetch, reader.available)
                     ans.append(calculation)
+            if self._handoff is not None:
+                for level in self._last_use():
+                    ans[level].set_downstream(self._handoff.sink(level))
             return ans
         except:
+            self._dependencies = [[]]
             return [self._validate_calculation(calculations, 0)]
 
+    def _calculation_dependencies(self, index):
+        """indices of the calculations whose results are arguments of index"""
+        if self._dependency_map is None:
+            return [index - 1] if index > 0 else []
+        return list(self._dependency_map.get(index, []))
+
+    def _last_use(self):
+        """index of the last calculation which depends on each calculation"""
+        last = {}
+        for i, deps in enumerate(self._dependencies):
+            for j in deps:
+                last[j] = i
+        return last
+
+    def _validate_dependencies(self, dependencies):
+        if dependencies is None:
+            return None
+        for index, deps in dependencies.items():
+            for j in deps:
+                if not 0 <= j < index:
+                    raise ValueError('Calculation {} cannot depend on {}, '
+                                     'dependencies must come earlier'.format(index, j))
+        return dict(dependencies)
+
     def _validate_calculation(self, calc, index):
         """Check that calculation is proper 
 
@@ -96,9 +373,12 @@ class Simulation(object):
         """
         if isinstance(calc, Calculation):
             calc.set_args(self._filepath, index)
-            return calc
         else:
-            return Calculation(calc, self._filepath, index)
+            calc = Calculation(calc, self._filepath, index, layout=self._layout,
+                               compression=self._compression)
+        if self._cache is not None:
+            calc.set_cache(self._cache)
+        return calc
 
     def _validate_parameter_groups(self, p_group):
         # check for iterable
@@ -109,24 +389,409 @@ class Simulation(object):
         else:
             raise Exception('Not a valid parameter Group')
 
-    def run(self, expansion_type=None, parallel=False, n_jobs=4):
-        # TODO Handle the case where its pipelined in the sense that it uses
-        # previous results
+    def run(self, expansion_type=None, parallel=False, n_jobs=4, stream=False,
+            resume=False, hooks=None, executor=None, overlap=False,
+            writer=None, direct_write=False):
+        """run every calculation of the pipeline in order
+
+        Parameters
+        ----------
+        expansion_type : str
+            Type of expansion, options are single, zip, outer or an
+            AdaptiveSampler whose points are used by every calculation
+        parallel : bool
+            parallelize calculations over cores
+        n_jobs : int
+            number of cores to use for parallization
+        stream : bool
+            write results as they are computed, see Calculation.run
+        resume : bool
+            only compute parameter sets missing from the file, see Calculation.run
+        hooks : list
+            functions called as hook(event, stats), with the StageStats of a
+            calculation for 'stage_start' and 'stage_end' and the RunStats
+            of the simulation for 'run_end'
+        executor : SerialExecutor
+            executor of every calculation, see Calculation.run
+        overlap : bool
+            evaluate every calculation of a parameter set as one task so
+            downstream calculations start as soon as their inputs exist
+            instead of waiting for the whole previous calculation. Needs a
+            single expansion for all calculations, results are written as
+            they complete
+        writer : AsyncWriter
+            writer of results on a background thread, every result is
+            written before run returns, see Calculation.run
+        direct_write : bool
+            workers write their own results, needs a storage backend with
+            concurrent writes, see Calculation.run
+        """
         _start_calc = time.time()
-        df_list = []
+        hooks = hooks or []
+        if executor is None:
+            executor = self._executor(parallel, n_jobs)
+        self.stats = RunStats()
+        self._add_params()
+        if overlap:
+            assert not resume, 'resume is not supported with overlap'
+            assert not direct_write, 'direct_write is not supported with overlap'
+            df_list = self._run_overlapped(expansion_type, hooks, executor,
+                                           writer)
+        else:
+            run_kwargs = dict(parallel=parallel, n_jobs=n_jobs, stream=stream,
+                              resume=resume,
+                              hooks=[_stage_hook(h) for h in hooks],
+                              executor=executor,
+                              writer=writer, direct_write=direct_write)
+            df_list = self._run_staged(expansion_type, run_kwargs)
+        self._result = pd.concat(df_list)
+        self._result_time = time.time() - _start_calc
+        self.stats.finish()
+        with open_file(self._filepath, 'a') as file_:
+            file_.attrs[STATS_ATTR] = self.stats.to_json()
+        for hook in hooks:
+            hook('run_end', self.stats)
+
+    def _add_params(self):
+        """give every calculation its parameter group"""
         for i, calc in enumerate(self._calculations):
             try:
                 calc.add_params(self._params[i])
             except:
                 calc.add_params(self._params)
-            # make parallel false for now because need serial access to h5 file
-            # TODO implement file lock
-            parallel = False
-            df = calc.run(expansion_type, parallel, n_jobs)
+
+    def estimate(self, expansion_type=None, sample_size=16, confidence=.95,
+                 seed=0):
+        """estimate the runtime, output size and peak memory of run
+
+        The parameter sets of each calculation are counted without being
+        built and a random sample of them is evaluated in this process,
+        with the results of earlier calculations kept in memory. The
+        results of the sample are written to temporary files with the
+        layout and compression of each calculation, so nothing is written
+        to the results file, and a sampler is left unchanged. Vectorized functions are evaluated one
+        parameter set at a time, which overestimates their runtime.
+
+        Parameters
+        ----------
+        expansion_type : str
+            Type of expansion, see run
+        sample_size : int
+            number of parameter sets evaluated per calculation
+        confidence : float
+            probability that each total lies in its interval
+        seed : int
+            seed of the sample
+
+        Returns
+        -------
+        estimate : Estimate
+            extrapolated cost, e.g. estimate.runtime(n_jobs) and
+            estimate.peak_memory(n_jobs, stream)
+        """
+        self._add_params()
+        if isinstance(expansion_type, AdaptiveSampler):
+            # the sampler of the run is left untouched
+            expansion_type = copy.deepcopy(expansion_type)
+            if not expansion_type.points:
+                expansion_type.start(self._calculations[0]._params)
+        rng = random.Random(seed)
+        # calculations with expansions of the same length share the sample
+        samples = {}
+        results = [{} for _ in self._calculations]
+        contexts = [calc._context() for calc in self._calculations]
+        funcs = [calc._func if c is None else c
+                 for calc, c in zip(self._calculations, contexts)]
+        directory = tempfile.mkdtemp()
+        stages = []
+        try:
+            for i, calc in enumerate(self._calculations):
+                params, n = self._estimate_params(calc, expansion_type)
+                if len(params) not in samples:
+                    samples[len(params)] = sorted(rng.sample(
+                        range(len(params)), min(len(params), sample_size)))
+                sample = [params[j] for j in samples[len(params)]]
+                durations = []
+                sampled = []
+                for p in sample:
+                    kwargs = self._sample_kwargs(i, p, funcs, results)
+                    start = time.perf_counter()
+                    result = self._sample_call(i, kwargs, funcs)
+                    durations.append(time.perf_counter() - start)
+                    results[i][_params_key(p)] = result
+                    sampled.append((kwargs, result))
+                output_bytes = [sum(np.asarray(v).nbytes for v in r.values())
+                                for _, r in sampled]
+                write_times, stored_bytes, fixed_bytes = self._sample_storage(
+                    calc, directory, sample, [r for _, r in sampled],
+                    output_bytes)
+                peak = 0
+                if sampled:
+                    largest = int(np.argmax(output_bytes))
+                    peak = self._sample_peak(i, sampled[largest][0], funcs)
+                stages.append(StageEstimate(
+                    calc._id, n, durations, output_bytes, stored_bytes,
+                    write_times, peak, confidence, seed, fixed_bytes))
+        finally:
+            for context in contexts:
+                if context is not None:
+                    context.close()
+            shutil.rmtree(directory, ignore_errors=True)
+        return Estimate(stages, self._last_use(), None if self._handoff is None
+                        else self._handoff.max_bytes)
+
+    def _estimate_params(self, calc, expansion_type):
+        """parameter sets to sample from and number of parameter sets of a run"""
+        if isinstance(expansion_type, AdaptiveSampler):
+            points = list(expansion_type.points)
+            return points, (expansion_type.n_initial + expansion_type.n_refine *
+                            (expansion_type.rounds - 1))
+        params = calc._generate_params(expansion_type)
+        return params, len(params)
+
+    def _sample_kwargs(self, level, params, funcs, results):
+        """keyword arguments of level for params, earlier levels are
+        evaluated for params if they are not in results yet"""
+        deps = self._dependencies[level]
+        if not deps:
+            return params
+        kwargs = {}
+        for j in deps:
+            key = _params_key(params)
+            if key not in results[j]:
+                results[j][key] = self._sample_call(
+                    j, self._sample_kwargs(j, params, funcs, results), funcs)
+            kwargs.update({k: _dataset_value(v)
+                           for k, v in results[j][key].items()})
+        return self._calculations[level]._select_args(kwargs)
+
+    def _sample_call(self, level, kwargs, funcs):
+        if self._calculations[level]._vectorized:
+            return _call_batch(funcs[level], [kwargs])[0]
+        return funcs[level](**kwargs)
+
+    def _sample_peak(self, level, kwargs, funcs):
+        """bytes allocated at the peak of an evaluation of level"""
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # reset_peak needs Python 3.9, restarting also resets the peak
+            limit = tracemalloc.get_traceback_limit()
+            tracemalloc.stop()
+            tracemalloc.start(limit)
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            self._sample_call(level, kwargs, funcs)
+            return max(0, tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+
+    def _sample_storage(self, calc, directory, params, results, output_bytes):
+        """write times and stored bytes of each result and bytes of the file
+        independent of the number of results
+
+        The results are written to a file and half of them to another, the
+        difference of the bytes used besides the result datasets gives the
+        bytes per parameter set (e.g. groups and parameters), the rest is
+        independent of their number.
+        """
+        if not params:
+            return [], [], 0
+        suffix = NPY_SUFFIX if str(self._filepath).rstrip('/').endswith(
+            NPY_SUFFIX) else '.h5'
+        k = len(params)
+        half = k // 2
+        written = []
+        for m in ((half, k) if half else (k,)):
+            path = os.path.join(directory, '{}_{}{}'.format(calc._id, m, suffix))
+            written.append(self._sample_write(calc, path, params[:m],
+                                              results[:m]))
+        write_times, size, data, ratio, nbytes = written[-1]
+        overhead = size - data
+        if half:
+            _, size_half, data_half, _, _ = written[0]
+            per_point = max(0., (overhead - size_half + data_half) / (k - half))
+        else:
+            per_point = overhead / k
+        fixed = max(0., overhead - per_point * k)
+        # outputs converted for storage, then compressed
+        scale = ratio * nbytes / max(sum(output_bytes), 1)
+        return write_times, [b * scale + per_point for b in output_bytes], fixed
+
+    @staticmethod
+    def _sample_write(calc, path, params, results):
+        """write results to a new file
+
+        Returns
+        -------
+        write_times : list
+            seconds of each write, the time to finish, flush and close the
+            file (e.g. compressing cached chunks) is shared equally
+        size : int
+            bytes of the file
+        data : int
+            bytes of the file used by the result datasets
+        ratio : float
+            data over the bytes of the rows allocated for the results
+        nbytes : int
+            bytes of the results converted for storage
+        """
+        write_times = []
+        nbytes = 0
+        file_ = open_file(path, 'w', rdcc_nbytes=CHUNK_CACHE_BYTES)
+        try:
+            layout = calc._new_layout(file_, params, None)
+            for number, (p, r) in enumerate(zip(params, results)):
+                start = time.perf_counter()
+                nbytes += layout.write(number, p, r)
+                write_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            layout.finish(params)
+            file_.flush()
+            data, allocated = _data_storage(file_[str(calc._id)])
+        finally:
+            file_.close()
+        close_time = time.perf_counter() - start
+        write_times = [t + close_time / len(params) for t in write_times]
+        if not allocated:
+            # no storage sizes, results are stored as they are
+            data, allocated = nbytes, nbytes
+        return write_times, _path_size(path), data, data / allocated, nbytes
+
+    def _run_staged(self, expansion_type, run_kwargs):
+        """run each calculation over every parameter set before the next"""
+        df_list = []
+        last_use = self._last_use()
+        self._missing.clear()
+        if self._handoff is not None:
+            self._handoff.clear()
+        for i, calc in enumerate(self._calculations):
+            if i > 0:
+                # later calculations reuse the points chosen by a sampler
+                if isinstance(expansion_type, AdaptiveSampler):
+                    expansion_type = expansion_type.points
+            if i > 0 and self._upstream[i - 1] is not None:
+                with self._upstream[i - 1]:
+                    df = calc.run(expansion_type, **run_kwargs)
+            else:
+                df = calc.run(expansion_type, **run_kwargs)
             df['_pipeline_'] = i
             df_list.append(df)
-        self._result = pd.concat(df_list)
-        self._result_time = time.time() - _start_calc
+            self.stats.add(calc.stats)
+            self._missing[i] = set(_params_key(p) for p in calc.timed_out)
+            if self._handoff is not None:
+                for level, last in last_use.items():
+                    if last == i:
+                        self._handoff.release(level)
+        return df_list
+
+    def _run_overlapped(self, expansion_type, hooks, executor, writer):
+        """run every calculation of a parameter set as a single task
+        the results of each task are written to every calculation group by
+        this process as soon as the task completes
+        """
+        assert not isinstance(expansion_type, AdaptiveSampler), \
+            'overlap does not support samplers'
+        calcs = self._calculations
+        params = calcs[0]._generate_params(expansion_type)
+        for calc in calcs[1:]:
+            assert calc._params is calcs[0]._params, \
+                'overlap needs the same parameter group for every calculation'
+        for calc in calcs:
+            assert not calc._vectorized, 'overlap does not support vectorized'
+            assert calc._cache is None, 'overlap does not support a cache'
+        contexts = [calc._context() for calc in calcs]
+        pipeline = _PointPipeline(calcs, self._dependencies, [
+            calc._func if c is None else c for calc, c in zip(calcs, contexts)])
+        stats = [StageStats(calc._id, executor.n_workers) for calc in calcs]
+        for s in stats:
+            s.n_total = len(params)
+        for hook in hooks:
+            for s in stats:
+                hook('stage_start', s)
+        try:
+            with open_file(self._filepath, 'a',
+                           rdcc_nbytes=CHUNK_CACHE_BYTES) as file_:
+                layouts = [calc._new_layout(file_, params, None) for calc in calcs]
+                # written by group number as tasks complete
+                results = executor.map_unordered(pipeline, params)
+                if writer is not None:
+                    writer.start(file_)
+                timed_out = []
+                try:
+                    for number, timed in results:
+                        p = params[number]
+                        if isinstance(timed, TimedOut):
+                            # no calculation is written for the parameters
+                            timed_out.append(number)
+                            for s in stats:
+                                s.n_timeouts += 1
+                            continue
+                        durations, result = timed
+                        for layout, s, d, r in zip(layouts, stats, durations,
+                                                   result):
+                            s.record(d)
+                            if writer is not None:
+                                writer.put(layout, number, p, r, s)
+                                continue
+                            start = time.perf_counter()
+                            s.bytes_written += layout.write(number, p, r)
+                            s.write_time += time.perf_counter() - start
+                finally:
+                    if writer is not None:
+                        writer.close()
+                for calc, layout, s in zip(calcs, layouts, stats):
+                    start = time.perf_counter()
+                    layout.finish(params)
+                    s.write_time += time.perf_counter() - start
+                    s.finish()
+                    file_[str(calc._id)].attrs[STATS_ATTR] = s.to_json()
+        finally:
+            for context in contexts:
+                if context is not None:
+                    context.close()
+        df_list = []
+        for i, (calc, s) in enumerate(zip(calcs, stats)):
+            calc.stats = s
+            calc.timed_out = [params[n] for n in sorted(timed_out)]
+            self.stats.add(s)
+            df = pd.DataFrame([dict(_group_number_=n, **p)
+                               for n, p in enumerate(params)])
+            df['_pipeline_'] = i
+            df_list.append(df)
+            for hook in hooks:
+                hook('stage_end', s)
+        return df_list
+
+    def _executor(self, parallel, n_jobs):
+        """executor of a run, the pool of the simulation for parallel runs"""
+        if not parallel or not _PARALLEL:
+            return SerialExecutor()
+        if not self._keep_pool:
+            return JoblibExecutor(n_jobs)
+        if self._pool is not None and self._pool.n_jobs != n_jobs:
+            self.close()
+        if self._pool is None:
+            self._pool = JoblibExecutor(n_jobs).start()
+        return self._pool
+
+    def close(self):
+        """stop the worker processes of parallel runs"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        self._keep_pool = True
+        return self
+
+    def __exit__(self, *args):
+        self._keep_pool = False
+        self.close()
 
     def describe_result(self):
         try:
@@ -140,6 +805,10 @@ class Simulation(object):
             parse_time_diff(self._result_time))
         out_str += 'Calculation proceeded with {} steps of {} expanded parameter sets each\n'.format(
             len(self._result['_pipeline_'].unique()), len(self._result['_group_number_'].unique()))
+        if self._cache is not None:
+            out_str += 'Cache had {hits} hits and {misses} misses\n'.format(
+                **self._cache.stats())
+        out_str += '{}\n'.format(self.stats)
         print(out_str)
 
     def explore_results(self):
@@ -150,34 +819,20 @@ class Simulation(object):
         except NameError:
             self._IPYTHON = False
 
+    def results(self):
+        """ResultStore to query the results of the simulation"""
+        return ResultStore(self._filepath)
+
     def _retrive_results(self, pipeline_level, calc_number):
-        key = str(calc_number)
         result = {}
-        with h5py.File(self._filepath) as file_:
-            group = file_['/{}'.format(pipeline_level)]
-            params = {k: v for k, v in group[key].attrs.items()}
-            for name, dataset in group[key].items():
-                d_set = np.array(dataset)
-                if d_set.shape == ():
-                    result[name] = int(d_set)
-                else:
-                    result[name] = d_set
+        with open_file(self._filepath, 'r') as file_:
+            layout = open_layout(file_['/{}'.format(pipeline_level)])
+            params = layout.read_params(calc_number)
+            for name, dataset in layout.read_result(calc_number).items():
+                result[name] = _dataset_value(dataset)
         return params, result
 
     def _retrieve_result_dataframe(self, pipeline_level):
         """generate dataframe for pipeline_level"""
-        ans = []
-        with h5py.File(self._filepath) as file_:
-            group = file_['/{}'.format(pipeline_level)]
-            for key in group:
-                result = {}
-                params = {k: v for k, v in group[key].attrs.items()}
-                for name, dataset in group[key].items():
-                    d_set = np.array(dataset)
-                    if d_set.shape == ():
-                        result[name] = int(d_set)
-                    else:
-                        raise Exception(
-                            'Function requires single valued results')
-                ans.append({**params, **result})
-        return pd.DataFrame(ans).set_index(list(params.keys()))
+        with open_file(self._filepath, 'r') as file_:
+            return open_layout(file_['/{}'.format(pipeline_level)]).to_dataframe()
@@ -0,0 +1,218 @@
+"""This module exposes timing instrumentation of simulations.
+
+StageStats records for a single calculation the duration of every evaluation,
+time spent reading upstream results and writing to the file, and bytes
+written. RunStats collects the StageStats of every calculation of a Simulation.
+Both can be serialized to json which is stored as metadata in the result file.
+"""
+import json
+import time
+from array import array
+import numpy as np
+from .Scheduler import TimedOut
+
+STATS_ATTR = '_stats_'
+
+
+class Timed(object):
+    """wrap a function so calling it returns its duration with the result
+    picklable so it can be sent to parallel workers
+
+    Parameters
+    ----------
+    func : function
+        function to time
+    """
+
+    def __init__(self, func):
+        self._func = func
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self._func(*args, **kwargs)
+        return time.perf_counter() - start, result
+
+
+class StageStats(object):
+    """timing statistics of a single calculation run
+
+    Parameters
+    ----------
+    stage : any
+        identifier of the calculation
+    n_workers : int
+        number of workers the calculation ran on
+    """
+
+    def __init__(self, stage, n_workers=1):
+        self.stage = stage
+        self.n_workers = n_workers
+        self.n_evaluations = 0
+        # parameter sets of the run including those already stored, None if
+        # unknown
+        self.n_total = None
+        self.n_skipped = 0
+        self.n_cached = 0
+        self.n_timeouts = 0
+        self.lookup_time = 0.
+        self.write_time = 0.
+        self.bytes_written = 0
+        self.wall_time = None
+        self._durations = array('d')
+        self._compute_time = 0.
+        self._start = time.perf_counter()
+        # called with these stats after evaluations are recorded, see Progress
+        self.observer = None
+
+    def record(self, duration, n=1):
+        """record n evaluations which took duration in total"""
+        self._durations.extend([duration / n] * n)
+        self._compute_time += duration
+        self.n_evaluations += n
+        if self.observer is not None:
+            self.observer(self)
+
+    def record_cached(self, n=1):
+        """record n results found in a cache instead of being evaluated"""
+        self.n_cached += n
+        if self.observer is not None:
+            self.observer(self)
+
+    def unwrap(self, timed_results):
+        """record the durations of (position, result) pairs of a Timed
+        function and yield the positions and results"""
+        for position, timed in timed_results:
+            if isinstance(timed, TimedOut):
+                self.n_timeouts += 1
+                yield position, timed
+                continue
+            duration, result = timed
+            self.record(duration)
+            yield position, result
+
+    def unwrap_batches(self, timed_batches, batch_size=None):
+        """record the durations of (position, batch) pairs of Timed batches
+        of batch_size elements and yield the position and result of each
+        element, None if there is a single batch"""
+        for position, timed in timed_batches:
+            start = 0 if batch_size is None else position * batch_size
+            if isinstance(timed, TimedOut):
+                # every parameter set of the batch timed out
+                n = len(timed.kwargs['batch'])
+                self.n_timeouts += n
+                for j in range(n):
+                    yield start + j, timed
+                continue
+            duration, batch = timed
+            self.record(duration, len(batch))
+            for j, result in enumerate(batch):
+                yield start + j, result
+
+    def finish(self):
+        """set the wall time of the calculation"""
+        self.wall_time = time.perf_counter() - self._start
+
+    @property
+    def compute_time(self):
+        """total time spent evaluating the function summed over workers"""
+        return self._compute_time
+
+    @property
+    def utilization(self):
+        """fraction of the available worker time spent evaluating the function"""
+        wall = self.wall_time
+        if wall is None:
+            wall = time.perf_counter() - self._start
+        if wall <= 0:
+            return 0.
+        return self.compute_time / (wall * self.n_workers)
+
+    def durations(self):
+        """summary of the distribution of evaluation durations
+
+        Returns
+        -------
+        summary : dict
+            min, median, p95 and max of the durations in seconds
+        """
+        if not len(self._durations):
+            return {'min': 0., 'median': 0., 'p95': 0., 'max': 0.}
+        d = np.frombuffer(self._durations, dtype=float)
+        return {'min': float(d.min()), 'median': float(np.median(d)),
+                'p95': float(np.percentile(d, 95)), 'max': float(d.max())}
+
+    def to_dict(self):
+        return {'stage': self.stage,
+                'n_workers': self.n_workers,
+                'n_evaluations': self.n_evaluations,
+                'n_total': self.n_total,
+                'n_skipped': self.n_skipped,
+                'n_cached': self.n_cached,
+                'n_timeouts': self.n_timeouts,
+                'wall_time': self.wall_time,
+                'compute_time': self.compute_time,
+                'lookup_time': self.lookup_time,
+                'write_time': self.write_time,
+                'bytes_written': self.bytes_written,
+                'utilization': self.utilization,
+                'durations': self.durations()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def __str__(self):
+        from .Simulation import parse_time_diff
+        d = self.durations()
+        fmt = ("Stage {}: {} evaluations in {} (compute {}, lookup {}, write {}), "
+               "{} bytes written, utilization {:.0%}\n"
+               "    evaluation min {} median {} p95 {} max {}")
+        return fmt.format(self.stage, self.n_evaluations,
+                          parse_time_diff(self.wall_time or 0.),
+                          parse_time_diff(self.compute_time),
+                          parse_time_diff(self.lookup_time),
+                          parse_time_diff(self.write_time),
+                          self.bytes_written, self.utilization,
+                          parse_time_diff(d['min']), parse_time_diff(d['median']),
+                          parse_time_diff(d['p95']), parse_time_diff(d['max']))
+
+
+class RunStats(object):
+    """timing statistics of a Simulation run, a StageStats per calculation"""
+
+    def __init__(self):
+        self.stages = []
+        self.wall_time = None
+        self._start = time.perf_counter()
+
+    def add(self, stage_stats):
+        self.stages.append(stage_stats)
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {'wall_time': self.wall_time,
+                'bytes_written': sum(s.bytes_written for s in self.stages),
+                'stages': [s.to_dict() for s in self.stages]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def __str__(self):
+        return '\n'.join(str(s) for s in self.stages)
+
+
+def read_stats(group):
+    """read stats stored as metadata of a group of the result file
+
+    Returns
+    -------
+    stats : dict
+        stored statistics, None if there are none
+    """
+    value = group.attrs.get(STATS_ATTR)
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return json.loads(value)
@@ -0,0 +1,412 @@
+"""This module exposes the storage backends of results files.
+
+Results are written through the group and dataset interface of h5py, so any
+backend providing that interface can hold them. open_file picks the backend
+from the suffix of the filepath in BACKENDS and uses hdf5 for every other path.
+
+NpyFile stores a results file as a directory, groups as subdirectories,
+datasets as memory-mapped ``.npy`` files and attributes as json. Every file
+is created atomically and rows of a dataset are written in place, so several
+processes can write results of different parameter sets at the same time,
+which hdf5 only allows from a single process. Data is stored uncompressed.
+Further backends (e.g. a zarr directory store) are added with::
+
+    BACKENDS['.zarr'] = lambda filepath, mode, **kwargs: zarr.open_group(filepath, mode)
+"""
+import json
+import os
+import shutil
+import uuid
+import h5py
+import numpy as np
+
+NPY_SUFFIX = '.npyd'
+ATTRS_NAME = '.attrs.json'
+
+
+def _json_value(value):
+    """convert an attribute value to a json serializable value"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return [_json_value(v) for v in value.tolist()]
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v) for v in value]
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _storable(data, dtype=None):
+    """array which can be saved without pickling, strings become unicode"""
+    if dtype is not None and h5py.check_string_dtype(np.dtype(dtype)) is not None:
+        dtype = None
+    data = np.asarray(data, dtype=dtype)
+    if data.dtype.kind == 'O':
+        data = np.asarray([str(_json_value(v)) for v in data.ravel()],
+                          dtype=str).reshape(data.shape)
+    elif data.dtype.kind == 'S':
+        data = data.astype(str)
+    return data
+
+
+def _link(tmp, path):
+    """move tmp to path unless path exists, True if tmp was moved"""
+    try:
+        os.link(tmp, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+
+
+class NpyAttributes(object):
+    """attributes of a group or dataset kept in a json file
+
+    Parameters
+    ----------
+    path : str
+        path of the json file
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def _read(self):
+        try:
+            with open(self._path, 'r') as file_:
+                return json.load(file_)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, attrs):
+        tmp = '{}.{}.tmp'.format(self._path, uuid.uuid4().hex)
+        with open(tmp, 'w') as file_:
+            json.dump(attrs, file_)
+        os.replace(tmp, self._path)
+
+    def update(self, values):
+        """set several attributes with a single write"""
+        attrs = self._read()
+        attrs.update({k: _json_value(v) for k, v in dict(values).items()})
+        self._write(attrs)
+
+    def __setitem__(self, name, value):
+        self.update({name: value})
+
+    def __getitem__(self, name):
+        return self._read()[name]
+
+    def __delitem__(self, name):
+        attrs = self._read()
+        del attrs[name]
+        self._write(attrs)
+
+    def __contains__(self, name):
+        return name in self._read()
+
+    def __iter__(self):
+        return iter(self._read())
+
+    def __len__(self):
+        return len(self._read())
+
+    def get(self, name, default=None):
+        return self._read().get(name, default)
+
+    def keys(self):
+        return self._read().keys()
+
+    def items(self):
+        return self._read().items()
+
+
+class NpyDataset(object):
+    """dataset stored as a memory-mapped npy file
+
+    Parameters
+    ----------
+    path : str
+        path of the npy file
+    """
+    compression = None
+    compression_opts = None
+    shuffle = False
+    chunks = None
+
+    def __init__(self, path):
+        self._path = path
+        self._array = None
+        self.attrs = NpyAttributes(path[:-len('.npy')] + ATTRS_NAME)
+
+    @property
+    def name(self):
+        return os.path.basename(self._path)[:-len('.npy')]
+
+    def _data(self):
+        if self._array is None:
+            try:
+                self._array = np.load(self._path, mmap_mode='r+')
+            except ValueError:
+                # zero sized arrays can not be mapped
+                self._array = np.load(self._path)
+        return self._array
+
+    @property
+    def shape(self):
+        return self._data().shape
+
+    @property
+    def dtype(self):
+        return self._data().dtype
+
+    @property
+    def ndim(self):
+        return self._data().ndim
+
+    @property
+    def size(self):
+        return self._data().size
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        return np.array(self._data()[key])
+
+    def __setitem__(self, key, value):
+        self._data()[key] = _storable(value)
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.array(self._data())
+        return data if dtype is None else data.astype(dtype)
+
+    def resize(self, size, axis=0):
+        """change the length of axis, rows beyond the old length are zero"""
+        old = self._data()
+        shape = list(old.shape)
+        shape[axis] = size
+        tmp = '{}.{}.tmp'.format(self._path, uuid.uuid4().hex)
+        new = np.lib.format.open_memmap(tmp, mode='w+', dtype=old.dtype,
+                                        shape=tuple(shape))
+        keep = tuple(slice(0, min(size, old.shape[axis])) if i == axis
+                     else slice(None) for i in range(old.ndim))
+        new[keep] = old[keep]
+        new.flush()
+        del new
+        self.flush()
+        self._array = None
+        os.replace(tmp, self._path)
+
+    def flush(self):
+        if isinstance(self._array, np.memmap):
+            self._array.flush()
+
+
+class NpyGroup(object):
+    """group stored as a directory
+
+    Parameters
+    ----------
+    path : str
+        path of the directory
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self.attrs = NpyAttributes(os.path.join(path, ATTRS_NAME))
+
+    @property
+    def name(self):
+        return os.path.basename(self._path)
+
+    def _locate(self, name):
+        """path of the directory or npy file of name, None if it does not exist"""
+        path = os.path.join(self._path, *[p for p in str(name).split('/') if p])
+        if os.path.isdir(path):
+            return path
+        if os.path.isfile(path + '.npy'):
+            return path + '.npy'
+        return None
+
+    def __contains__(self, name):
+        return self._locate(name) is not None
+
+    def __getitem__(self, name):
+        path = self._locate(name)
+        if path is None:
+            raise KeyError('Unable to open object {}'.format(name))
+        if os.path.isdir(path):
+            return NpyGroup(path)
+        return NpyDataset(path)
+
+    def __delitem__(self, name):
+        path = self._locate(name)
+        if path is None:
+            raise KeyError('Unable to delete object {}'.format(name))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+            attrs = path[:-len('.npy')] + ATTRS_NAME
+            if os.path.isfile(attrs):
+                os.remove(attrs)
+
+    def __iter__(self):
+        names = []
+        for entry in os.listdir(self._path):
+            if entry.startswith('.') or entry.endswith('.tmp'):
+                continue
+            if entry.endswith('.npy'):
+                names.append(entry[:-len('.npy')])
+            elif os.path.isdir(os.path.join(self._path, entry)):
+                names.append(entry)
+        return iter(sorted(names))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def keys(self):
+        return list(iter(self))
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+    def create_group(self, name):
+        path = os.path.join(self._path, name)
+        if os.path.exists(path) or os.path.exists(path + '.npy'):
+            raise ValueError('Unable to create group (name already exists)')
+        os.makedirs(path)
+        return NpyGroup(path)
+
+    def require_group(self, name):
+        path = os.path.join(self._path, name)
+        os.makedirs(path, exist_ok=True)
+        return NpyGroup(path)
+
+    def create_dataset(self, name, shape=None, dtype=None, data=None,
+                       **kwargs):
+        """create a dataset, hdf5 filter and chunk options are ignored"""
+        dataset = self._create_dataset(name, shape, dtype, data)
+        if dataset is None:
+            raise ValueError('Unable to create dataset (name already exists)')
+        return dataset
+
+    def require_dataset(self, name, shape, dtype, exact=False, **kwargs):
+        """open dataset name, creating it if it does not exist
+
+        Several processes may require the same dataset, exactly one of
+        them creates it.
+        """
+        dataset = self._create_dataset(name, shape, dtype, None)
+        if dataset is None:
+            dataset = self[name]
+            if tuple(dataset.shape) != tuple(shape):
+                raise TypeError('Shapes do not match (existing {} vs new {})'.format(
+                    dataset.shape, shape))
+        return dataset
+
+    def _create_dataset(self, name, shape, dtype, data):
+        path = os.path.join(self._path, name) + '.npy'
+        if os.path.exists(path):
+            return None
+        tmp = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        if data is not None:
+            np.save(tmp, _storable(data, dtype), allow_pickle=False)
+            # np.save appends .npy
+            os.rename(tmp + '.npy', tmp)
+        else:
+            dtype = np.dtype(float if dtype is None else dtype)
+            if dtype.kind == 'O':
+                # strings are stored with a fixed width
+                dtype = np.dtype('U64')
+            if int(np.prod(shape)) == 0:
+                np.save(tmp + '.npy', np.zeros(shape, dtype=dtype))
+                os.rename(tmp + '.npy', tmp)
+            else:
+                array = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype,
+                                                  shape=tuple(shape))
+                del array
+        if not _link(tmp, path):
+            return None
+        return NpyDataset(path)
+
+    def flush(self):
+        pass
+
+
+class NpyFile(NpyGroup):
+    """results file stored as a directory of npy files
+
+    Parameters
+    ----------
+    filepath : str
+        path of the directory
+    mode : str
+        'r' to read an existing file, 'a' to create it if needed and
+        'w' to replace it
+    """
+    # processes may write different parameter sets at the same time
+    concurrent = True
+
+    def __init__(self, filepath, mode='a', **kwargs):
+        if mode == 'w' and os.path.isdir(filepath):
+            shutil.rmtree(filepath)
+        if mode == 'r' and not os.path.isdir(filepath):
+            raise FileNotFoundError('No results directory {}'.format(filepath))
+        os.makedirs(filepath, exist_ok=True)
+        super(NpyFile, self).__init__(filepath)
+        self.filename = filepath
+        self.mode = mode
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _hdf5_file(filepath, mode='a', **kwargs):
+    return h5py.File(filepath, mode, **kwargs)
+
+
+BACKENDS = {
+    NPY_SUFFIX: NpyFile
+}
+
+
+def open_file(filepath, mode='a', **kwargs):
+    """open a results file with the backend chosen by its suffix
+
+    Parameters
+    ----------
+    filepath : str
+        path of the results, the suffix is looked up in BACKENDS and all
+        other paths are hdf5 files
+    mode : str
+        'r', 'a' or 'w' as for h5py.File
+    kwargs : dict
+        options of the backend (e.g. rdcc_nbytes of h5py.File), ignored by
+        backends which do not use them
+
+    Returns
+    -------
+    file_ : h5py.File
+        root group of the results
+    """
+    for suffix, backend in BACKENDS.items():
+        if str(filepath).rstrip('/').endswith(suffix):
+            return backend(filepath, mode, **kwargs)
+    return _hdf5_file(filepath, mode, **kwargs)
+
+
+def supports_concurrent_writes(file_):
+    """True if several processes may write results of file_ at the same time"""
+    return getattr(file_, 'concurrent', False)
@@ -0,0 +1,112 @@
+"""This module exposes StoragePolicy which decides how outputs are stored in hdf5.
+
+A policy sets the compression filter and level, the shuffle filter, the
+chunk shape and the dtype of each output, with defaults for every output
+and overrides per output name. With compression 'auto' arrays smaller than
+min_bytes are stored contiguous and uncompressed, where filters only cost
+time, and larger arrays are chunked and compressed with gzip and shuffle.
+"""
+import numpy as np
+
+_OPTIONS = ('compression', 'level', 'shuffle', 'chunks', 'dtype')
+
+
+class StoragePolicy(object):
+    """storage options of the outputs of a calculation
+
+    Parameters
+    ----------
+    compression : str
+        hdf5 compression filter (e.g. 'gzip', 'lzf'), 'auto' to compress
+        arrays of at least min_bytes with gzip, None for no compression
+    level : int
+        compression level of gzip, None for the default of the filter
+    shuffle : bool
+        apply the shuffle filter before compression, None to shuffle
+        whenever compressing
+    chunks : tuple
+        chunk shape of array outputs (a row of a stacked dataset for the
+        columnar layout), None for automatic chunks
+    dtype : str
+        dtype outputs are converted to before writing (e.g. 'float32' to
+        halve the size of float64 outputs), None to keep their dtype
+    min_bytes : int
+        size from which arrays are compressed with compression 'auto'
+    outputs : dict
+        output name to dictionary of any of compression, level, shuffle,
+        chunks and dtype which override the defaults for that output
+    """
+
+    def __init__(self, compression='auto', level=None, shuffle=None, chunks=None,
+                 dtype=None, min_bytes=2 ** 16, outputs=None):
+        self.compression = compression
+        self.level = level
+        self.shuffle = shuffle
+        self.chunks = chunks
+        self.dtype = dtype
+        self.min_bytes = min_bytes
+        self.outputs = dict(outputs or {})
+        for name, options in self.outputs.items():
+            unknown = set(options) - set(_OPTIONS)
+            assert not unknown, 'Unknown storage options {} for {}'.format(
+                sorted(unknown), name)
+
+    @classmethod
+    def create(cls, storage):
+        """policy from a StoragePolicy, a compression filter name or None"""
+        if isinstance(storage, cls):
+            return storage
+        return cls(compression=storage)
+
+    def _option(self, name, option):
+        return self.outputs.get(name, {}).get(option, getattr(self, option))
+
+    def convert(self, name, data):
+        """data of output name converted to its stored dtype"""
+        dtype = self._option(name, 'dtype')
+        data = np.asarray(data)
+        if dtype is None or data.dtype == dtype:
+            return data
+        return data.astype(dtype)
+
+    def dataset_kwargs(self, name, data, nbytes=None):
+        """keyword arguments of create_dataset for output name
+
+        Parameters
+        ----------
+        name : str
+            name of the output
+        data : array
+            converted output, a single row for stacked datasets
+        nbytes : int
+            size of the whole dataset, defaults to the size of data
+
+        Returns
+        -------
+        kwargs : dict
+            compression, compression_opts, shuffle and chunks options
+        """
+        kwargs = {}
+        if data.shape == ():
+            # scalars can not be chunked or filtered
+            return kwargs
+        if nbytes is None:
+            nbytes = data.nbytes
+        compression = self._option(name, 'compression')
+        if compression == 'auto':
+            compression = 'gzip' if nbytes >= self.min_bytes else None
+            level = self._option(name, 'level')
+            if compression is not None:
+                kwargs['compression_opts'] = 1 if level is None else level
+        elif compression is not None and self._option(name, 'level') is not None:
+            kwargs['compression_opts'] = self._option(name, 'level')
+        chunks = self._option(name, 'chunks')
+        if compression is not None:
+            kwargs['compression'] = compression
+            shuffle = self._option(name, 'shuffle')
+            kwargs['shuffle'] = True if shuffle is None else shuffle
+        elif self._option(name, 'shuffle'):
+            kwargs['shuffle'] = True
+        if chunks is not None:
+            kwargs['chunks'] = tuple(chunks)
+        return kwargs
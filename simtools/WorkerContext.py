@@ -0,0 +1,96 @@
+"""This module exposes WorkerContext which prepares expensive inputs once per worker process.
+
+Setup functions (e.g. loading lookup tables or compiling kernels) are called
+the first time a worker process evaluates the calculation, and their results
+are kept in that process for every later evaluation, also in later runs of
+the same calculation on a persistent pool. Broadcast arrays are copied once
+to memory-mapped files in shared memory, so tasks only carry their paths and
+every worker maps them read-only instead of unpickling a copy per task. A
+worker releases the arrays of a run once it maps those of a later run of
+the same calculation, and the calling process releases both when the
+context is closed.
+"""
+import collections
+import uuid
+import numpy as np
+from .SharedMemory import shared_prefix, share_array, cleanup
+
+# prepared inputs of the most recent contexts in this process
+_STATES = collections.OrderedDict()
+MAX_STATES = 16
+
+
+def _cached(key, create):
+    """value of key in this process, created by create if missing"""
+    if key in _STATES:
+        _STATES.move_to_end(key)
+        return _STATES[key]
+    value = _STATES[key] = create()
+    while len(_STATES) > MAX_STATES:
+        _STATES.popitem(last=False)
+    return value
+
+
+class WorkerContext(object):
+    """call a function with keyword arguments prepared once per worker process
+
+    Parameters
+    ----------
+    func : function
+        function to call
+    setup : dict
+        argument name to function called without arguments once per worker
+        process, its return value is passed as that argument
+    broadcast : dict
+        argument name to constant value, arrays are shared read-only through
+        memory-mapped files and other values are pickled with each task
+    key : str
+        identifies the setup results kept by workers, contexts with the same
+        key reuse them, None for a new key
+    """
+
+    def __init__(self, func, setup=None, broadcast=None, key=None):
+        self._func = func
+        self._setup = dict(setup or {})
+        self._key = uuid.uuid4().hex if key is None else key
+        self._broadcast_key = uuid.uuid4().hex
+        self._prefix = shared_prefix()
+        self._constants = {}
+        self._paths = {}
+        for name, value in (broadcast or {}).items():
+            if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+                self._paths[name] = share_array(value, self._prefix)
+            else:
+                self._constants[name] = value
+
+    def _setup_values(self):
+        return {name: setup() for name, setup in self._setup.items()}
+
+    def _broadcast_values(self):
+        values = {name: np.load(path, mmap_mode='r')
+                  for name, path in self._paths.items()}
+        values.update(self._constants)
+        return values
+
+    def kwargs(self):
+        """prepared keyword arguments in this process"""
+        key = ('broadcast', self._key, self._broadcast_key)
+        if key not in _STATES:
+            # arrays of earlier runs, whose files were removed when they
+            # closed, stay mapped until released here
+            for stale in [k for k in _STATES if k[:2] == key[:2]]:
+                del _STATES[stale]
+        kwargs = dict(_cached(key, self._broadcast_values))
+        kwargs.update(_cached(('setup', self._key), self._setup_values))
+        return kwargs
+
+    def __call__(self, **kwargs):
+        kwargs.update(self.kwargs())
+        return self._func(**kwargs)
+
+    def close(self):
+        """remove the broadcast files and release the prepared arguments of
+        this process, workers keep theirs until a later run"""
+        cleanup(self._prefix)
+        _STATES.pop(('broadcast', self._key, self._broadcast_key), None)
+        _STATES.pop(('setup', self._key), None)
@@ -0,0 +1,138 @@
+"""This module exposes AsyncWriter which writes results on a background thread.
+
+Results are put on a bounded queue by the process which owns the results file
+and written by a single thread in batches, so computing the next results
+overlaps with writing the previous ones. Putting a result blocks while the
+queue is full so a slow file applies backpressure instead of holding every
+result in memory.
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class AsyncWriter(object):
+    """write results of calculation layouts on a background thread
+
+    Parameters
+    ----------
+    max_pending : int
+        maximum number of results queued and not yet written
+    batch_size : int
+        maximum number of results written per batch
+    flush_every : int
+        flush the file after this many batches, None to flush only on close
+    """
+
+    def __init__(self, max_pending=256, batch_size=64, flush_every=None):
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self._thread = None
+
+    def start(self, file_):
+        """start the writer thread for an open file
+
+        Parameters
+        ----------
+        file_ : h5py.File
+            results file the layouts belong to
+        """
+        assert self._thread is None, 'AsyncWriter is already started'
+        self._file = file_
+        self._queue = queue.Queue(self.max_pending)
+        self._error = None
+        self.n_batches = 0
+        self.wait_time = 0.
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, layout, number, params, result, stats=None):
+        """queue a result for writing, blocks while the queue is full
+
+        Parameters
+        ----------
+        layout : GroupLayout
+            layout of the calculation the result belongs to
+        number : int
+            group number of the parameter set
+        params : dict
+            parameters of the evaluation
+        result : dict
+            result of the evaluation
+        stats : StageStats
+            statistics credited with the bytes and time of the write
+        """
+        if self._error is not None:
+            raise self._error
+        start = time.perf_counter()
+        self._queue.put((layout, number, params, result, stats))
+        self.wait_time += time.perf_counter() - start
+
+    def close(self):
+        """write every queued result and stop the thread
+
+        Raises
+        ------
+        Exception
+            the first error raised while writing
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _next_batch(self):
+        """block for the next result and take up to batch_size queued ones"""
+        batch = [self._queue.get()]
+        while batch[-1] is not _STOP and len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if self._error is None and batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # keep draining so put does not block forever
+                    self._error = e
+            if stop:
+                break
+        if self._error is None:
+            self._file.flush()
+
+    def _write(self, batch):
+        # a batch may hold results of several layouts, each is written at once
+        groups = {}
+        for layout, number, params, result, stats in batch:
+            groups.setdefault(id(layout), (layout, stats, []))[2].append(
+                (number, params, result))
+        for layout, stats, items in groups.values():
+            start = time.perf_counter()
+            nbytes = layout.write_batch(items)
+            if stats is not None:
+                stats.bytes_written += nbytes
+                stats.write_time += time.perf_counter() - start
+        self.n_batches += 1
+        if self.flush_every and self.n_batches % self.flush_every == 0:
+            self._file.flush()
@@ -5,6 +5,7 @@ import h5py
 import pandas as pd
 from simtools.Calculation import Calculation
 from simtools.ParameterGroup import ParameterGroup, Parameter
+from simtools.ParameterIndex import ParameterIndex
 import numpy as np
 
 
@@ -21,6 +22,10 @@ def _f1(calc, calc2):
     return {'mean': np.mean(calc + calc2), 'std': np.std(calc + calc2)}
 
 
+def _f_vec(a, b, c):
+    return {'sum': a + b * c, 'outer': np.outer(a, np.arange(3))}
+
+
 filename = 'test.h5'
 
 
@@ -84,17 +89,132 @@ class test_Calculation(unittest.TestCase):
             group = groups['0']
             res = group['0']
             attrs_dict = {k: v for k, v in res.attrs.items()}
-            size_group = {k: v for k, v in group.items()}
+            size_group = {k: v for k, v in group.items() if k != '_params_'}
+            index = ParameterIndex.read(group)
             _res = {k: np.array(v) for k, v in res.items()}
 
         self.assertEqual(len(groups), 1)
         self.assertEqual(len(size_group), 1)
         self.assertEqual(attrs_dict, pars)
+        self.assertEqual(index.lookup(pars), 0)
         calculated = _f(**pars)
 
         self.assertEqual(_res['calc'], calculated['calc'])
         self.assertTrue(np.array_equal(_res['calc2'], calculated['calc2']))
 
+    def _check_stream(self, parallel):
+        with h5py.File(filename, 'w') as file_:
+            pass
+        calc = Calculation(_f, filename, 0)
+        calc.add_params(self.plist)
+        df = calc.run('zip', parallel=parallel, n_jobs=2, stream=True,
+                      flush_every=3)
+        params = self.plist.zip()
+        self.assertEqual(len(df), len(params))
+        with h5py.File(filename, 'r') as file_:
+            for i, p in enumerate(params):
+                res = file_['0/{}'.format(i)]
+                self.assertEqual(dict(res.attrs.items()), p)
+                self.assertEqual(np.array(res['calc']), _f(**p)['calc'])
+
+    def test_stream(self):
+        self._check_stream(False)
+
+    def test_stream_parallel(self):
+        self._check_stream(True)
+
+    def test_resume(self):
+        with h5py.File(filename, 'w') as file_:
+            pass
+        calc = Calculation(_f, filename, 0)
+        calc.add_params(self.plist)
+        calc.run('zip')
+        params = self.plist.zip()
+        # simulate an interrupted calculation
+        with h5py.File(filename, 'a') as file_:
+            del file_['0/_params_']
+            del file_['0/3']
+            for k in list(file_['0/5'].attrs.keys()):
+                del file_['0/5'].attrs[k]
+        calls = []
+
+        def _counted(a, b, c):
+            calls.append((a, b, c))
+            return _f(a, b, c)
+        calc = Calculation(_counted, filename, 0)
+        calc.add_params(self.plist)
+        df = calc.run('zip', resume=True)
+        self.assertEqual(len(df), len(params))
+        self.assertEqual(len(calls), 2)
+        with h5py.File(filename, 'r') as file_:
+            index = ParameterIndex.read(file_['0'])
+            for i, p in enumerate(params):
+                self.assertEqual(index.lookup(p), i)
+                self.assertEqual(dict(file_['0/{}'.format(i)].attrs.items()), p)
+
+    def test_columnar(self):
+        with h5py.File(filename, 'w') as file_:
+            pass
+        calc = Calculation(_f, filename, 0, layout='columnar',
+                           compression='gzip')
+        calc.add_params(self.plist)
+        calc.run('zip')
+        params = self.plist.zip()
+        with h5py.File(filename, 'r') as file_:
+            group = file_['0']
+            self.assertEqual(sorted(group.keys()),
+                             ['_complete_', '_params_', 'calc', 'calc2'])
+            self.assertEqual(group['calc2'].shape, (len(params), 299))
+            self.assertEqual(group['calc2'].compression, 'gzip')
+            for i, p in enumerate(params):
+                self.assertTrue(np.array_equal(group['calc2'][i],
+                                               _f(**p)['calc2']))
+
+    def test_columnar_resume(self):
+        with h5py.File(filename, 'w') as file_:
+            pass
+        calc = Calculation(_f, filename, 0, layout='columnar')
+        calc.add_params(self.plist)
+        calc.run('zip')
+        with h5py.File(filename, 'a') as file_:
+            file_['0/_complete_'][2] = False
+        calls = []
+
+        def _counted(a, b, c):
+            calls.append((a, b, c))
+            return _f(a, b, c)
+        calc = Calculation(_counted, filename, 0, layout='columnar')
+        calc.add_params(self.plist)
+        calc.run('zip', resume=True)
+        self.assertEqual(len(calls), 1)
+        with h5py.File(filename, 'r') as file_:
+            self.assertTrue(file_['0/_complete_'][()].all())
+
+    def test_vectorized(self):
+        params = self.plist.outer_product()
+        for batch_size, parallel in [(None, False), (7, False), (7, True)]:
+            with h5py.File(filename, 'w') as file_:
+                pass
+            calc = Calculation(_f_vec, filename, 0, vectorized=True,
+                               batch_size=batch_size)
+            calc.add_params(self.plist)
+            df = calc.run('outer', parallel=parallel, n_jobs=2)
+            self.assertEqual(len(df), len(params))
+            with h5py.File(filename, 'r') as file_:
+                for i, p in enumerate(params):
+                    res = file_['0/{}'.format(i)]
+                    self.assertEqual(np.array(res['sum']),
+                                     p['a'] + p['b'] * p['c'])
+                    self.assertTrue(np.array_equal(
+                        np.array(res['outer']), p['a'] * np.arange(3)))
+
+    def test_vectorized_wrong_shape(self):
+        calc = Calculation(lambda a, b, c: {'x': 1.}, filename, 0,
+                           vectorized=True)
+        calc.add_params(self.plist)
+        with self.assertRaises(ValueError):
+            calc.run('outer')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import time
+import tracemalloc
+import numpy as np
+from simtools.Estimate import StageEstimate, Estimate, Interval
+from simtools.Simulation import Simulation
+from simtools.Calculation import Calculation
+from simtools.Sampling import AdaptiveSampler
+from simtools.Storage import open_file
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+filename = 'test_estimate.h5'
+
+
+def _f(a, b):
+    time.sleep(.001 * b)
+    return {'x': np.full(100, a), 's': a * b}
+
+
+def _g(x):
+    return {'y': x.sum()}
+
+
+def _h(a):
+    return {'x': a * 2.}
+
+
+def _wave(a):
+    return {'y': np.sin(np.arange(20000) * a)}
+
+
+class test_Estimate(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 1, 'linspace', (0, 1, 50)),
+            Parameter('b', 1, 'list', ([1, 2, 4],))
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_stage(self):
+        durations = [.01, .02, .03, .04]
+        stage = StageEstimate(0, 100, durations, [8] * 4, [16] * 4,
+                              [.001] * 4, 64)
+        c = stage.compute_time
+        self.assertAlmostEqual(c.estimate, 2.5)
+        self.assertTrue(c.low < c.estimate < c.high)
+        self.assertEqual(stage.stored_bytes, Interval(1600., 1600., 1600.))
+        self.assertAlmostEqual(stage.runtime(2).estimate, 1.25 + .1)
+        # a sample of every parameter set has no uncertainty
+        stage = StageEstimate(0, 4, durations, [8] * 4, [8] * 4, [0.] * 4, 64)
+        self.assertEqual(stage.compute_time.low, stage.compute_time.high)
+        estimate = Estimate([stage, stage], {0: 1}, memory_budget=10)
+        self.assertAlmostEqual(estimate.runtime().estimate, .2)
+        # results held before writing, capped hand off and a peak per worker
+        self.assertEqual(estimate.peak_memory(2).estimate, 32 + 10 + 128)
+        self.assertEqual(estimate.peak_memory(2, stream=True).estimate, 138)
+
+    def test_simulation(self):
+        sim = Simulation(filename, [_f, _g], self.params)
+        estimate = sim.estimate('outer', sample_size=10)
+        with open_file(filename, 'r') as file_:
+            self.assertEqual(len(file_.keys()), 0)
+        first, second = estimate.stages
+        self.assertEqual((first.n_points, first.n_sampled), (150, 10))
+        self.assertEqual(second.n_points, 150)
+        self.assertGreater(first.output_bytes.estimate, 150 * 800)
+        self.assertGreater(first.peak_bytes, 0)
+        start = time.time()
+        sim.run('outer')
+        elapsed = time.time() - start
+        runtime = estimate.runtime()
+        self.assertLess(runtime.low, elapsed * 2)
+        self.assertGreater(runtime.high, elapsed / 2)
+        self.assertAlmostEqual(estimate.stored_bytes.estimate,
+                               os.path.getsize(filename), delta=.5 *
+                               os.path.getsize(filename))
+        self.assertIn('Total', str(estimate))
+
+    def test_context(self):
+        def h(a, b, scale):
+            return {'x': a * scale}
+        calc = Calculation(h, filename, 0, broadcast={'scale': np.ones(10)})
+        sim = Simulation(filename, [calc], self.params)
+        estimate = sim.estimate('outer', sample_size=4)
+        self.assertEqual(estimate.stages[0].n_sampled, 4)
+        sampler = AdaptiveSampler(n_initial=8, rounds=3, n_refine=4, seed=0)
+        estimate = sim.estimate(sampler, sample_size=4)
+        self.assertEqual(estimate.stages[0].n_points, 16)
+
+    def test_columnar(self):
+        # the bytes of the layout are not extrapolated from the sample
+        params = ParameterGroup([Parameter('a', 1, 'linspace', (0, 1, 2000))])
+        calc = Calculation(_h, filename, 0, layout='columnar')
+        sim = Simulation(filename, [calc], params)
+        estimate = sim.estimate('outer', sample_size=16)
+        sim.run('outer')
+        size = os.path.getsize(filename)
+        self.assertLess(estimate.stored_bytes.high, 2 * size)
+        self.assertGreater(estimate.stored_bytes.low, size / 2)
+
+    def test_compression(self):
+        # compressing the chunks when the file is closed is part of writing
+        params = ParameterGroup([Parameter('a', 1, 'linspace', (0, 1, 200))])
+        calc = Calculation(_wave, filename, 0, layout='columnar',
+                           compression='gzip')
+        sim = Simulation(filename, [calc], params)
+        estimate = sim.estimate('outer', sample_size=16)
+        start = time.time()
+        sim.run('outer')
+        elapsed = time.time() - start
+        self.assertGreater(estimate.runtime().high, elapsed / 2)
+        self.assertAlmostEqual(estimate.stored_bytes.estimate,
+                               os.path.getsize(filename), delta=.3 *
+                               os.path.getsize(filename))
+
+    def test_tracing(self):
+        # tracing of the caller is kept, also before Python 3.9 which has
+        # no tracemalloc.reset_peak
+        sim = Simulation(filename, [_f, _g], self.params)
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak is not None:
+            del tracemalloc.reset_peak
+        tracemalloc.start(3)
+        try:
+            estimate = sim.estimate('outer', sample_size=4)
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertEqual(tracemalloc.get_traceback_limit(), 3)
+        finally:
+            tracemalloc.stop()
+            if reset_peak is not None:
+                tracemalloc.reset_peak = reset_peak
+        self.assertGreater(estimate.stages[0].peak_bytes, 0)
+
+    def test_sampler(self):
+        sim = Simulation(filename, [_f, _g], self.params)
+        sampler = AdaptiveSampler(n_initial=8, rounds=3, n_refine=4, seed=0)
+        sim.estimate(sampler, sample_size=4)
+        self.assertEqual(len(sampler.points), 0)
+        sim.run(sampler)
+        self.assertEqual(len(sampler.points), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
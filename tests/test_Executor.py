@@ -0,0 +1,173 @@
+import unittest
+import os
+import shutil
+import time
+import numpy as np
+from simtools.Executor import (SerialExecutor, JoblibExecutor,
+                               FileQueueExecutor, _claim, _write_atomic)
+from simtools.Simulation import Simulation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+directory = 'test_queue'
+filename = 'test_executor.h5'
+
+
+def _f(a, b):
+    return {'x': a * b, 'y': np.arange(3) + a}
+
+
+def _g(x, y):
+    return {'z': x + y.sum()}
+
+
+def _cheap(a, b):
+    return {'x': a * b}
+
+
+def _slow(a, b):
+    time.sleep(.002)
+    return {'x': a * b}
+
+
+def _busy(a, b):
+    time.sleep(.3)
+    return {'x': a * b}
+
+
+def _long(a, b):
+    time.sleep(1.)
+    return {'x': a * b}
+
+
+def _exit(a, b):
+    os._exit(1)
+
+
+def _pid(a, b):
+    return {'pid': os.getpid()}
+
+
+def _fail(a, b):
+    raise ValueError('bad parameters')
+
+
+class test_Executor(unittest.TestCase):
+
+    def setUp(self):
+        self.kwargs = [{'a': a, 'b': b} for a in range(5) for b in range(4)]
+
+    def tearDown(self):
+        shutil.rmtree(directory, ignore_errors=True)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def _check(self, executor):
+        results = list(executor.map(_f, self.kwargs))
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in self.kwargs])
+
+    def test_serial(self):
+        self._check(SerialExecutor())
+
+    def test_joblib(self):
+        self._check(JoblibExecutor(2))
+        self._check(JoblibExecutor(2, chunk_size=3))
+        self._check(JoblibExecutor(2, serial_cost=None))
+
+    def test_pool(self):
+        executor = JoblibExecutor(2, chunk_size=1)
+        with executor:
+            self.assertTrue(executor.started)
+            # the workers are running once start returns
+            self.assertEqual(len(executor._pool._processes), 2)
+            pids = set()
+            for _ in range(2):
+                results = list(executor.map(_pid, self.kwargs))
+                pids.update(r['pid'] for r in results)
+            self.assertNotIn(os.getpid(), pids)
+            self.assertLessEqual(len(pids), 2)
+        self.assertFalse(executor.started)
+
+    def test_chunk_size(self):
+        executor = JoblibExecutor(2)
+        results = list(executor.map(_cheap, self.kwargs))
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in self.kwargs])
+        # cheap evaluations stay in this process
+        self.assertIsNone(executor.tuned_chunk_size)
+        executor = JoblibExecutor(2, chunk_time=.01)
+        results = list(executor.map(_slow, self.kwargs))
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in self.kwargs])
+        self.assertGreaterEqual(executor.tuned_chunk_size, 1)
+        self.assertLessEqual(executor.tuned_chunk_size, 5)
+
+    def test_file_queue(self):
+        self._check(FileQueueExecutor(directory, chunk_size=3,
+                                      n_local_workers=2, max_pending=2))
+        self.assertEqual(os.listdir(os.path.join(directory, 'tasks')), [])
+        self.assertEqual(os.listdir(os.path.join(directory, 'results')), [])
+
+    def test_file_queue_error(self):
+        executor = FileQueueExecutor(directory, n_local_workers=1)
+        with self.assertRaises(RuntimeError):
+            list(executor.map(_fail, self.kwargs))
+
+    def test_requeue(self):
+        executor = FileQueueExecutor(directory, timeout=1.)
+        _write_atomic(os.path.join(directory, 'tasks', 'run_000.pkl'),
+                      (_f, self.kwargs))
+        name, claimed = _claim(directory)
+        self.assertEqual(os.listdir(os.path.join(directory, 'tasks')), [])
+        # a worker which stopped sending heartbeats
+        old = time.time() - 10
+        os.utime(claimed, (old, old))
+        executor._requeue_stale()
+        self.assertEqual(os.listdir(os.path.join(directory, 'tasks')),
+                         ['run_000.pkl'])
+
+    def test_long_evaluations(self):
+        # evaluations take most of the timeout, tasks queued early must not
+        # be requeued while they are evaluated
+        executor = FileQueueExecutor(directory, chunk_size=1, n_local_workers=1,
+                                     timeout=.5)
+        kwargs = self.kwargs[:6]
+        start = time.time()
+        results = list(executor.map(_busy, kwargs))
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in kwargs])
+        self.assertLess(time.time() - start, 6 * .3 + 2.)
+        self.assertEqual(os.listdir(os.path.join(directory, 'claimed')), [])
+
+    def test_longer_than_timeout(self):
+        # the heartbeat is sent while an evaluation runs
+        executor = FileQueueExecutor(directory, chunk_size=1, n_local_workers=2,
+                                     timeout=.5)
+        kwargs = self.kwargs[:2]
+        start = time.time()
+        results = list(executor.map(_long, kwargs))
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in kwargs])
+        self.assertLess(time.time() - start, 10.)
+        self.assertEqual(os.listdir(os.path.join(directory, 'claimed')), [])
+
+    def test_workers_exited(self):
+        executor = FileQueueExecutor(directory, n_local_workers=1, timeout=.5)
+        with self.assertRaises(RuntimeError):
+            list(executor.map(_exit, self.kwargs))
+
+    def test_simulation(self):
+        params = ParameterGroup([
+            Parameter('a', 2, 'list', ([1, 2, 3],)),
+            Parameter('b', 3, 'arange', (2, 6, 1))
+        ])
+        executor = FileQueueExecutor(directory, chunk_size=5, n_local_workers=2)
+        sim = Simulation(filename, [_f, _g], params)
+        sim.run('outer', executor=executor)
+        df = sim._retrieve_result_dataframe(1)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['z'], a * b + 3 * a + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
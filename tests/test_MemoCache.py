@@ -0,0 +1,139 @@
+import unittest
+import functools
+import os
+import shutil
+import h5py
+import numpy as np
+from simtools.MemoCache import MemoCache, function_hash
+from simtools.Calculation import Calculation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+directory = 'test_cache'
+filename = 'test_cache.h5'
+calls = []
+
+
+def _f(a, b):
+    calls.append((a, b))
+    return {'x': a + b, 'y': np.arange(3) * a}
+
+
+def _g(a, b):
+    return {'x': a - b}
+
+
+def _h(a, b, c=1):
+    return {'x': a + b + c}
+
+
+def _adder(k):
+    def add(a, b):
+        return {'x': a + b + k}
+    return add
+
+
+class test_MemoCache(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+        self.params = ParameterGroup([
+            Parameter('a', 1, 'linspace', (0, 1, 5)),
+            Parameter('b', 2, 'list', ([1, 2],))
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(directory, ignore_errors=True)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_get_put(self):
+        cache = MemoCache(directory)
+        self.assertEqual(cache.get(_g, {'a': 1, 'b': 2}), (False, None))
+        cache.put(_g, {'a': 1, 'b': 2}, {'x': -1})
+        self.assertEqual(cache.get(_g, {'b': 2, 'a': np.int64(1)}),
+                         (True, {'x': -1}))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_function_hash(self):
+        self.assertNotEqual(function_hash(_f), function_hash(_g))
+        self.assertEqual(function_hash(_f), function_hash(_f))
+
+    def test_bound_values(self):
+        cache = MemoCache(directory)
+        kwargs = [{'a': 1, 'b': 2}]
+        for func, x in ((_adder(1), 4), (_adder(2), 5),
+                        (functools.partial(_h, c=3), 6),
+                        (functools.partial(_h, c=4), 7)):
+            for _ in range(2):
+                compute = functools.partial(lambda f, kw: [f(**i) for i in kw],
+                                            func)
+                self.assertEqual(list(cache.map(func, kwargs, compute))[0]['x'], x)
+        self.assertEqual(cache.stats()['hits'], 4)
+        self.assertNotEqual(function_hash(_h), function_hash(
+            functools.partial(_h, c=1)))
+
+        def h2(a, b, c=2):
+            return {'x': a + b + c}
+
+        def h3(a, b, c=3):
+            return {'x': a + b + c}
+        self.assertNotEqual(function_hash(h2), function_hash(h3))
+
+        def recursive(n):
+            return 0 if n == 0 else recursive(n - 1)
+        self.assertEqual(function_hash(recursive), function_hash(recursive))
+
+    def test_lambdas(self):
+        cache = MemoCache(directory)
+        first = lambda a, b: {'x': a}
+        second = lambda a, b: {'x': b}
+        kwargs = {'a': 1, 'b': 2}
+        cache.put(first, kwargs, first(**kwargs))
+        cache.put(second, kwargs, second(**kwargs))
+        # a second cache sees both, neither removed the other
+        cache = MemoCache(directory)
+        self.assertEqual(cache.get(first, kwargs), (True, {'x': 1}))
+        self.assertEqual(cache.get(second, kwargs), (True, {'x': 2}))
+        cache.put(first, kwargs, first(**kwargs))
+
+    def test_lazy(self):
+        cache = MemoCache(directory)
+        cache.put(_g, {'a': 0, 'b': 0}, {'x': 0})
+        read = []
+
+        def kwargs_list():
+            for i in range(100):
+                read.append(i)
+                yield {'a': i, 'b': 0}
+        results = cache.map(_g, kwargs_list(), lambda kw: (_g(**i) for i in kw))
+        self.assertEqual(next(results), {'x': 0})
+        self.assertEqual(next(results), {'x': 1})
+        self.assertLessEqual(len(read), 3)
+        self.assertEqual([r['x'] for r in results], list(range(2, 100)))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 99)
+
+    def test_calculation(self):
+        cache = MemoCache(directory)
+        for _ in range(2):
+            with h5py.File(filename, 'w') as file_:
+                pass
+            calc = Calculation(_f, filename, 0, cache=cache)
+            calc.add_params(self.params)
+            calc.run('outer')
+        self.assertEqual(len(calls), 10)
+        self.assertEqual(cache.stats()['hits'], 10)
+        with h5py.File(filename, 'r') as file_:
+            self.assertEqual(np.array(file_['0/9/x']), 3)
+
+    def test_eviction(self):
+        cache = MemoCache(directory, max_bytes=1)
+        results = list(cache.map(_g, [{'a': i, 'b': 0} for i in range(4)],
+                                 lambda kw: [_g(**i) for i in kw]))
+        self.assertEqual([r['x'] for r in results], [0, 1, 2, 3])
+        self.assertEqual(cache.size(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -63,6 +63,60 @@ class testParameterGroup(unittest.TestCase):
         single = [dict(a=2,b=30,c=2)]
         self.assertEqual(single, params.single())
 
-        
+
+class testExpansion(unittest.TestCase):
+    @classmethod
+    def setup_class(self):
+        self.params = ParameterGroup([
+            Parameter('a',2,'linspace',(1,6,10)),
+            Parameter('b',30),
+            Parameter('c',2,'arange',(1,10,1)),
+            Parameter('d','x','list',(['x','y','z'],))
+        ])
+
+    def test_outer(self):
+        exp = self.params.expand('outer')
+        full = self.params.outer_product()
+        self.assertEqual(len(exp), 270)
+        self.assertEqual(exp[37], full[37])
+        self.assertEqual(exp[-1], full[-1])
+        self.assertEqual(list(exp[10:20]), full[10:20])
+        self.assertEqual(exp[10:20][3], full[13])
+
+    def test_iter(self):
+        from itertools import product
+        exp = self.params.expand('outer')
+        names = ['a', 'b', 'c', 'd']
+        full = [dict(zip(names, tup)) for tup in product(*exp._axes)]
+        for start, stop in [(0, 270), (8, 9), (26, 83), (269, 270), (5, 5)]:
+            self.assertEqual(list(exp[start:stop]), full[start:stop])
+
+    def test_zip(self):
+        exp = self.params.expand('zip')
+        self.assertEqual(len(exp), 3)
+        self.assertEqual(list(exp), self.params.zip())
+        self.assertEqual(exp.column('b').tolist(), [30, 30, 30])
+
+    def test_chunks(self):
+        exp = self.params.expand('outer')
+        chunks = list(exp.chunks(100))
+        self.assertEqual([len(i) for i in chunks], [100, 100, 70])
+        self.assertEqual([p for c in chunks for p in c], list(exp))
+
+    def test_columns(self):
+        exp = self.params.expand('outer')[5:50]
+        columns = exp.columns()
+        for i, p in enumerate(exp):
+            for k, v in p.items():
+                self.assertEqual(columns[k][i], v)
+
+    def test_arrays(self):
+        exp = self.params.expand('outer')
+        arrays = exp.arrays()
+        self.assertEqual(arrays['a'].shape, (10, 1, 9, 3))
+        self.assertEqual(arrays['c'][4, 0, 2, 1], 3)
+        self.assertEqual(arrays['a'].strides[1:], (0, 0, 0))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
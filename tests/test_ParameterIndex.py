@@ -0,0 +1,54 @@
+import unittest
+import os
+import h5py
+import numpy as np
+from simtools.ParameterIndex import ParameterIndex
+
+filename = 'test_index.h5'
+
+
+class test_ParameterIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.params = [{'a': a, 'b': b, 'name': n}
+                       for a in np.linspace(0, 1, 4)
+                       for b in range(3)
+                       for n in ['x', 'y']]
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_lookup(self):
+        index = ParameterIndex.from_params(self.params)
+        self.assertEqual(len(index), len(self.params))
+        for i, p in enumerate(self.params):
+            self.assertEqual(index.lookup(p), i)
+
+    def test_missing(self):
+        index = ParameterIndex.from_params(self.params)
+        with self.assertRaises(KeyError):
+            index.lookup({'a': 5., 'b': 0, 'name': 'x'})
+
+    def test_read_write(self):
+        with h5py.File(filename, 'w') as file_:
+            group = file_.create_group('0')
+            ParameterIndex.from_params(self.params).write(group, self.params)
+            index = ParameterIndex.read(group)
+        for i, p in enumerate(self.params):
+            self.assertEqual(index.lookup(p), i)
+
+    def test_read_without_index(self):
+        with h5py.File(filename, 'w') as file_:
+            group = file_.create_group('0')
+            for i, p in enumerate(self.params[:5]):
+                sub = group.create_group(str(i))
+                for k, v in p.items():
+                    sub.attrs[k] = v
+            index = ParameterIndex.read(group)
+        for i, p in enumerate(self.params[:5]):
+            self.assertEqual(index.lookup(p), i)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import io
+import json
+import os
+import shutil
+import time
+from simtools.Progress import Progress
+from simtools.Simulation import Simulation
+from simtools.Calculation import Calculation
+from simtools.Executor import JoblibExecutor
+from simtools.MemoCache import MemoCache
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+filename = 'test_progress.h5'
+status_file = 'test_progress.json'
+directory = 'test_progress_cache'
+
+
+def _f(a):
+    time.sleep(.002)
+    return {'x': a}
+
+
+def _g(x):
+    return {'y': x + 1}
+
+
+class test_Progress(unittest.TestCase):
+
+    def setUp(self):
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (0, 1, 40))
+        ])
+
+    def tearDown(self):
+        for path in (filename, status_file):
+            if os.path.isfile(path):
+                os.remove(path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def _final(self):
+        with open(status_file) as file_:
+            return json.load(file_)
+
+    def test_simulation(self):
+        for overlap in (False, True):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            statuses = []
+            stream = io.StringIO()
+            progress = Progress(callbacks=[statuses.append], bar=True,
+                                status_file=status_file, interval=.01,
+                                stream=stream)
+            sim = Simulation(filename, [_f, _g], self.params)
+            sim.run('outer', hooks=[progress], overlap=overlap)
+            running = [s['stages'][0] for s in statuses
+                       if s['stages'][0]['state'] == 'running'
+                       and 0 < s['stages'][0]['n_done'] < 40]
+            self.assertGreater(len(running), 2)
+            for stage in running:
+                self.assertEqual(stage['n_total'], 40)
+                self.assertGreater(stage['points_per_s'], 0)
+                self.assertIsNotNone(stage['eta'])
+            final = self._final()
+            self.assertEqual(final['state'], 'done')
+            self.assertEqual([s['n_done'] for s in final['stages']], [40, 40])
+            self.assertIn('40/40 100%', stream.getvalue())
+            # the stats are released at the end of the run
+            self.assertIsNone(sim._calculations[0].stats.observer)
+
+    def test_calculation(self):
+        statuses = []
+        progress = Progress(callbacks=[statuses.append], interval=60.)
+        calc = Calculation(_f, filename, 0, overwrite_file=True)
+        calc.add_params(self.params)
+        calc.run('outer', executor=JoblibExecutor(2), hooks=[progress])
+        # only the start and end of the stage and the end of the run are
+        # reported
+        self.assertEqual(len(statuses), 3)
+        self.assertEqual(statuses[-1]['stages'][0]['n_done'], 40)
+        self.assertEqual(statuses[-1]['stages'][0]['n_workers'], 2)
+        self.assertEqual(statuses[-1]['state'], 'done')
+        # points stored before a resumed run are done
+        calc.run('outer', resume=True, hooks=[progress])
+        stage = statuses[-1]['stages'][-1]
+        self.assertEqual((stage['n_total'], stage['n_done'], stage['n_skipped']),
+                         (40, 40, 40))
+        self.assertEqual(stage['eta'], 0.)
+        self.assertEqual(statuses[-1]['state'], 'done')
+
+    def test_cache(self):
+        cache = MemoCache(directory)
+        for _ in range(2):
+            progress = Progress(status_file=status_file, interval=60.)
+            calc = Calculation(_f, filename, 0, overwrite_file=True,
+                               cache=cache)
+            calc.add_params(self.params)
+            calc.run('outer', hooks=[progress])
+            final = self._final()
+            self.assertEqual(final['state'], 'done')
+            self.assertEqual(final['stages'][0]['n_done'], 40)
+        # every result of the second run was found in the cache
+        self.assertEqual(final['stages'][0]['n_cached'], 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
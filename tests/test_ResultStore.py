@@ -0,0 +1,89 @@
+import unittest
+import os
+import numpy as np
+from simtools.ResultStore import ResultStore
+from simtools.Simulation import Simulation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a, b, name):
+    return {'x': a * b, 'y': np.arange(3) * a}
+
+
+def _g(x, y):
+    return {'z': x + y.sum()}
+
+
+filename = 'test_resultstore.h5'
+
+
+class test_ResultStore(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (0, 1, 11)),
+            Parameter('b', 3, 'arange', (0, 5, 1)),
+            Parameter('name', 'p', 'list', (['p', 'q'],))
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def _run(self, layout):
+        sim = Simulation(filename, [_f, _g], self.params, layout=layout)
+        sim.run('outer')
+        return sim.results()
+
+    def test_select(self):
+        for layout in ('group', 'columnar'):
+            self.setUp()
+            with self._run(layout) as store:
+                self.assertEqual(store.levels(), ['0', '1'])
+                self.assertEqual(store.outputs(0), ['x', 'y'])
+                self.assertEqual(len(store.select(0)), 110)
+                self.assertEqual(len(store.select(0, b=2)), 22)
+                self.assertEqual(len(store.select(0, a=(0.2, 0.4), b=[1, 3])), 12)
+                self.assertEqual(len(store.select(0, b=(None, 1), name='q')), 22)
+                self.assertEqual(len(store.select(1, a=lambda a: a > 0.55)), 50)
+                with self.assertRaises(KeyError):
+                    store.select(0, c=1)
+
+    def test_output(self):
+        for layout in ('group', 'columnar'):
+            self.setUp()
+            with self._run(layout) as store:
+                numbers = store.select(0, {'name': 'p'}, b=4)
+                y = store.output(0, 'y', {'name': 'p'}, b=4)
+                self.assertEqual(len(y), 11)
+                a = store.parameters(0)['a'][numbers]
+                self.assertTrue(np.allclose(y[3], np.arange(3) * a[3]))
+                self.assertTrue(np.allclose(np.asarray(y), np.outer(a, np.arange(3))))
+                self.assertEqual(y[2:5].shape, (3, 3))
+
+    def test_dataframe(self):
+        for layout in ('group', 'columnar'):
+            self.setUp()
+            with self._run(layout) as store:
+                df = store.dataframe(1, b=(1, 2))
+                self.assertEqual(len(df), 44)
+                for (a, b, name), row in df.iterrows():
+                    self.assertAlmostEqual(row['z'], a * b + 3 * a)
+                df = store.dataframe(0, columns=['y'], name='q')
+                self.assertEqual(list(df.columns), ['y', '_group_number_'])
+                self.assertEqual(len(df), 55)
+                self.assertEqual(df['y'].iloc[0].shape, (3,))
+
+    def test_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            ResultStore('missing_' + filename).open()
+        self.assertFalse(os.path.exists('missing_' + filename))
+        with self._run('group') as store:
+            # reading leaves the file unchanged
+            self.assertEqual(store._file.mode, 'r')
+
+
+if __name__ == '__main__':
+    unittest.main()
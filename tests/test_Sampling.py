@@ -0,0 +1,90 @@
+import unittest
+import os
+import h5py
+import numpy as np
+from simtools.Sampling import AdaptiveSampler, latin_hypercube, halton
+from simtools.Calculation import Calculation
+from simtools.Simulation import Simulation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+filename = 'test_sampling.h5'
+
+
+def _step(a, b, c):
+    return {'y': float(a > 0.5) + 0. * b, 'c': c}
+
+
+def _double(y, c):
+    return {'z': 2 * y}
+
+
+class test_designs(unittest.TestCase):
+
+    def test_latin_hypercube(self):
+        rng = np.random.RandomState(0)
+        x = latin_hypercube(10, 3, rng)
+        for j in range(3):
+            # one point in every interval of every dimension
+            self.assertEqual(sorted((x[:, j] * 10).astype(int)), list(range(10)))
+
+    def test_halton(self):
+        x = halton(4, 2, None)
+        self.assertTrue(np.allclose(x[:, 0], [.5, .25, .75, .125]))
+        self.assertTrue(np.allclose(x[:, 1], [1 / 3, 2 / 3, 1 / 9, 4 / 9]))
+
+
+class test_AdaptiveSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.params = ParameterGroup([
+            Parameter('a', 0, 'linspace', (0, 1, 10)),
+            Parameter('b', 0, 'arange', (0, 10, 1)),
+            Parameter('c', 7)
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_start(self):
+        sampler = AdaptiveSampler(n_initial=20, seed=1)
+        points = sampler.start(self.params)
+        self.assertEqual(len(points), 20)
+        for p in points:
+            self.assertEqual(list(p.keys()), ['a', 'b', 'c'])
+            self.assertTrue(0 <= p['a'] <= 1)
+            self.assertIsInstance(p['b'], int)
+            self.assertEqual(p['c'], 7)
+
+    def test_refine_near_step(self):
+        sampler = AdaptiveSampler(n_initial=30, n_refine=20, seed=2)
+        sampler.start(self.params)
+        for _ in range(3):
+            values = [_step(**p)['y'] for p in sampler.points]
+            new = sampler.refine(values)
+        near = np.mean([abs(p['a'] - .5) < .2 for p in new])
+        self.assertGreater(near, .5)
+
+    def test_calculation(self):
+        sampler = AdaptiveSampler(n_initial=10, rounds=3, n_refine=5, seed=3,
+                                  target='y')
+        calc = Calculation(_step, filename, 0, overwrite_file=True)
+        calc.add_params(self.params)
+        df = calc.run(sampler)
+        self.assertEqual(len(df), len(sampler.points))
+        self.assertGreater(len(sampler.points), 10)
+        with h5py.File(filename, 'r') as file_:
+            for i, p in enumerate(sampler.points):
+                self.assertEqual(np.array(file_['0/{}/y'.format(i)]),
+                                 _step(**p)['y'])
+
+    def test_simulation(self):
+        sampler = AdaptiveSampler(n_initial=8, rounds=2, seed=4, target='y')
+        sim = Simulation(filename, [_step, _double], self.params)
+        sim.run(sampler)
+        df = sim._retrieve_result_dataframe(1)
+        self.assertEqual(len(df), len(sampler.points))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+import os
+import time
+import numpy as np
+from joblib.executor import get_memmapping_executor
+from simtools.Scheduler import Scheduler, CostModel, TimedOut
+from simtools.Executor import JoblibExecutor
+from simtools.Calculation import Calculation
+from simtools.Simulation import Simulation
+from simtools.ResultStore import ResultStore
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+flag = 'test_scheduler.flag'
+copied = 'test_scheduler.copied'
+filename = 'test_scheduler.h5'
+
+
+def _sleep(a, b):
+    start = time.time()
+    time.sleep(.002 * b)
+    return {'x': a * b, 'start': start}
+
+
+def _straggler(a):
+    # the first evaluation of a == 0 hangs until a second attempt finished
+    # and then gives a wrong result, which is only used without speculation
+    if a == 0 and not os.path.exists(flag):
+        open(flag, 'w').close()
+        deadline = time.time() + 10.
+        while not os.path.exists(copied) and time.time() < deadline:
+            time.sleep(.01)
+        time.sleep(.2)
+        return {'x': -1}
+    if a == 0:
+        open(copied, 'w').close()
+    return {'x': a}
+
+
+def _g(x):
+    return {'y': x + 1}
+
+
+class _Recorded(object):
+    """sequence of keyword arguments recording which were read"""
+
+    def __init__(self, kwargs):
+        self._kwargs = kwargs
+        self.read = set()
+
+    def __len__(self):
+        return len(self._kwargs)
+
+    def __getitem__(self, i):
+        self.read.add(i)
+        return self._kwargs[i]
+
+
+class test_CostModel(unittest.TestCase):
+
+    def test_learn(self):
+        kwargs = [{'a': 1., 'b': b, 'name': 'p'} for b in (1, 2, 4, 8)]
+        model = CostModel().fit(kwargs, [.001 * k['b'] for k in kwargs])
+        self.assertLess(model.predict({'a': 1., 'b': 3, 'name': 'q'}),
+                        model.predict({'a': 1., 'b': 6, 'name': 'q'}))
+        self.assertAlmostEqual(model.predict(kwargs[2]), .004, delta=.001)
+
+    def test_estimator(self):
+        model = CostModel(lambda a, b: b ** 2)
+        model.fit([{'a': 0, 'b': 1}, {'a': 0, 'b': 2}], [.1, .4])
+        self.assertAlmostEqual(model.predict({'a': 0, 'b': 3}), .9)
+
+
+class test_Scheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.kwargs = [{'a': a, 'b': b} for a in range(3)
+                       for b in (1, 2, 5, 10, 20, 40)]
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'list', ([1, 2, 3],)),
+            Parameter('b', 1, 'list', ([1, 2, 40],))
+        ])
+
+    def tearDown(self):
+        for path in (flag, copied, filename):
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _check(self, results):
+        self.assertEqual([r['x'] for r in results],
+                         [k['a'] * k['b'] for k in self.kwargs])
+
+    def test_order(self):
+        pool = get_memmapping_executor(2)
+        for cost in ('learn', lambda a, b: b):
+            scheduler = Scheduler(pool, 2, cost=cost, sample_size=4)
+            results = list(scheduler.map(_sleep, self.kwargs))
+            self._check(results)
+            starts = {(k['a'], k['b']): r['start']
+                      for k, r in zip(self.kwargs, results)}
+            # expensive points start before cheap ones, apart from the sample
+            self.assertLess(min(starts[(a, 40)] for a in range(3)),
+                            max(starts[(a, 1)] for a in range(3)))
+
+    def test_timeout(self):
+        executor = JoblibExecutor(2, timeout=.03)
+        results = list(executor.map(_sleep, self.kwargs))
+        for k, r in zip(self.kwargs, results):
+            if k['b'] >= 20:
+                self.assertIsInstance(r, TimedOut)
+                self.assertEqual(r.kwargs, k)
+            elif k['b'] <= 5:
+                self.assertEqual(r['x'], k['a'] * k['b'])
+
+    def test_speculate(self):
+        kwargs = [{'a': a} for a in range(8)]
+        with JoblibExecutor(2) as executor:
+            scheduler = Scheduler(executor._pool, 2, speculate=2., sample_size=2)
+            results = list(scheduler.map(_straggler, kwargs))
+        # the copy of the straggler finished first
+        self.assertEqual([r['x'] for r in results], list(range(8)))
+        self.assertGreaterEqual(scheduler.n_speculated, 1)
+
+    def test_unordered(self):
+        kwargs = _Recorded(self.kwargs)
+        with JoblibExecutor(2) as executor:
+            scheduler = Scheduler(executor._pool, 2, cost=lambda a, b: b,
+                                  sample_size=2)
+            pairs = scheduler.map_unordered(_sleep, kwargs)
+            first = next(pairs)
+            # arguments are read as their chunks are submitted
+            self.assertLess(len(kwargs.read), len(self.kwargs))
+            pairs = [first] + list(pairs)
+        positions = [i for i, _ in pairs]
+        self.assertEqual(sorted(positions), list(range(len(self.kwargs))))
+        # expensive points complete first, they are not held back
+        self.assertNotEqual(positions, sorted(positions))
+        for i, r in pairs:
+            self.assertEqual(r['x'], self.kwargs[i]['a'] * self.kwargs[i]['b'])
+        self.assertEqual(list(scheduler.map(_sleep, [])), [])
+
+    def test_resume_complete(self):
+        calc = Calculation(_sleep, filename, 0)
+        calc.add_params(self.params)
+        calc.run('outer')
+        for executor in (JoblibExecutor(2, cost='learn'),
+                         JoblibExecutor(2, timeout=1.)):
+            calc.run('outer', resume=True, executor=executor)
+            self.assertEqual(calc.stats.n_evaluations, 0)
+            self.assertEqual(calc.stats.n_skipped, 9)
+
+    def test_calculation(self):
+        calc = Calculation(_sleep, filename, 0, layout='columnar')
+        calc.add_params(self.params)
+        calc.run('outer', executor=JoblibExecutor(2, timeout=.05))
+        self.assertEqual(calc.stats.n_timeouts, 3)
+        self.assertEqual(sorted(p['b'] for p in calc.timed_out), [40] * 3)
+        with ResultStore(filename) as store:
+            self.assertEqual(len(store.select(0)), 6)
+        calc.run('outer', executor=JoblibExecutor(2, timeout=1.), resume=True)
+        self.assertEqual(calc.stats.n_evaluations, 3)
+        with ResultStore(filename) as store:
+            self.assertEqual(len(store.select(0)), 9)
+
+    def test_simulation(self):
+        for overlap in (False, True):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            sim = Simulation(filename, [_sleep, _g], self.params)
+            sim.run('outer', overlap=overlap,
+                    executor=JoblibExecutor(2, timeout=.05))
+            downstream = sim._calculations[1]
+            self.assertEqual(len(downstream.timed_out), 3)
+            with ResultStore(filename) as store:
+                self.assertEqual(len(store.select(1)), 6)
+                self.assertTrue(np.all(np.asarray(store.output(1, 'y')) ==
+                                       np.asarray(store.output(0, 'x')) + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import glob
+import os
+import h5py
+import numpy as np
+from simtools.SharedMemory import SharedOutputs, SharedArray, receive
+from joblib.executor import get_memmapping_executor
+from simtools.Executor import JoblibExecutor
+from simtools.Calculation import Calculation
+from simtools.Layout import open_layout
+from simtools.ParameterIndex import ParameterIndex
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a):
+    return {'x': a, 'y': np.full(1000, a), 'z': np.arange(3) * a}
+
+
+def _f_vec(a):
+    a = np.asarray(a)
+    return {'x': a, 'y': a[:, None] * np.ones(1000)}
+
+
+filename = 'test_sharedmemory.h5'
+
+
+class test_SharedMemory(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (0, 1, 7))
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_shared_outputs(self):
+        shared = SharedOutputs(_f, 1000)
+        # outputs computed in this process are not copied
+        self.assertIsInstance(shared(a=2.)['y'], np.ndarray)
+        self.assertEqual(glob.glob(shared.prefix + '*'), [])
+        pool = get_memmapping_executor(1)
+        result = pool.submit(shared, a=2.).result()
+        self.assertIsInstance(result['y'], SharedArray)
+        self.assertNotIsInstance(result['z'], SharedArray)
+        self.assertEqual(len(glob.glob(shared.prefix + '*')), 1)
+        result = receive(result)
+        self.assertTrue(np.array_equal(result['y'], np.full(1000, 2.)))
+        self.assertEqual(result['x'], 2.)
+        # the file is removed once the output is mapped
+        self.assertEqual(glob.glob(shared.prefix + '*'), [])
+        pool.submit(shared, a=1.).result()
+        shared.cleanup()
+        self.assertEqual(glob.glob(shared.prefix + '*'), [])
+
+    def test_calculation(self):
+        for func, vectorized in ((_f, False), (_f_vec, True)):
+            for layout in ('group', 'columnar'):
+                calc = Calculation(func, filename, 0, overwrite_file=True,
+                                   layout=layout, vectorized=vectorized)
+                calc.add_params(self.params)
+                calc.run('outer', executor=JoblibExecutor(2, shared_memory=1000))
+                self.assertEqual(calc.stats.n_evaluations, 7)
+                with h5py.File(filename, 'r') as file_:
+                    group = file_['0']
+                    layout_ = open_layout(group)
+                    index = ParameterIndex.read(group)
+                    for p in self.params.outer_product():
+                        result = layout_.read_result(index.lookup(p))
+                        self.assertTrue(np.array_equal(result['y'],
+                                                       np.full(1000, p['a'])))
+
+
+if __name__ == '__main__':
+    unittest.main()
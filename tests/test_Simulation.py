@@ -1,5 +1,35 @@
 import unittest 
+import os
+import numpy as np
 from simtools.Simulation import Simulation, parse_time_diff
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a, b):
+    return {'x': a * b, 'y': np.arange(b)}
+
+
+def _g(x, y):
+    return {'z': x + int(np.sum(y))}
+
+
+def _h(a, b):
+    return {'x': a * b, 'y': np.arange(3) * b}
+
+
+def _k(a, b):
+    return {'w': a + b}
+
+
+def _m(x, w):
+    return {'v': x * w}
+
+
+def _half(a, b):
+    return {'x': a / 2., 'y': np.arange(b)}
+
+
+filename = 'test_simulation.h5'
 
 class test_parse_time_diff(unittest.TestCase):
 
@@ -16,7 +46,146 @@ class test_parse_time_diff(unittest.TestCase):
         self.assertEqual(parse_time_diff(60), "1.00 min")
 
 class test_Simulation(unittest.TestCase):
-    pass
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'list', ([1, 2, 3],)),
+            Parameter('b', 3, 'arange', (2, 6, 1))
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_pipeline(self):
+        sim = Simulation(filename, [_f, _g], self.params)
+        sim.run('outer')
+        df = sim._retrieve_result_dataframe(1)
+        self.assertEqual(len(df), 12)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['z'], a * b + sum(range(b)))
+
+    def test_parallel_pipeline(self):
+        sim = Simulation(filename, [_f, _g], self.params)
+        sim.run('outer', parallel=True, n_jobs=2)
+        df = sim._retrieve_result_dataframe(1)
+        self.assertEqual(len(df), 12)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['z'], a * b + sum(range(b)))
+
+    def test_columnar_pipeline(self):
+        sim = Simulation(filename, [_h, _g], self.params, layout='columnar')
+        sim.run('outer')
+        df = sim._retrieve_result_dataframe(1)
+        self.assertEqual(len(df), 12)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['z'], a * b + 3 * b)
+        params, result = sim._retrive_results(0, 5)
+        self.assertEqual(result['x'], params['a'] * params['b'])
+        self.assertTrue(np.array_equal(result['y'], np.arange(3) * params['b']))
+
+    def test_stats(self):
+        import h5py
+        from simtools.Stats import read_stats
+        events = []
+        sim = Simulation(filename, [_f, _g], self.params)
+        sim.run('outer', hooks=[lambda event, stats: events.append(event)])
+        self.assertEqual(events, ['stage_start', 'stage_end',
+                                  'stage_start', 'stage_end', 'run_end'])
+        stats = sim.stats.to_dict()
+        self.assertEqual([s['n_evaluations'] for s in stats['stages']],
+                         [12, 12])
+        self.assertGreater(stats['stages'][0]['bytes_written'], 0)
+        self.assertGreater(stats['stages'][1]['lookup_time'], 0)
+        with h5py.File(filename, 'r') as file_:
+            self.assertEqual(read_stats(file_)['stages'][1]['n_evaluations'], 12)
+            self.assertEqual(read_stats(file_['1'])['n_evaluations'], 12)
+
+    def test_retrive_results(self):
+        sim = Simulation(filename, [_f, _g], self.params)
+        sim.run('outer')
+        params, result = sim._retrive_results(0, 5)
+        self.assertEqual(result['x'], params['a'] * params['b'])
+        self.assertTrue(np.array_equal(result['y'], np.arange(params['b'])))
+
+    def test_dependencies(self):
+        # _f and _k both start from the parameters, _m joins their results
+        sim = Simulation(filename, [_f, _k, _m], self.params,
+                         dependencies={2: [0, 1]})
+        sim.run('outer')
+        df = sim._retrieve_result_dataframe(2)
+        self.assertEqual(len(df), 12)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['v'], a * b * (a + b))
+
+    def test_invalid_dependencies(self):
+        with self.assertRaises(ValueError):
+            Simulation(filename, [_f, _g], self.params, dependencies={1: [1]})
+
+    def test_overlap(self):
+        sim = Simulation(filename, [_f, _k, _m], self.params,
+                         dependencies={2: [0, 1]})
+        sim.run('outer', overlap=True, parallel=True, n_jobs=2)
+        df = sim._retrieve_result_dataframe(2)
+        self.assertEqual(len(df), 12)
+        for (a, b), row in df.iterrows():
+            self.assertEqual(row['v'], a * b * (a + b))
+        params, result = sim._retrive_results(0, 5)
+        self.assertTrue(np.array_equal(result['y'], np.arange(params['b'])))
+        self.assertEqual([s.n_evaluations for s in sim.stats.stages],
+                         [12, 12, 12])
+
+    def test_handoff(self):
+        sim = Simulation(filename, [_half, _g], self.params)
+        sim.run('outer')
+        # every upstream result came from memory
+        self.assertIsNone(sim._upstream[0]._file)
+        self.assertEqual(sim._handoff.nbytes, 0)
+        df = sim._retrieve_result_dataframe(1)
+        for (a, b), row in df.iterrows():
+            self.assertAlmostEqual(row['z'], a / 2. + sum(range(b)))
+
+    def test_handoff_spill(self):
+        sim = Simulation(filename, [_half, _g], self.params, memory_budget=100)
+        sim.run('outer')
+        self.assertGreater(sim._handoff.n_spilled, 0)
+        df = sim._retrieve_result_dataframe(1)
+        for (a, b), row in df.iterrows():
+            self.assertAlmostEqual(row['z'], a / 2. + sum(range(b)))
+
+    def test_no_handoff(self):
+        sim = Simulation(filename, [_half, _g], self.params, memory_budget=None)
+        sim.run('outer')
+        df = sim._retrieve_result_dataframe(1)
+        for (a, b), row in df.iterrows():
+            self.assertAlmostEqual(row['z'], a / 2. + sum(range(b)))
+
+    def test_async_writer(self):
+        from simtools.Writer import AsyncWriter
+        for overlap in (False, True):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            sim = Simulation(filename, [_h, _g], self.params, layout='columnar')
+            sim.run('outer', overlap=overlap, writer=AsyncWriter(batch_size=5))
+            df = sim._retrieve_result_dataframe(1)
+            self.assertEqual(len(df), 12)
+            for (a, b), row in df.iterrows():
+                self.assertEqual(row['z'], a * b + 3 * b)
+
+    def test_pool(self):
+        with Simulation(filename, [_f, _g], self.params) as sim:
+            sim.run('outer', parallel=True, n_jobs=2)
+            pool = sim._pool
+            self.assertTrue(pool.started)
+            sim.run('outer', parallel=True, n_jobs=2, resume=True)
+            self.assertIs(sim._pool, pool)
+            df = sim._retrieve_result_dataframe(1)
+            for (a, b), row in df.iterrows():
+                self.assertEqual(row['z'], a * b + sum(range(b)))
+        self.assertFalse(pool.started)
+        self.assertIsNone(sim._pool)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import os
+import shutil
+import h5py
+import numpy as np
+from simtools.Executor import FileQueueExecutor, JoblibExecutor
+from simtools.Storage import open_file, NpyFile, supports_concurrent_writes
+from simtools.Calculation import Calculation
+from simtools.Simulation import Simulation
+from simtools.Layout import open_layout
+from simtools.ParameterIndex import ParameterIndex
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a, b, name):
+    return {'x': a * b, 'y': np.arange(3) * a}
+
+
+def _g(x, y):
+    return {'z': x + y.sum()}
+
+
+dirname = 'test_storage.npyd'
+queue = 'test_storage_queue'
+filename = 'test_storage.h5'
+
+
+class test_NpyFile(unittest.TestCase):
+
+    def setUp(self):
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (0, 1, 5)),
+            Parameter('b', 3, 'arange', (0, 4, 1)),
+            Parameter('name', 'p', 'list', (['p', 'q'],))
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(dirname, ignore_errors=True)
+        shutil.rmtree(queue, ignore_errors=True)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_open_file(self):
+        with open_file(dirname, 'w') as file_:
+            self.assertIsInstance(file_, NpyFile)
+            self.assertTrue(supports_concurrent_writes(file_))
+        with open_file(filename, 'w') as file_:
+            self.assertIsInstance(file_, h5py.File)
+            self.assertFalse(supports_concurrent_writes(file_))
+
+    def test_groups_and_datasets(self):
+        with open_file(dirname, 'w') as file_:
+            group = file_.create_group('0')
+            group.attrs.update({'a': np.float64(1.5), 'name': 'p'})
+            group.create_dataset('y', data=np.arange(3))
+            group.create_dataset('s', data=np.array(['ab', 'c'], dtype=object))
+            flags = file_.create_dataset('flags', data=np.zeros(2, dtype=bool),
+                                         maxshape=(None,))
+            flags[1] = True
+            flags.resize(4, axis=0)
+            with self.assertRaises(ValueError):
+                file_.create_group('0')
+        with open_file(dirname, 'r') as file_:
+            self.assertEqual(list(file_), ['0', 'flags'])
+            self.assertEqual(dict(file_['0'].attrs.items()),
+                             {'a': 1.5, 'name': 'p'})
+            self.assertTrue(np.array_equal(file_['0/y'][()], np.arange(3)))
+            self.assertEqual(list(file_['0']['s'][()]), ['ab', 'c'])
+            self.assertEqual(list(file_['flags'][()]), [False, True, False, False])
+            del file_['0']
+            self.assertNotIn('0', file_)
+
+    def test_require_dataset(self):
+        with open_file(dirname, 'w') as file_:
+            first = file_.require_dataset('x', shape=(4, 2), dtype='f4')
+            first[1] = [1, 2]
+            second = file_.require_dataset('x', shape=(4, 2), dtype='f4')
+            self.assertTrue(np.array_equal(second[1], [1, 2]))
+            with self.assertRaises(TypeError):
+                file_.require_dataset('x', shape=(5, 2), dtype='f4')
+
+    def test_direct_write(self):
+        for layout in ('group', 'columnar'):
+            calc = Calculation(_f, dirname, 0, overwrite_file=True,
+                               layout=layout)
+            calc.add_params(self.params)
+            calc.run('outer', parallel=True, n_jobs=2, direct_write=True)
+            self.assertEqual(calc.stats.n_evaluations, 40)
+            self.assertGreater(calc.stats.bytes_written, 0)
+            with open_file(dirname, 'r') as file_:
+                group = file_['0']
+                layout_ = open_layout(group)
+                index = ParameterIndex.read(group)
+                self.assertEqual(len(layout_.numbers()), 40)
+                for i, p in enumerate(self.params.outer_product()):
+                    self.assertEqual(index.lookup(p), i)
+                    self.assertTrue(np.allclose(layout_.read_result(i)['y'],
+                                                np.arange(3) * p['a']))
+
+    def test_direct_write_file_queue(self):
+        calc = Calculation(_f, dirname, 0, overwrite_file=True)
+        calc.add_params(self.params)
+        calc.run('outer', direct_write=True,
+                 executor=FileQueueExecutor(queue, n_local_workers=2))
+        self.assertEqual(calc.stats.n_evaluations, 40)
+        with open_file(dirname, 'r') as file_:
+            self.assertEqual(len(open_layout(file_['0']).numbers()), 40)
+        # evaluation timeouts could interrupt a write
+        with self.assertRaises(AssertionError):
+            calc.run('outer', direct_write=True,
+                     executor=JoblibExecutor(2, timeout=1.))
+
+    def test_direct_write_needs_backend(self):
+        calc = Calculation(_f, filename, 0)
+        calc.add_params(self.params)
+        with self.assertRaises(AssertionError):
+            calc.run('outer', direct_write=True)
+
+    def test_pipeline(self):
+        for direct_write in (False, True):
+            shutil.rmtree(dirname, ignore_errors=True)
+            sim = Simulation(dirname, [_f, _g], self.params, layout='columnar')
+            sim.run('outer', parallel=True, n_jobs=2, direct_write=direct_write)
+            df = sim._retrieve_result_dataframe(1)
+            self.assertEqual(len(df), 40)
+            for (a, b, name), row in df.iterrows():
+                self.assertAlmostEqual(row['z'], a * b + 3 * a)
+            with sim.results() as store:
+                self.assertEqual(len(store.select(0, b=2)), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
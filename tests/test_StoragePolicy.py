@@ -0,0 +1,83 @@
+import unittest
+import os
+import h5py
+import numpy as np
+from simtools.StoragePolicy import StoragePolicy
+from simtools.Calculation import Calculation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a):
+    return {'small': np.arange(4) * a, 'large': np.linspace(0, a, 20000),
+            'scalar': a}
+
+
+filename = 'test_storagepolicy.h5'
+
+
+class test_StoragePolicy(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'list', ([1., 2., 3.],))
+        ])
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def test_auto(self):
+        policy = StoragePolicy()
+        self.assertEqual(policy.dataset_kwargs('x', np.zeros(10)), {})
+        self.assertEqual(policy.dataset_kwargs('x', np.zeros(())), {})
+        self.assertEqual(policy.dataset_kwargs('x', np.zeros(10000)),
+                         {'compression': 'gzip', 'compression_opts': 1,
+                          'shuffle': True})
+        # a stacked dataset is compressed by its total size
+        self.assertIn('compression', policy.dataset_kwargs('x', np.zeros(10),
+                                                           nbytes=2 ** 20))
+
+    def test_outputs(self):
+        policy = StoragePolicy(compression=None, outputs={
+            'x': {'compression': 'lzf', 'chunks': (100,), 'dtype': 'float32'}})
+        self.assertEqual(policy.dataset_kwargs('y', np.zeros(10000)), {})
+        self.assertEqual(policy.dataset_kwargs('x', np.zeros(10000)),
+                         {'compression': 'lzf', 'shuffle': True,
+                          'chunks': (100,)})
+        self.assertEqual(policy.convert('x', np.zeros(3)).dtype, np.float32)
+        self.assertEqual(policy.convert('y', np.zeros(3)).dtype, np.float64)
+        with self.assertRaises(AssertionError):
+            StoragePolicy(outputs={'x': {'codec': 'gzip'}})
+
+    def test_group_layout(self):
+        calc = Calculation(_f, filename, 0)
+        calc.add_params(self.params)
+        calc.run('outer')
+        with h5py.File(filename, 'r') as file_:
+            group = file_['0/1']
+            self.assertIsNone(group['small'].compression)
+            self.assertEqual(group['large'].compression, 'gzip')
+            self.assertTrue(group['large'].shuffle)
+            self.assertTrue(np.allclose(group['large'][()],
+                                        np.linspace(0, 2., 20000)))
+
+    def test_columnar_layout(self):
+        policy = StoragePolicy(compression='gzip', level=6, outputs={
+            'large': {'dtype': 'float32', 'chunks': (5000,)}})
+        calc = Calculation(_f, filename, 0, layout='columnar',
+                           compression=policy)
+        calc.add_params(self.params)
+        calc.run('outer')
+        with h5py.File(filename, 'r') as file_:
+            large = file_['0/large']
+            self.assertEqual(large.dtype, np.float32)
+            self.assertEqual(large.chunks, (3, 5000))
+            self.assertEqual(large.compression_opts, 6)
+            self.assertEqual(file_['0/small'].compression, 'gzip')
+            self.assertTrue(np.allclose(large[2], np.linspace(0, 3., 20000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+import glob
+import os
+import numpy as np
+from simtools.WorkerContext import WorkerContext, _STATES
+from simtools.SharedMemory import shared_directory
+from simtools.Executor import JoblibExecutor
+from simtools.Calculation import Calculation
+from simtools.Simulation import Simulation
+from simtools.ResultStore import ResultStore
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+calls = []
+
+
+def _table():
+    calls.append(1)
+    return {'pid': os.getpid(), 'scale': 10.}
+
+
+def _f(a, table, grid):
+    return {'x': a * table['scale'] + grid.sum(),
+            'setup_pid': table['pid'], 'pid': os.getpid(),
+            'writeable': grid.flags.writeable}
+
+
+def _f_vec(a, grid):
+    return {'x': np.asarray(a) + grid.sum()}
+
+
+def _g(x, table):
+    return {'z': x + table['scale']}
+
+
+filename = 'test_workercontext.h5'
+
+
+class test_WorkerContext(unittest.TestCase):
+
+    def setUp(self):
+        del calls[:]
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (0, 1, 6))
+        ])
+        self.grid = np.arange(100000.)
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def _files(self, context):
+        return glob.glob(context._prefix + '*')
+
+    def test_context(self):
+        context = WorkerContext(_f, setup={'table': _table},
+                                broadcast={'grid': self.grid}, key='test')
+        self.assertEqual(len(self._files(context)), 1)
+        first = context(a=1.)
+        second = context(a=2.)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(first['x'], 10. + self.grid.sum())
+        self.assertEqual(second['x'], 20. + self.grid.sum())
+        self.assertFalse(first['writeable'])
+        # setup results are reused by contexts with the same key, as by the
+        # workers of a later run, which release the earlier broadcast
+        later = WorkerContext(_f, setup={'table': _table},
+                              broadcast={'grid': np.zeros(3)}, key='test')
+        self.assertEqual(later(a=1.)['x'], 10.)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([k for k in _STATES if k[0] == 'broadcast'
+                          and k[1] == 'test'],
+                         [('broadcast', 'test', later._broadcast_key)])
+        context.close()
+        self.assertEqual(self._files(context), [])
+        later.close()
+        self.assertNotIn(('setup', 'test'), _STATES)
+        self.assertFalse([k for k in _STATES if k[1] == 'test'])
+
+    def test_calculation(self):
+        calc = Calculation(_f, filename, 0, layout='columnar',
+                           setup={'table': _table}, broadcast={'grid': self.grid})
+        calc.add_params(self.params)
+        calc.run('outer')
+        calc.run('outer', resume=True)
+        self.assertEqual(len(calls), 1)
+        calc = Calculation(_f, filename, 0, overwrite_file=True,
+                           layout='columnar', setup={'table': _table},
+                           broadcast={'grid': self.grid})
+        calc.add_params(self.params)
+        pattern = os.path.join(shared_directory(), 'simtools-*')
+        before = set(glob.glob(pattern))
+        calc.run('outer', executor=JoblibExecutor(2, chunk_size=1))
+        with ResultStore(filename) as store:
+            x = np.asarray(store.output(0, 'x'))
+            # setup ran in the worker which evaluated each point
+            self.assertTrue(np.array_equal(store.output(0, 'setup_pid'),
+                                           store.output(0, 'pid')))
+            self.assertNotIn(os.getpid(), list(store.output(0, 'pid')))
+        self.assertTrue(np.allclose(x, np.linspace(0, 1, 6) * 10. +
+                                    self.grid.sum()))
+        self.assertEqual(set(glob.glob(pattern)) - before, set())
+
+    def test_vectorized(self):
+        calc = Calculation(_f_vec, filename, 0, vectorized=True, batch_size=4,
+                           broadcast={'grid': self.grid})
+        calc.add_params(self.params)
+        calc.run('outer')
+        self.assertEqual(calc.stats.n_evaluations, 6)
+
+    def test_simulation(self):
+        for overlap in (False, True):
+            if os.path.isfile(filename):
+                os.remove(filename)
+            first = Calculation(_f, filename, 0, setup={'table': _table},
+                                broadcast={'grid': self.grid})
+            second = Calculation(_g, filename, 1, setup={'table': _table})
+            sim = Simulation(filename, [first, second], self.params)
+            sim.run('outer', overlap=overlap)
+            df = sim._retrieve_result_dataframe(1)
+            for a, row in df.iterrows():
+                self.assertAlmostEqual(row['z'], 10. * a + self.grid.sum() + 10.)
+
+
+if __name__ == '__main__':
+    unittest.main()
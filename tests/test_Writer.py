@@ -0,0 +1,82 @@
+import unittest
+import os
+import h5py
+import numpy as np
+from simtools.Writer import AsyncWriter
+from simtools.Layout import GroupLayout, ColumnarLayout
+from simtools.Stats import StageStats
+from simtools.Calculation import Calculation
+from simtools.ParameterGroup import ParameterGroup, Parameter
+
+
+def _f(a, b):
+    return {'x': a * b, 'y': np.full(4, a)}
+
+
+filename = 'test_writer.h5'
+
+
+class test_AsyncWriter(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+        self.params = [{'a': float(a), 'b': 2} for a in range(50)]
+
+    def tearDown(self):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+    def _write(self, layout_class, results, **kwargs):
+        stats = StageStats(0)
+        with h5py.File(filename, 'a') as file_:
+            layout = layout_class(file_.create_group('0'))
+            layout.start(self.params, set())
+            with AsyncWriter(**kwargs).start(file_) as writer:
+                for i, (p, r) in enumerate(zip(self.params, results)):
+                    writer.put(layout, i, p, r, stats)
+            layout.finish(self.params)
+        return stats
+
+    def test_columnar(self):
+        results = [_f(**p) for p in self.params]
+        stats = self._write(ColumnarLayout, results, max_pending=4, batch_size=8)
+        self.assertEqual(stats.bytes_written, 50 * 5 * 8)
+        with h5py.File(filename, 'r') as file_:
+            layout = ColumnarLayout(file_['0'])
+            self.assertEqual(layout.numbers(), list(range(50)))
+            self.assertTrue(np.array_equal(file_['0/x'][()],
+                                           [r['x'] for r in results]))
+            self.assertTrue(np.array_equal(layout.read_result(7)['y'],
+                                           np.full(4, 7.)))
+
+    def test_group(self):
+        results = [_f(**p) for p in self.params]
+        self._write(GroupLayout, results, max_pending=1, batch_size=3)
+        with h5py.File(filename, 'r') as file_:
+            layout = GroupLayout(file_['0'])
+            self.assertEqual(layout.numbers(), list(range(50)))
+            self.assertEqual(layout.read_params(9), self.params[9])
+
+    def test_error(self):
+        results = [_f(**p) for p in self.params]
+        results[20]['y'] = np.zeros(3)
+        with self.assertRaises(ValueError):
+            self._write(ColumnarLayout, results, max_pending=2, batch_size=4)
+
+    def test_calculation(self):
+        params = ParameterGroup([
+            Parameter('a', 2, 'linspace', (1, 6, 10)),
+            Parameter('b', 3, 'arange', (1, 10, 1))
+        ])
+        calc = Calculation(_f, filename, 0, layout='columnar')
+        calc.add_params(params)
+        calc.run('outer', writer=AsyncWriter(batch_size=16))
+        self.assertEqual(calc.stats.n_evaluations, 90)
+        self.assertGreater(calc.stats.bytes_written, 0)
+        with h5py.File(filename, 'r') as file_:
+            self.assertEqual(len(ColumnarLayout(file_['0']).numbers()), 90)
+
+
+if __name__ == '__main__':
+    unittest.main()